@@ -0,0 +1,294 @@
+"""
+代码生成基准测试套件
+用合成工作区（可调设备类型数、设备数、连线密度、ECC规模和ST代码规模）测量
+convert_to_fbt、prettify、process_fbt、process_sys和增量convert_workspace各阶段的耗时和峰值内存（tracemalloc），
+结果写入JSON文件，并与保存的基线对比，超过阈值时以非零状态退出；
+输入未变时的增量转换耗时须明显低于完整生成（process_fbt + process_sys），否则同样视为回归
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_codegen                    # 运行并与基线对比
+    python -m benchmarks.bench_codegen --scenario small   # 只运行指定场景
+    python -m benchmarks.bench_codegen --save-baseline    # 将本次结果保存为基线
+    python -m benchmarks.bench_codegen --categories 50 --blocks 500 --density 8 --states 30 --code-blocks 20
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.workspace import make_workspace
+from outputs.util.convert import convert_workspace
+from outputs.util.transfer_fbt import build_fbt, convert_to_fbt, prettify, process_fbt
+from outputs.util.transfer_sys import process_sys
+from outputs.util.workspace import Workspace
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+RESULTS_FILE = BENCH_DIR / "results.json"
+
+# 场景：设备类型数、设备数、连线密度（每个设备的连线数）、ECC状态数、每个算法的ST代码规模
+SCENARIOS = {
+    "small": {
+        "categories": 20,
+        "blocks": 200,
+        "density": 5,
+        "states": 5,
+        "code_blocks": 1,
+    },
+    "medium": {
+        "categories": 100,
+        "blocks": 2000,
+        "density": 10,
+        "states": 10,
+        "code_blocks": 5,
+    },
+    "large": {
+        "categories": 200,
+        "blocks": 10000,
+        "density": 10,
+        "states": 20,
+        "code_blocks": 20,
+    },
+}
+
+# 低于该耗时（毫秒）或内存（MB）的差异视为噪声，不判定为回归
+MIN_DELTA_MS = 2.0
+MIN_DELTA_MB = 0.5
+# 增量转换耗时与完整生成耗时之比的上限
+UNCHANGED_RATIO = 0.5
+
+
+def build_workspace(params: dict) -> Workspace:
+    return Workspace.from_dict(
+        make_workspace(
+            categories=params["categories"],
+            blocks=params["blocks"],
+            connections=params["blocks"] * params["density"],
+            states=params["states"],
+            code_blocks=params["code_blocks"],
+        )
+    )
+
+
+def make_stages(workspace: Workspace, folder: str, max_workers: int) -> dict:
+    """各阶段的被测函数，每个函数处理整个工作区"""
+    categories = workspace.block_categories
+    trees = [build_fbt(block) for block in categories]
+    fbt_dir = os.path.join(folder, "fbt")
+    sys_dir = os.path.join(folder, "sys")
+    incremental_dir = os.path.join(folder, "incremental")
+    for path in (fbt_dir, sys_dir, incremental_dir):
+        os.makedirs(path)
+    # 先完整生成一次，之后测量的是输入未变时的增量转换
+    convert_workspace(workspace, incremental_dir, max_workers=max_workers)
+
+    return {
+        "convert_to_fbt": lambda: [convert_to_fbt(block) for block in categories],
+        "prettify": lambda: [prettify(tree) for tree in trees],
+        "process_fbt": lambda: process_fbt(workspace, fbt_dir, max_workers=max_workers),
+        "process_sys": lambda: process_sys(workspace, sys_dir),
+        "convert_unchanged": lambda: convert_workspace(
+            workspace, incremental_dir, max_workers=max_workers
+        ),
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    """返回最短和中位耗时（毫秒），以及单独一次运行的峰值内存（MB）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "peak_mb": round(peak / 1024 / 1024, 3),
+    }
+
+
+def run_scenario(params: dict, repeat: int, max_workers: int) -> dict:
+    workspace = build_workspace(params)
+    with tempfile.TemporaryDirectory() as folder:
+        stages = make_stages(workspace, folder, max_workers)
+        return {name: measure(func, repeat) for name, func in stages.items()}
+
+
+def compare(
+    results: dict, baseline: dict, time_threshold: float, memory_threshold: float
+) -> list:
+    """返回回归列表，每项为(场景, 阶段, 指标, 基线值, 当前值)"""
+    regressions = []
+    for scenario, stages in results["scenarios"].items():
+        base_stages = baseline.get("scenarios", {}).get(scenario)
+        if not base_stages or base_stages["params"] != stages["params"]:
+            continue
+        for stage, current in stages["stages"].items():
+            base = base_stages["stages"].get(stage)
+            if base is None:
+                continue
+            checks = [
+                ("best_ms", time_threshold, MIN_DELTA_MS),
+                ("peak_mb", memory_threshold, MIN_DELTA_MB),
+            ]
+            for metric, threshold, min_delta in checks:
+                old, new = base[metric], current[metric]
+                if new > old * (1 + threshold) and new - old > min_delta:
+                    regressions.append((scenario, stage, metric, old, new))
+    return regressions
+
+
+def unchanged_ratios(results: dict) -> dict:
+    """各场景中输入未变时的增量转换耗时与完整生成耗时之比"""
+    ratios = {}
+    for scenario, data in results["scenarios"].items():
+        stages = data["stages"]
+        full = stages["process_fbt"]["best_ms"] + stages["process_sys"]["best_ms"]
+        ratios[scenario] = stages["convert_unchanged"]["best_ms"] / full
+    return ratios
+
+
+def print_results(results: dict, baseline: dict = None):
+    print(
+        f"{'场景':<10}{'阶段':<20}{'最短(ms)':>12}{'中位(ms)':>12}{'峰值(MB)':>12}{'基线(ms)':>12}{'变化':>10}"
+    )
+    for scenario, data in results["scenarios"].items():
+        base_stages = (baseline or {}).get("scenarios", {}).get(scenario)
+        if base_stages and base_stages["params"] != data["params"]:
+            base_stages = None
+        for stage, m in data["stages"].items():
+            base = (base_stages or {}).get("stages", {}).get(stage)
+            base_ms = f"{base['best_ms']:.2f}" if base else "-"
+            change = (
+                f"{(m['best_ms'] / base['best_ms'] - 1) * 100:+.1f}%"
+                if base and base["best_ms"]
+                else "-"
+            )
+            print(
+                f"{scenario:<10}{stage:<20}{m['best_ms']:>12.2f}{m['median_ms']:>12.2f}"
+                f"{m['peak_mb']:>12.2f}{base_ms:>12}{change:>10}"
+            )
+    for scenario, ratio in unchanged_ratios(results).items():
+        print(f"{scenario}: 增量转换耗时为完整生成的 {ratio:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代码生成基准测试套件")
+    parser.add_argument(
+        "--scenario",
+        choices=list(SCENARIOS),
+        action="append",
+        help="只运行指定场景，可重复指定",
+    )
+    parser.add_argument("--categories", type=int, help="自定义场景：设备类型数")
+    parser.add_argument("--blocks", type=int, help="自定义场景：设备数")
+    parser.add_argument(
+        "--density", type=int, default=10, help="自定义场景：每个设备的连线数"
+    )
+    parser.add_argument("--states", type=int, default=5, help="自定义场景：ECC状态数")
+    parser.add_argument(
+        "--code-blocks", type=int, default=1, help="自定义场景：ST代码规模"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE, help="结果文件")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE, help="基线文件")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="将本次结果保存为基线"
+    )
+    parser.add_argument(
+        "--time-threshold", type=float, default=0.25, help="耗时超过基线的比例阈值"
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=0.10,
+        help="峰值内存超过基线的比例阈值",
+    )
+    args = parser.parse_args()
+
+    if args.categories or args.blocks:
+        scenarios = {
+            "custom": {
+                "categories": args.categories or 20,
+                "blocks": args.blocks or 200,
+                "density": args.density,
+                "states": args.states,
+                "code_blocks": args.code_blocks,
+            }
+        }
+    else:
+        scenarios = {name: SCENARIOS[name] for name in args.scenario or SCENARIOS}
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "max_workers": args.max_workers,
+        "scenarios": {},
+    }
+    for name, params in scenarios.items():
+        print(f"运行场景 {name}: {params}")
+        results["scenarios"][name] = {
+            "params": params,
+            "stages": run_scenario(params, args.repeat, args.max_workers),
+        }
+
+    args.output.write_text(
+        json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    print(f"结果已写入 {args.output}")
+
+    if args.save_baseline:
+        # 只更新本次运行的场景，保留基线中的其他场景
+        baseline = {"scenarios": {}}
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        baseline.update({k: v for k, v in results.items() if k != "scenarios"})
+        baseline["scenarios"].update(results["scenarios"])
+        args.baseline.write_text(
+            json.dumps(baseline, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        print_results(results)
+        print(f"基线已保存到 {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print_results(results)
+        print(f"未找到基线 {args.baseline}，使用 --save-baseline 保存")
+        return
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    print_results(results, baseline)
+    if baseline.get("platform") != results["platform"]:
+        print(f"注意：基线在不同环境中生成（{baseline.get('platform')}），耗时仅供参考")
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    slow = {k: v for k, v in unchanged_ratios(results).items() if v > UNCHANGED_RATIO}
+    if regressions or slow:
+        print("性能回归：")
+        for scenario, stage, metric, old, new in regressions:
+            print(f"  {scenario}/{stage} {metric}: {old} -> {new}")
+        for scenario, ratio in slow.items():
+            print(
+                f"  {scenario}/convert_unchanged: 为完整生成的 {ratio:.1%}，超过 {UNCHANGED_RATIO:.0%}"
+            )
+        sys.exit(1)
+    print("未发现性能回归 ✅")
+
+
+if __name__ == "__main__":
+    main()
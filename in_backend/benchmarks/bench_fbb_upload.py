@@ -0,0 +1,74 @@
+"""
+FBB上传基准测试
+对本地FBB替身服务器（带处理延迟和随机失败）上传合成工作区生成的文件，
+对比逐个上传（与原前端相同）和并发上传的耗时，并校验所有文件都被接收
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_fbb_upload
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.fbb_stub import start_stub
+from benchmarks.workspace import make_workspace
+from outputs.util.archive import render_workspace
+from outputs.util.fbb_upload import FBBUploader
+from outputs.util.workspace import Workspace
+
+
+async def run_upload(base_url: str, files, concurrency: int) -> tuple:
+    """返回(耗时秒, 成功数, 总尝试次数)"""
+    uploader = FBBUploader(
+        base_url, concurrency=concurrency, max_retries=5, base_delay=0.05
+    )
+    started = time.perf_counter()
+    success = attempts = 0
+    try:
+        async for result in uploader.upload(files):
+            success += result["success"]
+            attempts += result["attempts"]
+    finally:
+        await uploader.close()
+    return time.perf_counter() - started, success, attempts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FBB上传基准测试")
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.02, help="替身服务器处理延迟")
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    workspace = Workspace.from_dict(
+        make_workspace(
+            categories=args.categories,
+            blocks=args.categories * 5,
+            connections=args.categories * 20,
+        )
+    )
+    files = [(item["file"], item["content"]) for item in render_workspace(workspace)]
+
+    print(f"{'并发数':<8}{'文件数':>8}{'耗时(s)':>10}{'成功':>8}{'尝试次数':>10}")
+    for concurrency in (1, 4, 8):
+        server = start_stub(delay=args.delay, fail_rate=args.fail_rate)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        elapsed, success, attempts = asyncio.run(
+            run_upload(base_url, files, concurrency)
+        )
+        received = len(server.received)
+        server.shutdown()
+        server.server_close()
+        print(
+            f"{concurrency:<8}{len(files):>8}{elapsed:>10.2f}{success:>8}{attempts:>10}"
+        )
+        if received != len(files) or success != len(files):
+            print(f"有文件未上传成功: 接收 {received} / {len(files)}")
+            sys.exit(1)
+    print("所有文件均已上传 ✅")
+
+
+if __name__ == "__main__":
+    main()
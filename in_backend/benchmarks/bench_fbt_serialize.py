@@ -0,0 +1,134 @@
+"""
+FBT序列化基准测试
+对比旧的ElementTree -> minidom -> toprettyxml三段式序列化与单遍序列化，
+并逐字节校验两者输出一致（含转义、换行、空代码等边界情况），不一致时以非零状态退出
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_fbt_serialize
+"""
+
+import argparse
+import io
+import sys
+import time
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+from outputs.util.transfer_fbt import build_fbt
+from outputs.util.xml_writer import to_pretty_xml, write_pretty_xml
+
+
+def legacy_prettify(elem) -> str:
+    """旧版prettify的实现，作为对照"""
+    rough = ET.tostring(elem, "utf-8")
+    reparsed = minidom.parseString(rough)
+    return reparsed.toprettyxml(indent="  ", encoding="UTF-8").decode("utf-8")
+
+
+def make_fb(states: int, algorithms: int, code_lines: int) -> dict:
+    """生成包含大量状态、转换和算法的设备配置"""
+    code = "\n".join(
+        f'IF 输入{j} AND 计数 < {j} THEN\n    输出{j} := TRUE; (* "注释" & <说明> *)\nEND_IF;'
+        for j in range(code_lines)
+    )
+    return {
+        "name": "大型设备",
+        "description": '带有 & < > " 的描述',
+        "signal_input": [{"name": f"EI{j}", "description": "事件"} for j in range(8)],
+        "signal_output": [{"name": f"EO{j}", "description": "事件"} for j in range(8)],
+        "var_input": [
+            {"name": f"输入{j}", "type": "BOOL", "description": "输入"}
+            for j in range(16)
+        ],
+        "var_output": [
+            {"name": f"输出{j}", "type": "BOOL", "description": "输出"}
+            for j in range(16)
+        ],
+        "InternalVar": [
+            {"name": "计数", "type": "INT", "description": "计数器", "InitalVaule": "0"}
+        ],
+        "ECC": {
+            "ECStates": [
+                {"name": f"状态{j}", "comment": "状态", "x": 50 * j, "y": 50}
+                for j in range(states)
+            ],
+            "ECTransitions": [
+                {
+                    "source": f"状态{j}",
+                    "destination": f"状态{(j + 1) % states}",
+                    "condition": f"EI{j % 8} AND 输入{j % 16} > 0",
+                    "comment": "转换",
+                    "x": 100,
+                    "y": 100,
+                }
+                for j in range(states)
+            ],
+        },
+        "Algorithms": [
+            {"Name": f"算法{j}", "Comment": "算法", "Code": code}
+            for j in range(algorithms)
+        ],
+    }
+
+
+def edge_cases() -> list:
+    """转义和空白相关的边界情况"""
+    fb = make_fb(3, 1, 1)
+    fb["signal_input"].append({"name": "多行", "description": "第一行\n第二行\t\r结尾"})
+    fb["Algorithms"] = [
+        {"Name": "空", "Comment": "", "Code": ""},
+        {"Name": "空白", "Comment": " ", "Code": "   "},
+        {"Name": "回车", "Comment": "c", "Code": "a := 1;\r\nb := 2;\rc := 3;\n"},
+        {"Name": "转义", "Comment": "'单引号'", "Code": "x := a > b & c < d; ]]>"},
+    ]
+    return [fb, make_fb(1, 0, 0)]
+
+
+def timeit(func, repeat: int) -> float:
+    """返回多次运行的最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def check_golden(fbs) -> bool:
+    ok = True
+    for fb in fbs:
+        root = build_fbt(fb)
+        if to_pretty_xml(root) != legacy_prettify(root):
+            print(f"输出不一致: {fb['name']}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FBT序列化基准测试")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sizes = [(10, 4, 5), (100, 20, 10), (300, 100, 10), (500, 200, 20)]
+    fbs = [make_fb(*size) for size in sizes]
+    if not check_golden(edge_cases() + fbs):
+        sys.exit(1)
+    print("输出逐字节一致 ✅")
+
+    print(
+        f"{'状态/算法/代码行':<18}{'大小(KB)':>10}{'旧实现(ms)':>12}{'新实现(ms)':>12}{'加速比':>8}"
+    )
+    for size, fb in zip(sizes, fbs):
+        root = build_fbt(fb)
+        size_kb = len(legacy_prettify(root).encode("utf-8")) / 1024
+        old_ms = timeit(lambda: legacy_prettify(root), args.repeat)
+        new_ms = timeit(lambda: write_pretty_xml(root, io.StringIO()), args.repeat)
+        label = "/".join(str(n) for n in size)
+        print(
+            f"{label:<18}{size_kb:>10.1f}{old_ms:>12.2f}{new_ms:>12.2f}"
+            f"{old_ms / new_ms:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+LLM响应JSON解析基准测试
+对比旧的三段式提取（直接解析/代码块正则/逐字符括号扫描）与增量解析器，
+并测量流式输入时首个设备元素的可用时间
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_json_parse
+"""
+
+import argparse
+import json
+import re
+import time
+
+from inputs.util.json_stream import StreamingJSONParser, parse_json_text
+
+
+def legacy_extract(content: str):
+    """旧版extract_and_parse_json的实现（去掉打印），作为对照"""
+    content = content.strip()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        pass
+
+    json_match = re.search(r"```json\s*\n(.*?)\n```", content, re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group(1).strip())
+        except json.JSONDecodeError:
+            pass
+
+    start_idx = -1
+    for i, char in enumerate(content):
+        if char in ["{", "["]:
+            start_idx = i
+            break
+    if start_idx == -1:
+        raise ValueError("未找到有效的JSON内容")
+
+    bracket_count = 0
+    start_bracket = content[start_idx]
+    end_bracket = "}" if start_bracket == "{" else "]"
+    end_idx = -1
+    for i in range(start_idx, len(content)):
+        char = content[i]
+        if char == start_bracket:
+            bracket_count += 1
+        elif char == end_bracket:
+            bracket_count -= 1
+            if bracket_count == 0:
+                end_idx = i
+                break
+    if end_idx == -1:
+        raise ValueError("JSON格式不完整")
+    return json.loads(content[start_idx : end_idx + 1])
+
+
+def make_device(idx: int, code_lines: int) -> dict:
+    """生成一个与device_detail_template结构一致的设备配置"""
+    code = "\n".join(
+        f'IF 输入{j} AND NOT 故障 THEN\n    输出{j} := TRUE; (* "注释{{}}" *)\nEND_IF;'
+        for j in range(code_lines)
+    )
+    return {
+        "name": f"设备{idx}",
+        "var_input": [
+            {"name": f"输入{j}", "type": "bool", "description": "输入变量[状态]"}
+            for j in range(8)
+        ],
+        "var_output": [
+            {"name": f"输出{j}", "type": "bool", "description": "输出变量{动作}"}
+            for j in range(8)
+        ],
+        "signal_input": [{"name": "INIT", "description": "初始化"}],
+        "signal_output": [{"name": "CNF", "description": "确认"}],
+        "InternalVars": [],
+        "ECC": {
+            "ECStates": [
+                {
+                    "name": f"状态{j}",
+                    "comment": "状态描述",
+                    "x": 50 * j,
+                    "y": 50,
+                    "ecAction": {"algorithm": f"算法{j}", "output": "CNF"},
+                }
+                for j in range(10)
+            ],
+            "ECTransitions": [
+                {
+                    "source": f"状态{j}",
+                    "destination": f"状态{j + 1}",
+                    "condition": "INIT",
+                    "comment": "转换",
+                    "x": 100,
+                    "y": 100,
+                }
+                for j in range(9)
+            ],
+        },
+        "Algorithms": [
+            {"Name": f"算法{j}", "Comment": "算法", "Code": code} for j in range(4)
+        ],
+    }
+
+
+def make_responses(devices: int, code_lines: int) -> dict:
+    """构造三种常见的LLM响应形态"""
+    body = json.dumps(
+        [make_device(i, code_lines) for i in range(devices)],
+        ensure_ascii=False,
+        indent=2,
+    )
+    return {
+        "纯JSON": body,
+        "代码块": f"好的，以下是配置：\n```json\n{body}\n```\n",
+        "说明文字": f"好的，以下是配置：\n{body}\n以上配置仅供参考。",
+    }
+
+
+# 截断或格式错误的响应：旧实现报错，新实现也必须报错，不能返回其中的片段
+BROKEN_RESPONSES = [
+    '[{"name": "a", "x": {"k": 1}, "y": [1,',
+    '{"name": "设备0", "ECC": {"ECStates": [{"name": "s"}]}, "Algorithms": [{"Name"',
+    '好的，以下是配置：\n[{"name": "a", "var_input": [{"name": "x"}] "ECC": {}}]',
+]
+# 说明文字中带有括号：跳过说明文字中的括号，解析后面的JSON，(响应, 期望结果)
+PROSE_RESPONSES = [
+    ('说明[注]如下：\n[{"a": 1}]', [{"a": 1}]),
+    ('{注意} 以下是配置：\n{"a": [1, {"b": 2}]}', {"a": [1, {"b": 2}]}),
+    (
+        '说明[注]：```json\n[{"device":"a"}, {"device":"b"}]\n```',
+        [{"device": "a"}, {"device": "b"}],
+    ),
+    ('下面是配置{注意}：[{"device":"x"}]', [{"device": "x"}]),
+]
+
+
+def stream_parse(content: str, chunk_size: int):
+    """按块输入增量解析器，返回完整的根值"""
+    parser = StreamingJSONParser()
+    for i in range(0, len(content), chunk_size):
+        parser.feed(content[i : i + chunk_size])
+    return parser.close()
+
+
+def check_edge_cases():
+    """校验截断响应报错、说明文字中的括号被跳过，增量解析器与一次解析的结果一致"""
+    for content in BROKEN_RESPONSES:
+        for func in (legacy_extract, parse_json_text, lambda c: stream_parse(c, 7)):
+            try:
+                func(content)
+            except ValueError:
+                continue
+            raise AssertionError(f"{func.__name__} 未对截断的响应报错: {content!r}")
+    for content, expected in PROSE_RESPONSES:
+        assert parse_json_text(content) == expected, content
+        for chunk_size in (1, 5, len(content)):
+            assert stream_parse(content, chunk_size) == expected, (content, chunk_size)
+    print("截断响应均报错，说明文字中的括号被跳过 ✅")
+
+
+def timeit(func, repeat: int) -> float:
+    """返回多次运行的最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def first_item_latency(content: str, chunk_size: int) -> tuple:
+    """按块输入，返回(首个元素出现时已接收的字符比例, 总耗时毫秒)"""
+    parser = StreamingJSONParser()
+    first_at = None
+    start = time.perf_counter()
+    for i in range(0, len(content), chunk_size):
+        items = parser.feed(content[i : i + chunk_size])
+        if items and first_at is None:
+            first_at = min(i + chunk_size, len(content))
+    parser.close()
+    elapsed = (time.perf_counter() - start) * 1000
+    return first_at / len(content), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM响应JSON解析基准测试")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=24)
+    args = parser.parse_args()
+
+    check_edge_cases()
+    print(
+        f"{'响应形态':<8}{'大小(KB)':>10}{'旧实现(ms)':>12}{'新实现(ms)':>12}"
+        f"{'流式总耗时(ms)':>16}{'首元素位置':>12}"
+    )
+    for devices, code_lines in [(1, 5), (6, 10), (12, 20), (40, 20)]:
+        for shape, content in make_responses(devices, code_lines).items():
+            assert parse_json_text(content) == legacy_extract(content)
+            old_ms = timeit(lambda: legacy_extract(content), args.repeat)
+            new_ms = timeit(lambda: parse_json_text(content), args.repeat)
+            ratio, stream_ms = first_item_latency(content, args.chunk_size)
+            size_kb = len(content.encode("utf-8")) / 1024
+            print(
+                f"{shape:<8}{size_kb:>10.1f}{old_ms:>12.2f}{new_ms:>12.2f}"
+                f"{stream_ms:>16.2f}{ratio:>12.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
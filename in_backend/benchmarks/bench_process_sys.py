@@ -0,0 +1,200 @@
+"""
+process_sys扩展性基准测试
+对比旧实现（列表去重、多次遍历连线、逐行写入）与单遍实现，
+逐字节校验两者输出一致，并测量设备数和连线数增长时的耗时（每条连线耗时应基本不变）
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_process_sys
+"""
+
+import argparse
+import filecmp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.workspace import make_workspace
+from outputs.util.transfer_sys import process_sys
+
+
+def legacy_process_sys(data, output_path):
+    """旧版process_sys的实现（data为已解析的字典），作为对照"""
+    id_total = []
+    for i in data["connections"]:
+        if i["start"]["blockId"] not in id_total:
+            id_total.append(i["start"]["blockId"])
+        if i["end"]["blockId"] not in id_total:
+            id_total.append(i["end"]["blockId"])
+
+    id_name = {}
+    id_signal_input = {}
+    id_signal_output = {}
+    id_var_input = {}
+    id_var_output = {}
+    for i in data["blocks"]:
+        if i["id"] not in id_name:
+            id_name[i["id"]] = i["categoryConf"]["name"]
+        if i["id"] not in id_signal_input:
+            id_signal_input[i["id"]] = i["categoryConf"]["signal_input"]
+        if i["id"] not in id_signal_output:
+            id_signal_output[i["id"]] = i["categoryConf"]["signal_output"]
+        if i["id"] not in id_var_input:
+            id_var_input[i["id"]] = i["categoryConf"]["var_input"]
+        if i["id"] not in id_var_output:
+            id_var_output[i["id"]] = i["categoryConf"]["var_output"]
+
+    my_id_name = {}
+    name_count = {}
+    for i in id_name:
+        if id_name[i] not in name_count:
+            name_count[id_name[i]] = 1
+    for i in id_total:
+        my_id_name[i] = id_name[i] + str(name_count[id_name[i]])
+        name_count[id_name[i]] += 1
+
+    # 写入
+    output_path = Path(output_path) / "legacy.sys"
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.truncate(0)
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(
+            '<System ID="693fd363-ca58-481d-bfb5-881390ec4fc0" Name="demo" Namespace="demo" Version="" IDEVersion="v1.2.1" Comment="System including ThreeEventRouter">\n'
+        )
+        f.write('  <Identification Standard="61499-2"/>\n')
+        f.write("\n")
+        # <Mapping From="app.conveyor1" To="Device1.RES3"/>
+        for i in id_total:
+            f.write(f' <Mapping From="app.{my_id_name[i]}" To="Device1.RES3"/>\n')
+        f.write("\n")
+
+        f.write(
+            ' <Application Name="app" Comment="" Key="889a77a0-1c16-4b25-9bf5-da977b4a4a68">\n'
+        )
+        f.write("    <SubAppNetwork>\n")
+
+        for i in range(len(id_total)):
+            # <FB Key="-1" Name="conveyor1" Namespace="demo" Type="straightConveyor" x="50"  y="0"   />
+            f.write(
+                f'      <FB Key="{-i-1}" Name="{my_id_name[id_total[i]]}" Namespace="demo" Type="{id_name[id_total[i]]}" x="{150*i}" y="0" />\n'
+            )
+
+        f.write("      <EventConnections>\n")
+
+        for i in data["connections"]:
+            # <Connection Source="conveyor1.Running" Destination="三线.Start1" Priority="1"/>
+            if i["start"]["type"] == "signal_output":
+                a = my_id_name[i["start"]["blockId"]]
+                b = id_signal_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
+                c = my_id_name[i["end"]["blockId"]]
+                d = id_signal_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
+                f.write(
+                    f'        <Connection Source="{a}.{b}" Destination="{c}.{d}" Priority="1"/>\n'
+                )
+        f.write("      </EventConnections>\n")
+        f.write("      <DataConnections>\n")
+        for i in data["connections"]:
+            if i["start"]["type"] == "var_output":
+                a = my_id_name[i["start"]["blockId"]]
+                b = id_var_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
+                c = my_id_name[i["end"]["blockId"]]
+                d = id_var_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
+                f.write(
+                    f'        <Connection Source="{a}.{b}" Destination="{c}.{d}" Priority="1"/>\n'
+                )
+        f.write("      </DataConnections>\n")
+
+        f.write("      <AdapterConnections/>\n")
+        f.write("    </SubAppNetwork>\n")
+        f.write("  </Application>\n")
+        f.write(
+            '  <Device Key="7f297351-45e1-4fec-91c1-a76c4054bb9e" Name="Device1" Type="FBSRT_X64_LINUX" Src="devices/ipc_linux.png" Location="12 38.5" CPUCores="1" Group="StartDeviceGroup">\n'
+        )
+        f.write('    <Parameter Name="Address"  Value="127.0.0.1"/>\n')
+        f.write('    <Parameter Name="MGTPort"  Value="8081"/>\n')
+        f.write(
+            '    <Resource Key="3460ec59-57ad-4690-a2d5-d15b4ec4fc4d" Name="RES3" Type="EMB_RES" Port="1">\n'
+        )
+        for i in range(len(id_total)):
+            # <FB Key="-1" Name="conveyor1" Namespace="demo" Type="straightConveyor" x="50"  y="0"   />
+            f.write(
+                f'      <FB Key="{-i-1}" Name="app.{my_id_name[id_total[i]]}" Namespace="demo" Type="{id_name[id_total[i]]}" x="{50*i}" y="0" />\n'
+            )
+
+        for i in data["connections"]:
+            # <Connection Source="conveyor1.Running" Destination="三线.Start1" Priority="1"/>
+            if i["start"]["type"] == "signal_output":
+                a = my_id_name[i["start"]["blockId"]]
+                b = id_signal_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
+                c = my_id_name[i["end"]["blockId"]]
+                d = id_signal_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
+                f.write(
+                    f'      <Connection Source="app.{a}.{b}" Destination="app.{c}.{d}" Priority="1"/>\n'
+                )
+            elif i["start"]["type"] == "var_output":
+                a = my_id_name[i["start"]["blockId"]]
+                b = id_var_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
+                c = my_id_name[i["end"]["blockId"]]
+                d = id_var_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
+                f.write(
+                    f'      <Connection Source="app.{a}.{b}" Destination="app.{c}.{d}" Priority="1"/>\n'
+                )
+
+        f.write("      <DataTable/>\n")
+        f.write("    </Resource>\n")
+        f.write("  </Device>\n")
+
+        f.write("  <DataTable/>\n")
+        f.write(
+            '  <DeployGroup Key="StartDeviceGroup" IsGroup="true" Category="deviceGroup" Size="2100 700"/>\n'
+        )
+        f.write("</System>\n")
+
+
+def timeit(func, repeat: int) -> float:
+    """返回多次运行的最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="process_sys扩展性基准测试")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--legacy-max-blocks",
+        type=int,
+        default=2000,
+        help="超过该设备数时不运行旧实现（旧实现为O(n²)）",
+    )
+    args = parser.parse_args()
+
+    sizes = [(500, 5000), (1000, 10000), (2000, 20000), (5000, 50000), (10000, 100000)]
+    print(
+        f"{'设备/连线':<16}{'旧实现(ms)':>12}{'新实现(ms)':>12}{'每千条连线(ms)':>16}"
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        for blocks, connections in sizes:
+            data = make_workspace(categories=50, blocks=blocks, connections=connections)
+            new_ms = timeit(lambda: process_sys(data, folder), args.repeat)
+            old_ms = None
+            if blocks <= args.legacy_max_blocks:
+                old_ms = timeit(lambda: legacy_process_sys(data, folder), 1)
+                new_file = Path(folder) / "mysys.sys"
+                old_file = Path(folder) / "legacy.sys"
+                if not filecmp.cmp(new_file, old_file, shallow=False):
+                    print(f"输出不一致: {blocks}/{connections}")
+                    sys.exit(1)
+            old = f"{old_ms:.2f}" if old_ms is not None else "-"
+            print(
+                f"{f'{blocks}/{connections}':<16}{old:>12}{new_ms:>12.2f}"
+                f"{new_ms / connections * 1000:>16.3f}"
+            )
+    print("输出逐字节一致 ✅")
+
+
+if __name__ == "__main__":
+    main()
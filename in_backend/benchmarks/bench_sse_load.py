@@ -0,0 +1,341 @@
+"""
+项目创建端到端压测
+启动本地LLM替身服务器和后端（使用临时目录中的config.yaml），并发运行多个
+create_project -> /inputs/sse/{id} 会话，统计首个事件耗时、设备列表耗时、每个设备的耗时
+（相邻两个设备完成事件的间隔，第一个设备从设备列表完成时算起）、端到端耗时的p50/p95/p99以及吞吐量
+
+也可以用 --url 压测已在运行的后端（此时不启动替身服务器，--model 为后端配置中的模型名）
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_sse_load --sessions 20 --concurrency 5 --blocks 6
+    python -m benchmarks.bench_sse_load --latency lognormal:0.5:0.4 --rate-limit-rate 0.05 \\
+        --set device_assistant.concurrency.device_detail=4 --set streaming.enabled=true
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import yaml
+
+from benchmarks.mock_llm import add_mock_arguments, mock_options, start_mock
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MOCK_MODEL = "mock"
+DEVICE_DONE = re.compile(r"^\(\d+/\d+\)\s+.+ 配置生成完成")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_overrides(items) -> dict:
+    """将 a.b.c=值 形式的覆盖项转为嵌套字典，值按JSON解析，解析失败时作为字符串"""
+    overrides = {}
+    for item in items or []:
+        key, _, raw = item.partition("=")
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        node = overrides
+        *parents, last = key.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[last] = value
+    return overrides
+
+
+def write_config(folder: Path, mock_url: str, overrides: dict) -> Path:
+    """写入只包含替身模型的config.yaml"""
+    config = {
+        "LLM_API": {
+            "available_models": {
+                MOCK_MODEL: {
+                    "base_url": mock_url,
+                    "default_model": "mock-model",
+                    "API_KEY": "sk-mock",
+                    "extra_headers": {},
+                    "extra_body": {},
+                    "extra_query": {},
+                }
+            },
+            "default_temperature": 0.7,
+            "default_max_tokens": 2000,
+            "max_context_tokens": 6000,
+            "max_retries": 3,
+        },
+        **overrides,
+    }
+    path = folder / "config.yaml"
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+    return path
+
+
+def start_backend(folder: Path, port: int) -> subprocess.Popen:
+    """在子进程中启动后端，工作目录为folder（读取其中的config.yaml），输出写入backend.log"""
+    log = open(folder / "backend.log", "w", encoding="utf-8")
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:create_app",
+            "--factory",
+            "--app-dir",
+            str(BACKEND_DIR),
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=folder,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+        env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/status/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"后端在 {timeout} 秒内未启动: {base_url}")
+
+
+async def iter_sse(response: httpx.Response):
+    """逐个产生SSE事件(event, data)"""
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+async def run_session(client: httpx.AsyncClient, idx: int, args) -> dict:
+    """运行一个会话，返回各阶段耗时（秒）"""
+    conf = {
+        "name": f"压测系统{idx}",
+        "description": "端到端压测用的系统",
+        "blocks": [
+            {"name": f"设备{idx}_{j}", "description": f"设备{j}的功能"}
+            for j in range(args.blocks)
+        ],
+    }
+    result = {
+        "session": idx,
+        "first_event": None,
+        "device_list": None,
+        "devices": [],
+        "deltas": 0,
+        "total": None,
+        "error": None,
+    }
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            "/inputs/create_project",
+            json={
+                "conf": json.dumps(conf, ensure_ascii=False),
+                "model": args.model,
+                "use_cache": args.use_cache,
+            },
+        )
+        connection_id = response.json()["connection_id"]
+        mark = None
+        async with client.stream("GET", f"/inputs/sse/{connection_id}") as stream:
+            async for event, data in iter_sse(stream):
+                now = time.perf_counter() - started
+                if result["first_event"] is None:
+                    result["first_event"] = now
+                if event == "delta":
+                    result["deltas"] += 1
+                elif event == "status":
+                    message = json.loads(data).get("message", "")
+                    if message.startswith("设备列表生成完成"):
+                        result["device_list"] = mark = now
+                    elif DEVICE_DONE.match(message) and mark is not None:
+                        result["devices"].append(now - mark)
+                        mark = now
+                elif event == "complete":
+                    result["total"] = now
+                elif event == "error":
+                    result["error"] = json.loads(data).get("message")
+                elif event == "close":
+                    break
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    if result["total"] is None and result["error"] is None:
+        result["error"] = "连接在完成前关闭"
+    return result
+
+
+def percentile(values, p: float):
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(name: str, values) -> dict:
+    return {
+        "metric": name,
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+async def run_load(base_url: str, args) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2 + 2)
+    timeout = httpx.Timeout(10, read=None)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=timeout
+    ) as client:
+
+        async def bounded(idx):
+            async with semaphore:
+                return await run_session(client, idx, args)
+
+        # 预热会话不计入统计，避免首次请求的建连和初始化开销影响结果
+        for idx in range(args.warmup):
+            await run_session(client, -1 - idx, args)
+        started = time.perf_counter()
+        sessions = await asyncio.gather(*(bounded(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+
+    ok = [s for s in sessions if s["error"] is None]
+    devices = [d for s in ok for d in s["devices"]]
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "succeeded": len(ok),
+        "errors": [s["error"] for s in sessions if s["error"] is not None],
+        "elapsed": elapsed,
+        "throughput": {
+            "sessions_per_s": len(ok) / elapsed,
+            "devices_per_s": len(devices) / elapsed,
+        },
+        "latency": [
+            summarize("first_event", [s["first_event"] for s in ok]),
+            summarize(
+                "device_list", [s["device_list"] for s in ok if s["device_list"]]
+            ),
+            summarize("device", devices),
+            summarize("end_to_end", [s["total"] for s in ok]),
+        ],
+        "deltas": sum(s["deltas"] for s in sessions),
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"会话 {report['succeeded']}/{report['sessions']} 成功，并发 {report['concurrency']}，"
+        f"总耗时 {report['elapsed']:.2f}s，流式事件 {report['deltas']}"
+    )
+    print(
+        f"吞吐量: {report['throughput']['sessions_per_s']:.2f} 会话/s，"
+        f"{report['throughput']['devices_per_s']:.2f} 设备/s"
+    )
+    print(
+        f"{'指标':<14}{'数量':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}{'max(ms)':>12}"
+    )
+
+    def ms(value):
+        return f"{value * 1000:.1f}" if value is not None else "-"
+
+    for row in report["latency"]:
+        print(
+            f"{row['metric']:<14}{row['count']:>8}{ms(row['p50']):>12}{ms(row['p95']):>12}"
+            f"{ms(row['p99']):>12}{ms(row['max']):>12}"
+        )
+    for error in report["errors"][:5]:
+        print(f"错误: {error}")
+    if "mock" in report:
+        print(f"替身服务器: {report['mock']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="项目创建端到端压测")
+    parser.add_argument("--sessions", type=int, default=20, help="会话总数")
+    parser.add_argument("--concurrency", type=int, default=5, help="同时进行的会话数")
+    parser.add_argument("--blocks", type=int, default=6, help="每个会话的设备数")
+    parser.add_argument("--warmup", type=int, default=1, help="不计入统计的预热会话数")
+    parser.add_argument("--use-cache", action="store_true", help="允许使用LLM响应缓存")
+    parser.add_argument("--url", help="压测已在运行的后端，不启动替身服务器")
+    parser.add_argument("--model", default=MOCK_MODEL, help="使用的模型名")
+    parser.add_argument(
+        "--set",
+        action="append",
+        metavar="KEY=VALUE",
+        help="写入config.yaml的配置项，如 device_assistant.concurrency.device_detail=4",
+    )
+    parser.add_argument("--output", type=Path, help="将结果写入JSON文件")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    if args.url:
+        report = asyncio.run(run_load(args.url.rstrip("/"), args))
+    else:
+        mock = start_mock(**mock_options(args))
+        mock_url = f"http://127.0.0.1:{mock.server_address[1]}/v1"
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            write_config(folder, mock_url, parse_overrides(args.set))
+            port = free_port()
+            backend = start_backend(folder, port)
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                asyncio.run(wait_ready(base_url))
+                report = asyncio.run(run_load(base_url, args))
+            except Exception:
+                print((folder / "backend.log").read_text(encoding="utf-8")[-2000:])
+                raise
+            finally:
+                backend.terminate()
+                backend.wait(timeout=10)
+        mock.shutdown()
+        with mock.lock:
+            report["mock"] = dict(mock.stats)
+
+    print_report(report)
+    if args.output:
+        args.output.write_text(
+            json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        print(f"结果已写入 {args.output}")
+    if report["succeeded"] < report["sessions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+工作区配置解析基准测试
+对比旧的/outputs/convert（外层JSON中嵌套conf字符串，process_fbt和process_sys各解析一次）
+与/outputs/convert_workspace（请求体直接为工作区JSON，解析一次得到Workspace）的
+解析耗时和峰值内存（tracemalloc）
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.bench_workspace_parse
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.workspace import make_workspace_conf
+from outputs.util.workspace import Workspace
+
+
+def legacy_parse(body: bytes):
+    """旧流程：解析外层请求体，再分别为.fbt和.sys解析conf字符串"""
+    outer = json.loads(body)
+    data = json.loads(outer["conf"])
+    _ = data["blockCategories"]
+    del data
+    data = json.loads(outer["conf"])
+    _ = data["connections"]
+
+
+def direct_parse(body: bytes):
+    """新流程：请求体直接解析为Workspace，各阶段共用"""
+    workspace = Workspace.parse(body)
+    _ = workspace.block_categories, workspace.connections
+
+
+def measure(func, body: bytes, repeat: int) -> tuple:
+    """返回(最短耗时毫秒, 峰值内存MB)，峰值内存不含请求体本身"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(body)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工作区配置解析基准测试")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sizes = [(20, 200, 2000), (100, 2000, 20000), (500, 10000, 100000)]
+    print(
+        f"{'类型/设备/连线':<20}{'请求体(MB)':>12}{'旧耗时(ms)':>12}{'旧峰值(MB)':>12}"
+        f"{'新耗时(ms)':>12}{'新峰值(MB)':>12}"
+    )
+    for categories, blocks, connections in sizes:
+        conf = make_workspace_conf(
+            categories=categories, blocks=blocks, connections=connections
+        )
+        legacy_body = json.dumps(
+            {"conf": conf, "output_path": "/tmp/out"}, ensure_ascii=False
+        ).encode("utf-8")
+        direct_body = conf.encode("utf-8")
+        old_ms, old_mb = measure(legacy_parse, legacy_body, args.repeat)
+        new_ms, new_mb = measure(direct_parse, direct_body, args.repeat)
+        label = f"{categories}/{blocks}/{connections}"
+        print(
+            f"{label:<20}{len(direct_body) / 1024 / 1024:>12.1f}{old_ms:>12.1f}"
+            f"{old_mb:>12.1f}{new_ms:>12.1f}{new_mb:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
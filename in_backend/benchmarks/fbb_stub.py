@@ -0,0 +1,112 @@
+"""
+本地FBB IDE替身服务器，用于测试和基准测试FBB上传
+HEAD / 返回200；POST /import 接收multipart文件并返回{"code": 1}；
+GET /received 返回已接收的文件名和大小。可注入延迟和失败
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.fbb_stub --port 61499 --delay 0.05 --fail-rate 0.1
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILENAME = re.compile(rb'filename="([^"]*)"')
+
+
+class FBBStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, fail_rate=0.0, code_fail_rate=0.0):
+        super().__init__(address, FBBStubHandler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.code_fail_rate = code_fail_rate
+        self.received = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class FBBStubHandler(BaseHTTPRequestHandler):
+    server: FBBStubServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict = None):
+        data = json.dumps(body or {}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        self._reply(200)
+
+    def do_GET(self):
+        if self.path == "/received":
+            with self.server.lock:
+                body = {"requests": self.server.requests, "files": self.server.received}
+            self._reply(200, body)
+        else:
+            self._reply(200)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests += 1
+        if self.path != "/import":
+            self._reply(404)
+            return
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if random.random() < self.server.fail_rate:
+            self._reply(500, {"message": "injected failure"})
+            return
+        if random.random() < self.server.code_fail_rate:
+            self._reply(200, {"code": 0})
+            return
+        match = FILENAME.search(body)
+        filename = match.group(1).decode("utf-8") if match else ""
+        with self.server.lock:
+            self.server.received[filename] = length
+        self._reply(200, {"code": 1})
+
+
+def start_stub(port: int = 0, **options) -> FBBStubServer:
+    """在后台线程中启动替身服务器，port为0时自动分配端口"""
+    server = FBBStubServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地FBB IDE替身服务器")
+    parser.add_argument("--port", type=int, default=61499)
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="每个请求的处理延迟（秒）"
+    )
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument(
+        "--code-fail-rate", type=float, default=0.0, help="返回code 0的比例"
+    )
+    args = parser.parse_args()
+    server = FBBStubServer(
+        ("127.0.0.1", args.port),
+        delay=args.delay,
+        fail_rate=args.fail_rate,
+        code_fail_rate=args.code_fail_rate,
+    )
+    print(f"FBB替身服务器运行在 http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
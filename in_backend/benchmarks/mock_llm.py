@@ -0,0 +1,380 @@
+"""
+本地OpenAI兼容的LLM替身服务器，用于在不消耗API额度的情况下压测生成流程
+POST /chat/completions（及/v1/chat/completions）按提示词生成设备列表、设备详细配置（单个或批量）
+和AI推荐的JSON回复，也可以用脚本文件按正则指定回复；支持流式返回、可配置的延迟分布，
+以及按比例注入429和5xx错误。GET /stats 返回请求数和注入的错误数
+
+延迟分布写法：fixed:0.3、uniform:0.1:0.5、normal:0.3:0.1、lognormal:0.3:0.5（中位数:sigma）
+
+脚本文件为JSON数组，按顺序匹配最后一条用户消息，第一个匹配的规则生效：
+    [{"match": "正则", "reply": "回复内容"}, {"match": "正则", "status": 429}]
+
+运行方式（在in_backend目录下）：
+    python -m benchmarks.mock_llm --port 18001 --latency lognormal:0.5:0.4 --rate-limit-rate 0.05
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEVICE_LIST_MARKER = "提取设备配置列表"
+AI_RECOMMEND_MARKER = "用户的需求是："
+SINGLE_DETAIL = re.compile(r'现在请为设备"([^"]+)"')
+BATCH_DETAIL = re.compile(r"现在请为以下一组设备分别生成详细配置：(.*)")
+DEVICE_NAME = re.compile(r'设备"([^"]+)"')
+MODULE_LINE = re.compile(r"模块：(.+?)，功能：")
+
+
+def parse_latency(spec: str):
+    """解析延迟分布，返回无参数的采样函数（秒）"""
+    kind, *values = spec.split(":")
+    values = [float(v) for v in values]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        # 参数为中位数和对数标准差
+        if values[0] <= 0:
+            return lambda: 0.0
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+def device_detail(name: str, states: int = 3) -> dict:
+    """设备详细配置，结构与device_detail_template一致"""
+    return {
+        "name": name,
+        "var_input": [{"name": "启动", "type": "bool", "description": "启动信号"}],
+        "var_output": [{"name": "运行", "type": "bool", "description": "运行状态"}],
+        "signal_input": [{"name": "INIT", "description": "初始化"}],
+        "signal_output": [{"name": "CNF", "description": "完成"}],
+        "InternalVars": [
+            {"name": "计数", "type": "int", "InitalVaule": "0", "description": "计数器"}
+        ],
+        "ECC": {
+            "ECStates": [
+                {
+                    "name": f"状态{j}",
+                    "comment": "状态",
+                    "x": 50 * j,
+                    "y": 50,
+                    "ecAction": {"algorithm": f"算法{j}", "output": "CNF"},
+                }
+                for j in range(states)
+            ],
+            "ECTransitions": [
+                {
+                    "source": f"状态{j}",
+                    "destination": f"状态{(j + 1) % states}",
+                    "condition": "INIT",
+                    "comment": "转换",
+                    "x": 100,
+                    "y": 100,
+                }
+                for j in range(states)
+            ],
+        },
+        "Algorithms": [
+            {
+                "Name": f"算法{j}",
+                "Comment": "算法",
+                "Code": "IF 启动 THEN\n    运行 := TRUE;\nEND_IF;",
+            }
+            for j in range(states)
+        ],
+    }
+
+
+def template_reply(prompt: str, devices: int) -> str:
+    """按提示词类型生成回复"""
+    batch = BATCH_DETAIL.search(prompt)
+    if batch:
+        names = DEVICE_NAME.findall(batch.group(1))
+        return json.dumps([device_detail(n) for n in names], ensure_ascii=False)
+    single = SINGLE_DETAIL.search(prompt)
+    if single:
+        return json.dumps(device_detail(single.group(1)), ensure_ascii=False)
+    if DEVICE_LIST_MARKER in prompt:
+        names = MODULE_LINE.findall(prompt) or [f"设备{i}" for i in range(devices)]
+        items = [
+            {
+                "device": name,
+                "input_signal": "启动、停止",
+                "output_signal": "运行",
+                "description": f"{name}的功能",
+            }
+            for name in names
+        ]
+        return json.dumps(items, ensure_ascii=False, indent=2)
+    if AI_RECOMMEND_MARKER in prompt:
+        return json.dumps(
+            {
+                "name": "模拟系统",
+                "description": "由模拟LLM生成的系统",
+                "blocks": [
+                    {"name": f"设备{i}", "description": f"设备{i}的功能"}
+                    for i in range(devices)
+                ],
+            },
+            ensure_ascii=False,
+        )
+    return "好的。"
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency: str = "fixed:0",
+        chunk_chars: int = 20,
+        chunk_interval: float = 0.01,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.2,
+        devices: int = 6,
+        script: list = None,
+    ):
+        super().__init__(address, MockLLMHandler)
+        self.latency = parse_latency(latency)
+        self.chunk_chars = max(1, chunk_chars)
+        self.chunk_interval = chunk_interval
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.devices = devices
+        self.script = [
+            {**rule, "pattern": re.compile(rule["match"])} for rule in script or []
+        ]
+        self.stats = {
+            "requests": 0,
+            "streamed": 0,
+            "rate_limited": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+        self.lock = threading.Lock()
+
+    def count(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def reply(self, prompt: str):
+        """返回(状态码, 回复内容)"""
+        for rule in self.script:
+            if rule["pattern"].search(prompt):
+                return rule.get("status", 200), rule.get("reply", "")
+        return 200, template_reply(prompt, self.devices)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server: MockLLMServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int):
+        headers = {}
+        if status == 429:
+            headers["retry-after-ms"] = str(int(self.server.retry_after * 1000))
+        body = {"error": {"message": "injected error", "type": "mock", "code": status}}
+        self._json(status, body, headers)
+
+    def _chunk(self, data: dict):
+        payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                self._json(200, dict(self.server.stats))
+        else:
+            self._json(404, {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {})
+            return
+        server = self.server
+        server.count(requests=1)
+        time.sleep(server.latency())
+
+        roll = random.random()
+        if roll < server.rate_limit_rate:
+            server.count(rate_limited=1)
+            self._error(429)
+            return
+        if roll < server.rate_limit_rate + server.error_rate:
+            server.count(errors=1)
+            self._error(random.choice([500, 502, 503]))
+            return
+
+        messages = body.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        status, content = server.reply(prompt)
+        if status != 200:
+            server.count(errors=1)
+            self._error(status)
+            return
+
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        # 粗略按两个字符一个token计算，超出max_tokens时截断
+        if max_tokens and len(content) > max_tokens * 2:
+            content, finish_reason = content[: max_tokens * 2], "length"
+        usage = {
+            "prompt_tokens": sum(len(m.get("content") or "") for m in messages) // 2,
+            "completion_tokens": len(content) // 2,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        server.count(
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+        )
+        model = body.get("model", "mock-model")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            self._json(
+                200,
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": finish_reason,
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        server.count(streamed=1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+        }
+        try:
+            for i in range(0, len(content), server.chunk_chars):
+                delta = {"content": content[i : i + server.chunk_chars]}
+                self._chunk(
+                    {
+                        **chunk,
+                        "choices": [
+                            {"index": 0, "delta": delta, "finish_reason": None}
+                        ],
+                    }
+                )
+                if server.chunk_interval:
+                    time.sleep(server.chunk_interval)
+            self._chunk(
+                {
+                    **chunk,
+                    "choices": [
+                        {"index": 0, "delta": {}, "finish_reason": finish_reason}
+                    ],
+                    "usage": usage,
+                }
+            )
+            done = b"data: [DONE]\n\n"
+            self.wfile.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消了请求
+            self.close_connection = True
+
+
+def start_mock(port: int = 0, **options) -> MockLLMServer:
+    """在后台线程中启动替身服务器，port为0时自动分配端口"""
+    server = MockLLMServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """替身服务器的命令行参数，供压测脚本复用"""
+    parser.add_argument("--latency", default="fixed:0.2", help="每个请求的首包延迟分布")
+    parser.add_argument(
+        "--chunk-chars", type=int, default=20, help="流式返回每块的字符数"
+    )
+    parser.add_argument(
+        "--chunk-interval", type=float, default=0.01, help="流式返回每块的间隔（秒）"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回5xx的比例")
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="返回429的比例"
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=0.2, help="429的retry-after（秒）"
+    )
+    parser.add_argument(
+        "--devices", type=int, default=6, help="提示词中没有模块时的设备数"
+    )
+    parser.add_argument("--script", help="脚本文件（JSON），按正则指定回复")
+
+
+def mock_options(args) -> dict:
+    script = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+    return {
+        "latency": args.latency,
+        "chunk_chars": args.chunk_chars,
+        "chunk_interval": args.chunk_interval,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "devices": args.devices,
+        "script": script,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容的LLM替身服务器")
+    parser.add_argument("--port", type=int, default=18001)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    server = MockLLMServer(("127.0.0.1", args.port), **mock_options(args))
+    print(f"LLM替身服务器运行在 http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
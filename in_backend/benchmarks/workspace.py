@@ -0,0 +1,122 @@
+"""
+基准测试用的合成工作区
+结构与前端/outputs/convert提交的工作区配置一致：blockCategories、blocks、connections
+"""
+
+import json
+import random
+
+
+def make_code(value: int, code_blocks: int = 1) -> str:
+    """生成ST代码，code_blocks为其中IF语句的个数"""
+    return "".join(
+        f"IF 输入0 THEN\n    输出0 := {value + k};\nEND_IF;\n"
+        for k in range(code_blocks)
+    )
+
+
+def make_category(
+    idx: int,
+    ports: int = 4,
+    states: int = 5,
+    algorithms: int = 3,
+    code_blocks: int = 1,
+):
+    """
+    生成一个设备类型配置
+    states为ECC状态数（转换数相同），algorithms为算法数，code_blocks为每个算法的ST代码规模
+    """
+    return {
+        "name": f"设备{idx}",
+        "description": f"设备{idx}的功能描述",
+        "signal_input": [
+            {"name": f"EI{j}", "description": "事件输入"} for j in range(ports)
+        ],
+        "signal_output": [
+            {"name": f"EO{j}", "description": "事件输出"} for j in range(ports)
+        ],
+        "var_input": [
+            {"name": f"输入{j}", "type": "BOOL", "description": "输入变量"}
+            for j in range(ports)
+        ],
+        "var_output": [
+            {"name": f"输出{j}", "type": "INT", "description": "输出变量"}
+            for j in range(ports)
+        ],
+        "InternalVar": [
+            {"name": "计数", "type": "INT", "description": "计数器", "InitalVaule": "0"}
+        ],
+        "ECC": {
+            "ECStates": [
+                {"name": f"状态{j}", "comment": "状态", "x": 50 * j, "y": 50}
+                for j in range(states)
+            ],
+            "ECTransitions": [
+                {
+                    "source": f"状态{j}",
+                    "destination": f"状态{(j + 1) % states}",
+                    "condition": f"EI{j % ports}",
+                    "comment": "转换",
+                    "x": 100,
+                    "y": 100,
+                }
+                for j in range(states)
+            ],
+        },
+        "Algorithms": [
+            {
+                "Name": f"算法{j}",
+                "Comment": "算法",
+                "Code": make_code(j, code_blocks),
+            }
+            for j in range(algorithms)
+        ],
+    }
+
+
+def make_workspace(
+    categories: int = 20,
+    blocks: int = 200,
+    connections: int = 1000,
+    ports: int = 4,
+    seed: int = 0,
+    states: int = 5,
+    algorithms: int = 3,
+    code_blocks: int = 1,
+) -> dict:
+    """生成工作区：blocks个设备实例轮流使用categories个设备类型，随机连线"""
+    rng = random.Random(seed)
+    category_list = [
+        make_category(i, ports, states, algorithms, code_blocks)
+        for i in range(categories)
+    ]
+    block_list = [
+        {"id": i, "categoryConf": category_list[i % categories]} for i in range(blocks)
+    ]
+    connection_list = []
+    for _ in range(connections):
+        kind = rng.choice(["signal", "var"])
+        connection_list.append(
+            {
+                "start": {
+                    "blockId": rng.randrange(blocks),
+                    "type": f"{kind}_output",
+                    "index": rng.randrange(ports),
+                },
+                "end": {
+                    "blockId": rng.randrange(blocks),
+                    "type": f"{kind}_input",
+                    "index": rng.randrange(ports),
+                },
+            }
+        )
+    return {
+        "blockCategories": category_list,
+        "blocks": block_list,
+        "connections": connection_list,
+    }
+
+
+def make_workspace_conf(**kwargs) -> str:
+    """工作区配置的JSON字符串（与前端提交的conf字段相同）"""
+    return json.dumps(make_workspace(**kwargs), ensure_ascii=False)
@@ -1,28 +1,66 @@
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, Header, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uuid
 from typing import Dict, Any
 import asyncio
+import hashlib
+import json
+import time
 import yaml
-from datetime import datetime, timedelta
+from pathlib import Path
 
+from .util.job_store import JobRecord, create_job_store
+from .util.jobs import GenerationJob
+from .util.metrics import metrics, sse_active_streams
 from .util.LLM_interface import (
+    config_manager,
+    event_stream,
+    format_sse,
     sse_generator,
     LLM_set_user_config,
     check_API_config,
     LLM_get_available_models,
+    LLM_refresh_clients,
 )
 
 input_router = APIRouter(prefix="/inputs", tags=["输入相关接口"])
 
-# 存储进行中的任务和SSE连接
-active_connections = {}
-
-# 定期清理过期连接的时间间隔（秒）
+# 运行中的后台任务，结束后移除；任务记录和结果保存在任务存储中
+running_jobs: Dict[str, GenerationJob] = {}
+job_store = None
+# 合并相同请求：请求键 -> 运行中的任务
+inflight_jobs: Dict[str, GenerationJob] = {}
+# 各连接类型的提交数和被合并的提交数
+coalescing_counters: Dict[str, Dict[str, int]] = {}
+
+# 任务存储类型：sqlite（config.yaml所在目录下的数据库文件）或memory
+JOB_STORE_BACKEND = "sqlite"
+JOB_STORE_FILE = "jobs.sqlite3"
+# 任务存储的条目数和总字节数上限，超出时淘汰已结束的任务
+# （memory存储淘汰最久未访问的，sqlite存储淘汰最早创建的）
+JOB_STORE_MAX_ENTRIES = 1000
+JOB_STORE_MAX_BYTES = 64 * 1024 * 1024
+# 清理任务的最长休眠时间（秒），通常在最早的任务到期时即被唤醒
 CLEANUP_INTERVAL = 1800  # 0.5小时
-# 连接过期时间（秒）
-CONNECTION_TIMEOUT = 600  # 10分钟
+# 任务记录及结果的保留时间（秒），按创建时间计算
+JOB_RETENTION = 24 * 3600  # 1天
+# 每个后台任务保留的事件数上限，用于断线重连时补发
+JOB_MAX_EVENTS = 2000
+
+metrics.gauge(
+    "jobs_running", "正在运行的生成任务数", callback=lambda: len(running_jobs)
+)
+metrics.gauge(
+    "jobs_inflight_keys", "可被合并的运行中请求数", callback=lambda: len(inflight_jobs)
+)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream",
+    "X-Accel-Buffering": "no",  # 对于Nginx
+}
 
 CONFIG_PATH = None
 
@@ -38,7 +76,7 @@ def set_user_config():
         config = yaml.safe_load(f)
         if not config:
             raise ValueError("找不到config.yaml文件或内容为空")
-        LLM_set_user_config(config)
+        LLM_set_user_config(config, base_dir=Path(CONFIG_PATH).parent)
 
 
 class ProjectConfig(BaseModel):
@@ -49,21 +87,43 @@ class ProjectConfig(BaseModel):
     conf: str
 
 
-async def cleanup_expired_connections():
-    """定期清理过期的连接"""
-    while True:
-        await asyncio.sleep(CLEANUP_INTERVAL)
-        now = datetime.now()
-        expired_ids = []
+def get_job_store():
+    """获取任务存储，首次使用时创建"""
+    global job_store
+    if job_store is None:
+        if JOB_STORE_BACKEND == "sqlite" and CONFIG_PATH is not None:
+            job_store = create_job_store(
+                "sqlite",
+                Path(CONFIG_PATH).parent / JOB_STORE_FILE,
+                retention=JOB_RETENTION,
+                max_entries=JOB_STORE_MAX_ENTRIES,
+                max_bytes=JOB_STORE_MAX_BYTES,
+            )
+        else:
+            job_store = create_job_store(
+                "memory",
+                retention=JOB_RETENTION,
+                max_entries=JOB_STORE_MAX_ENTRIES,
+                max_bytes=JOB_STORE_MAX_BYTES,
+            )
+    return job_store
 
-        for conn_id, conn_data in active_connections.items():
-            if now - conn_data["created_at"] > timedelta(seconds=CONNECTION_TIMEOUT):
-                expired_ids.append(conn_id)
 
-        for conn_id in expired_ids:
-            if conn_id in active_connections:
-                del active_connections[conn_id]
-                print(f"已清理过期连接: {conn_id}")
+def next_cleanup_delay() -> float:
+    """距最早的已结束任务到期的秒数，不超过CLEANUP_INTERVAL"""
+    expiry = get_job_store().next_expiry()
+    if expiry is None:
+        return CLEANUP_INTERVAL
+    return min(CLEANUP_INTERVAL, max(1.0, expiry - time.time()))
+
+
+async def cleanup_expired_connections():
+    """在最早的任务到期时删除过期的任务记录"""
+    while True:
+        await asyncio.sleep(next_cleanup_delay())
+        deleted = get_job_store().delete_expired(time.time())
+        if deleted:
+            print(f"已清理过期任务: {deleted} 个")
 
 
 @input_router.get("/check_api_config")
@@ -82,6 +142,7 @@ async def refresh_api_config():
     """
     try:
         set_user_config()
+        await LLM_refresh_clients()
         return {"status": "success", "message": "API配置已刷新"}
     except HTTPException as e:
         raise e
@@ -103,6 +164,130 @@ async def get_available_models():
         raise HTTPException(status_code=500, detail=f"获取可用模型失败: {e}")
 
 
+def request_key(connection_type: str, model: str, data, use_cache: bool = True) -> str:
+    """
+    请求的规范化哈希
+    JSON内容按键排序后计算，键顺序、空白不同的相同请求得到相同的键；
+    use_cache不同的请求不合并（要求重新生成的请求不能复用可能命中缓存的任务）
+    """
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            pass
+    canonical = json.dumps(
+        [connection_type, model, data, bool(use_cache)],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def submit_job(record: JobRecord, function_name: str):
+    """
+    提交生成任务，返回(任务ID, 是否合并)
+    该连接类型开启合并且相同请求的任务仍在运行时，直接返回该任务的ID，
+    重复提交的客户端读取同一事件流和结果
+    """
+    counters = coalescing_counters.setdefault(
+        record.connection_type, {"submitted": 0, "coalesced": 0}
+    )
+    counters["submitted"] += 1
+    if not config_manager.get(f"coalescing.{record.connection_type}", False):
+        start_job(record, function_name)
+        return record.job_id, False
+
+    key = request_key(
+        record.connection_type, record.model, record.data, record.use_cache
+    )
+    job = inflight_jobs.get(key)
+    if job is not None and not job.done:
+        counters["coalesced"] += 1
+        print(f"合并相同请求到任务: {job.job_id}")
+        return job.job_id, True
+    inflight_jobs[key] = start_job(record, function_name, key)
+    return record.job_id, False
+
+
+def start_job(record: JobRecord, function_name: str, key: str = None) -> GenerationJob:
+    """保存任务记录并启动后台生成任务"""
+    get_job_store().put(record)
+    job = GenerationJob(
+        record.job_id,
+        event_stream(
+            record.data,
+            function_name,
+            record.model,
+            use_cache=record.use_cache,
+            connection_id=record.job_id,
+        ),
+        max_events=JOB_MAX_EVENTS,
+        on_finish=lambda job: finish_job(job, key),
+    )
+    running_jobs[record.job_id] = job
+    job.start()
+    return job
+
+
+async def finish_job(job: GenerationJob, key: str = None):
+    """任务结束后保存结果和事件，并从运行中的任务移除；磁盘存储在线程池中写入"""
+    if key is not None and inflight_jobs.get(key) is job:
+        del inflight_jobs[key]
+    store = get_job_store()
+    args = (job.job_id, job.status, job.finished_at, job.result(), job.saved_events())
+    if store.blocking:
+        await asyncio.to_thread(store.finish, *args)
+    else:
+        store.finish(*args)
+    running_jobs.pop(job.job_id, None)
+
+
+def load_job(connection_id: str, resume_from: int = 0):
+    """
+    获取连接对应的任务：运行中的任务直接返回，已结束的任务由保存的事件重建
+    未正常结束（如服务重启时中断）的任务补充错误和结束事件，避免客户端反复重连
+    """
+    job = running_jobs.get(connection_id)
+    if job is not None:
+        return job
+    record = get_job_store().get(connection_id)
+    if record is None:
+        return None
+    events = list(record.events or [])
+    if not events or events[-1][1] != "close":
+        seq = max(events[-1][0] if events else 0, resume_from)
+        events.append(
+            [
+                seq + 1,
+                "error",
+                json.dumps(
+                    {"message": "生成任务已中断，请重新提交"}, ensure_ascii=False
+                ),
+            ]
+        )
+        events.append(
+            [
+                seq + 2,
+                "close",
+                json.dumps({"message": "SSE连接终止"}, ensure_ascii=False),
+            ]
+        )
+    return GenerationJob.from_events(
+        record.job_id, record.status, events, record.finished_at
+    )
+
+
+async def job_sse(job: GenerationJob, last_event_id: int):
+    """从last_event_id之后读取任务事件并格式化为SSE"""
+    sse_active_streams.inc(endpoint="inputs")
+    try:
+        async for event in job.events_after(last_event_id):
+            yield format_sse({"event": event.event, "data": event.data}, event.seq)
+    finally:
+        sse_active_streams.dec(endpoint="inputs")
+
+
 @input_router.post("/create_project")
 async def create_project(
     project_conf: Dict[str, Any] = Body(
@@ -121,18 +306,24 @@ async def create_project(
     # 生成唯一连接ID
     connection_id = str(uuid.uuid4())
 
-    active_connections[connection_id] = {
-        "project_conf": project_conf["conf"],  # 使用实际提交的配置
-        "model": project_conf["model"],  # 使用实际提交的模型
-        "created_at": datetime.now(),
-        "connection_type": "project_creation",
-    }
+    # 提交时即开始生成，SSE连接只读取任务事件；相同请求可能合并到已有任务
+    connection_id, coalesced = submit_job(
+        JobRecord(
+            job_id=connection_id,
+            connection_type="project_creation",
+            model=project_conf["model"],  # 使用实际提交的模型
+            data=project_conf["conf"],  # 使用实际提交的配置
+            use_cache=project_conf.get("use_cache", True),  # 可按请求跳过响应缓存
+        ),
+        "LLM_generate_block_categories",
+    )
 
     # 返回连接ID
     return {
         "status": "success",
         "message": "项目创建成功，可以通过SSE连接监控进度",
         "connection_id": connection_id,
+        "coalesced": coalesced,
     }
 
 
@@ -152,82 +343,111 @@ async def get_ai_recommend(
     # 生成唯一连接ID
     connection_id = str(uuid.uuid4())
 
-    active_connections[connection_id] = {
-        "user_demand": user_demand["userInput"],  # 使用实际提交的配置
-        "model": user_demand["model"],  # 使用实际提交的模型
-        "created_at": datetime.now(),
-        "connection_type": "AI_recommend",
-    }
+    connection_id, coalesced = submit_job(
+        JobRecord(
+            job_id=connection_id,
+            connection_type="AI_recommend",
+            model=user_demand["model"],  # 使用实际提交的模型
+            data=user_demand["userInput"],  # 使用实际提交的需求
+            use_cache=user_demand.get("use_cache", True),  # 可按请求跳过响应缓存
+        ),
+        "LLM_generate_AI_recommend",
+    )
 
     # 返回连接ID
     return {
         "status": "success",
         "message": "AI推荐获取成功，可以通过SSE连接监控进度",
         "connection_id": connection_id,
+        "coalesced": coalesced,
     }
 
 
 @input_router.get("/sse/{connection_id}")
-async def sse_connection(connection_id: str):
+async def sse_connection(connection_id: str, last_event_id: str = Header(None)):
     """
     通过连接ID建立SSE连接，监控项目创建进度
+    生成任务在提交时已开始运行；断线重连时浏览器携带Last-Event-ID，从该事件之后继续发送
     """
-    if connection_id not in active_connections:
+    try:
+        resume_from = int(last_event_id or 0)
+    except ValueError:
+        resume_from = 0
+    job = load_job(connection_id, resume_from)
+    if job is None:
         raise HTTPException(status_code=404, detail="连接ID无效或已过期")
 
-    conn = active_connections[connection_id]
     try:
-        if conn["connection_type"] == "project_creation":
-            # 获取项目配置
-            project_conf = conn["project_conf"]
-            model = conn["model"]
-            print(
-                f"建立项目SSE连接成功，连接ID: {connection_id}, 项目配置: {project_conf}, 模型: {model}"
-            )
-            # 创建SSE流
-            return StreamingResponse(
-                sse_generator(project_conf, "LLM_generate_block_categories", model),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Content-Type": "text/event-stream",
-                    "X-Accel-Buffering": "no",
-                },
-            )
-        if conn["connection_type"] == "AI_recommend":
-            # 获取用户需求
-            user_demand = conn["user_demand"]
-            model = conn["model"]
-            print(
-                f"建立AI推荐SSE连接成功，连接ID: {connection_id}, 用户需求: {user_demand}, 模型: {model}"
-            )
-            # 创建SSE流
-            return StreamingResponse(
-                sse_generator(user_demand, "LLM_generate_AI_recommend", model),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Content-Type": "text/event-stream",
-                    "X-Accel-Buffering": "no",
-                },
-            )
+        print(
+            f"建立SSE连接成功，连接ID: {connection_id}, 任务状态: {job.status}, "
+            f"从事件 {resume_from} 之后开始发送"
+        )
+        return StreamingResponse(
+            job_sse(job, resume_from),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
     except Exception as e:
         return StreamingResponse(
             sse_generator(f"SSE连接创建错误: {e}", "send_single_message"),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
-                "X-Accel-Buffering": "no",  # 对于Nginx
-            },
+            headers=SSE_HEADERS,
         )
 
 
+@input_router.get("/result/{connection_id}")
+async def get_result(connection_id: str):
+    """
+    获取任务的状态和结果，已结束的任务在保留期内可重复获取（服务重启后仍可获取）
+    """
+    job = running_jobs.get(connection_id)
+    if job is not None:
+        return {"status": "success", "job_status": job.status, "result": None}
+    record = get_job_store().get(connection_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="连接ID无效或已过期")
+    result = json.loads(record.result)["result"] if record.result else None
+    return {
+        "status": "success",
+        "job_status": record.status,
+        "connection_type": record.connection_type,
+        "model": record.model,
+        "created_at": record.created_at,
+        "finished_at": record.finished_at,
+        "result": result,
+    }
+
+
+def get_job_stats() -> Dict:
+    """运行中的任务数、请求合并和任务存储的统计"""
+    coalescing = {
+        connection_type: {
+            "enabled": bool(config_manager.get(f"coalescing.{connection_type}", False)),
+            **counters,
+        }
+        for connection_type, counters in coalescing_counters.items()
+    }
+    return {
+        "running": len(running_jobs),
+        "inflight_keys": len(inflight_jobs),
+        "coalescing": coalescing,
+        "store": get_job_store().stats(),
+    }
+
+
+async def stop_running_jobs():
+    """取消所有仍在运行的后台任务（结束状态会写入任务存储），并关闭任务存储"""
+    for job in list(running_jobs.values()):
+        await job.cancel()
+    get_job_store().close()
+
+
 # 移除已弃用的on_event装饰器
 # 定义清理过期连接的函数，将在主应用中调用
 async def start_cleanup_task():
     """启动清理过期连接的任务"""
+    # 上次运行时未结束的任务已无法继续
+    interrupted = get_job_store().mark_interrupted()
+    if interrupted:
+        print(f"已将 {interrupted} 个中断的任务标记为失败")
     asyncio.create_task(cleanup_expired_connections())
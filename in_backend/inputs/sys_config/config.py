@@ -5,6 +5,14 @@ CONFIG = {
         "max_history_length": 15,
         "temperature": {"device_list": 0.3, "device_detail": 0.2},
         "max_tokens": {"device_list": 1500, "device_detail": 3000},
+        # 设备详细配置的并发数，默认为1即顺序生成（各设备共享同一对话历史）；
+        # 大于1时各设备基于设备列表上下文的独立副本并发生成，生成顺序和上下文与顺序生成不同
+        # early_start: 并发且流式输出时设备列表中的设备一闭合就开始生成其详细配置
+        "concurrency": {"device_detail": 1, "early_start": False},
+        # 批量生成：一次请求生成多个设备的详细配置，
+        # 批量大小随设备数、max_tokens.device_detail和回复截断情况自适应，
+        # token_budget为单个批量请求的max_tokens上限
+        "batching": {"enabled": False, "max_batch_size": 4, "token_budget": 12000},
     },
     # 进度配置
     "progress": {
@@ -166,6 +174,95 @@ CONFIG = {
             设备描述：{device}是一个工业设备，请根据其功能特点生成合理的配置。
             """,
     },
+    # 流式输出配置：开启后LLM的部分内容以delta事件转发给前端，默认关闭
+    "streaming": {
+        "enabled": False,
+        "min_chunk_chars": 32,  # 累积到该字符数后转发一次
+        "min_interval": 0.2,  # 距上次转发超过该秒数也转发
+        # 请求在流的最后返回token用量（stream_options.include_usage），用于指标；
+        # 部分OpenAI兼容服务不支持该参数，默认关闭
+        "include_usage": False,
+    },
+    # 上下文窗口：tokenizer可选auto（安装了tiktoken时使用）、tiktoken或local
+    "context_window": {
+        "tokenizer": "auto",
+        # 上下文压缩：历史超过阈值后，较早的设备详细配置对话替换为只含接口名的摘要
+        # 在顺序生成（device_assistant.concurrency.device_detail为1，默认）时起作用；
+        # 并发时每个设备使用设备列表上下文的独立副本，详细配置对话不会累积，无可压缩的内容，
+        # 此时同时开启压缩会在日志中给出警告
+        "compaction": {
+            "enabled": False,
+            "threshold_tokens": 3000,
+            "keep_recent": 2,  # 最近的若干条消息保持原文
+            "prefill_tokens_per_second": 1000,  # 用于估算节省的时间
+        },
+    },
+    # 共享LLM客户端的连接池配置，各模型的客户端在进程内复用
+    "client_pool": {
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "keepalive_expiry": 60,  # 空闲连接保持时间（秒）
+        "connect_timeout": 10,
+        "read_timeout": 120,
+        "warm_up": False,  # 启动时是否预热各模型的连接
+    },
+    # LLM请求重试：总尝试次数为LLM_API.max_retries，退避时间在0到base_delay*2^n之间随机，
+    # 服务端返回Retry-After时以其为准；deadline为单次调用（含重试等待）的总时限（秒）
+    "retry": {
+        "base_delay": 1.0,
+        "max_delay": 30.0,
+        "deadline": 180,
+        # 熔断器：同一模型连续失败达到阈值后，recovery_timeout秒内的请求直接失败
+        "circuit_breaker": {"failure_threshold": 5, "recovery_timeout": 30},
+    },
+    # 速率限制（默认关闭）：所有会话共用各模型的RPM/TPM配额，等待中的请求按连接轮流放行
+    # 限额取自available_models中各模型的rpm/tpm，未配置时使用默认值（0为不限制）
+    "rate_limit": {
+        "enabled": False,
+        "default_rpm": 0,
+        "default_tpm": 0,
+        "notify_after": 1,  # 预计等待超过该秒数时向前端发送排队状态
+    },
+    # 多模型路由：后备模型为fallback_models，为空时使用available_models中的其他模型
+    # failover: 当前模型出错或回复不是有效JSON时依次改用后备模型
+    # hedging: 当前模型超过其延迟的percentile分位数仍未响应（流式为首个输出）时，
+    # 向下一个模型发送相同请求，先得到有效JSON的胜出，另一个请求取消
+    "routing": {
+        "fallback_models": [],
+        "failover": False,
+        "hedging": {
+            "enabled": False,
+            "percentile": 95,
+            "min_samples": 5,  # 延迟记录不足时使用initial_delay
+            "initial_delay": 10,
+            "min_delay": 1,
+        },
+    },
+    # 相同请求合并：同一类型的请求在任务运行期间重复提交（配置、模型相同）时，
+    # 复用正在运行的任务，按接口（连接类型）分别开关
+    "coalescing": {
+        "project_creation": True,
+        "AI_recommend": False,  # 重新提交通常是想要不同的推荐
+    },
+    # LLM响应缓存：相同模型、地址、消息和参数的请求直接返回缓存结果，而不是重新生成；
+    # 会改变用户看到的结果（相同输入得到相同回复），默认关闭
+    "llm_cache": {
+        "enabled": False,
+        "memory_entries": 256,  # 内存LRU容量（条）
+        "dir": ".llm_cache",  # 磁盘缓存目录，相对路径基于config.yaml所在目录
+        "ttl": 7 * 24 * 3600,  # 过期时间（秒）
+        "max_disk_mb": 128,  # 磁盘缓存总大小上限
+    },
+    # FBB IDE导入：生成的代码由后端并发上传到base_url的/import接口
+    # timeout为单个文件的超时（秒），失败的文件按退避重试max_retries次
+    "fbb": {
+        "base_url": "http://localhost:61499",
+        "concurrency": 4,
+        "timeout": 30,
+        "max_retries": 3,
+        "base_delay": 0.5,
+        "max_delay": 5.0,
+    },
     # 数据类型约束
     "data_types": {"allowed_types": ["int", "float", "bool", "string", "time"]},
     # 日志配置
@@ -1,21 +1,231 @@
 import asyncio
+import copy
+import functools
 import json
 import os
-import re
 import time
-from typing import Dict, List
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 import logging
 import openai
-from openai import AsyncOpenAI
 from dataclasses import dataclass, asdict
+from .batch_sizer import AdaptiveBatchSizer
+from .client_pool import ClientRegistry
 from .config_manager import ConfigManager
+from .context_window import REPLY_PRIMING_TOKENS, ContextWindow, get_token_estimator
+from .json_stream import StreamingJSONParser, parse_json_text
+from .llm_cache import LLMResponseCache, make_cache_key
+from .metrics import (
+    llm_json_parse_total,
+    llm_queue_wait_seconds,
+    llm_request_seconds,
+    llm_retries_total,
+    llm_tokens_total,
+    metrics,
+)
+from .rate_limiter import ModelRateLimiter
+from .retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from .routing import LatencyTracker
 
 config_manager = ConfigManager()
+# 进程内共享的LLM客户端
+client_registry = ClientRegistry()
+
+# 响应缓存及其构建参数，配置变化时重建
+llm_cache = None
+_llm_cache_settings = None
+# 用户配置文件所在目录，用于解析相对路径
+config_base_dir = None
+# 各模型的熔断器
+circuit_breakers = {}
+# 各模型的请求速率限制，所有会话共用
+rate_limiters = {}
+# 各模型的延迟记录及对冲/故障转移计数，用于多模型路由
+latency_tracker = LatencyTracker()
+routing_counters = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+# on_delta收到该值时，此前转发的部分内容作废（来自被放弃的尝试），随后的内容来自新的尝试
+STREAM_RESET = None
+
+
+def LLM_set_user_config(user_config, base_dir=None):
+    global config_manager, config_base_dir
+    config_manager.yaml_config = user_config
+    if base_dir is not None:
+        config_base_dir = Path(base_dir)
+    client_registry.pool_config = dict(config_manager.get("client_pool", {}))
 
 
-def LLM_set_user_config(user_config):
-    global config_manager
-    config_manager.yaml_config = user_config
+async def LLM_refresh_clients():
+    """
+    按最新配置重建共享客户端，正在使用的旧客户端在释放后关闭
+    """
+    await client_registry.reconcile(
+        config_manager.get("LLM_API.available_models", {}) or {}
+    )
+
+
+async def LLM_warm_up_clients():
+    """
+    启动时预热各模型的连接（需在配置中开启client_pool.warm_up）
+    """
+    if not config_manager.get("client_pool.warm_up", False):
+        return
+    await client_registry.warm_up(
+        config_manager.get("LLM_API.available_models", {}) or {},
+        timeout=config_manager.get("client_pool.connect_timeout", 10),
+    )
+
+
+async def LLM_close_clients():
+    """
+    关闭所有共享客户端
+    """
+    await client_registry.aclose()
+
+
+def get_llm_cache():
+    """
+    按当前配置获取LLM响应缓存，未启用时返回None
+    """
+    global llm_cache, _llm_cache_settings
+    if not config_manager.get("llm_cache.enabled", False):
+        return None
+
+    cache_dir = config_manager.get("llm_cache.dir")
+    if cache_dir:
+        cache_dir = Path(cache_dir)
+        if not cache_dir.is_absolute() and config_base_dir is not None:
+            cache_dir = config_base_dir / cache_dir
+    settings = (
+        config_manager.get("llm_cache.memory_entries", 256),
+        str(cache_dir) if cache_dir else None,
+        config_manager.get("llm_cache.ttl", 7 * 24 * 3600),
+        config_manager.get("llm_cache.max_disk_mb", 128),
+    )
+    if llm_cache is None or settings != _llm_cache_settings:
+        memory_entries, disk_dir, ttl, max_disk_mb = settings
+        llm_cache = LLMResponseCache(
+            memory_entries=memory_entries,
+            disk_dir=disk_dir,
+            ttl=ttl,
+            max_disk_bytes=int(max_disk_mb * 1024 * 1024),
+        )
+        _llm_cache_settings = settings
+    return llm_cache
+
+
+async def LLM_get_cache_stats():
+    """
+    获取LLM响应缓存的统计信息
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await cache.stats())}
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """
+    获取模型对应的熔断器，阈值按当前配置更新
+    """
+    breaker = circuit_breakers.get(model)
+    if breaker is None:
+        breaker = circuit_breakers[model] = CircuitBreaker(model)
+    breaker.failure_threshold = max(
+        1, config_manager.get("retry.circuit_breaker.failure_threshold", 5)
+    )
+    breaker.recovery_timeout = config_manager.get(
+        "retry.circuit_breaker.recovery_timeout", 30
+    )
+    return breaker
+
+
+def LLM_get_breaker_stats():
+    """
+    获取各模型熔断器的状态
+    """
+    return {model: breaker.snapshot() for model, breaker in circuit_breakers.items()}
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """
+    获取模型对应的速率限制器，限额取自available_models中该模型的rpm/tpm，
+    未配置时使用rate_limit.default_rpm/default_tpm（0为不限制）
+    """
+    model_config = (config_manager.get("LLM_API.available_models", {}) or {}).get(
+        model
+    ) or {}
+    rpm = model_config.get("rpm", config_manager.get("rate_limit.default_rpm", 0))
+    tpm = model_config.get("tpm", config_manager.get("rate_limit.default_tpm", 0))
+    limiter = rate_limiters.get(model)
+    if limiter is None:
+        limiter = rate_limiters[model] = ModelRateLimiter(model, rpm, tpm)
+    elif (limiter.rpm, limiter.tpm) != (rpm or 0, tpm or 0):
+        limiter.configure(rpm, tpm)
+        limiter.reschedule()
+    return limiter
+
+
+def queue_status(model: str) -> Dict:
+    """
+    模型当前的排队情况，附加在status事件中
+    """
+    if not config_manager.get("rate_limit.enabled", False):
+        return {}
+    limiter = get_rate_limiter(model)
+    return {
+        "queue_depth": limiter.waiting,
+        "expected_wait": round(limiter.expected_wait(), 1),
+    }
+
+
+# 各模型排队等待配额的请求数，导出指标时读取
+metrics.gauge(
+    "llm_queue_depth",
+    "排队等待配额的LLM请求数，按模型",
+    ("model",),
+    callback=lambda: {
+        (model,): limiter.waiting for model, limiter in rate_limiters.items()
+    },
+)
+
+
+def record_usage(model: str, step: str, usage):
+    """记录LLM返回的usage中的token数"""
+    if usage is None:
+        return
+    llm_tokens_total.inc(
+        getattr(usage, "prompt_tokens", 0) or 0, model=model, step=step, type="prompt"
+    )
+    llm_tokens_total.inc(
+        getattr(usage, "completion_tokens", 0) or 0,
+        model=model,
+        step=step,
+        type="completion",
+    )
+
+
+def LLM_get_rate_limit_stats():
+    """
+    获取各模型速率限制器的排队情况
+    """
+    return {model: limiter.stats() for model, limiter in rate_limiters.items()}
+
+
+def LLM_get_routing_stats():
+    """
+    获取多模型路由的延迟分布和对冲/故障转移计数
+    """
+    return {**routing_counters, "latency": latency_tracker.stats()}
+
+
+def is_valid_json(content: str) -> bool:
+    """判断回复中是否包含可解析的JSON"""
+    try:
+        parse_json_text(content)
+    except ValueError:
+        return False
+    return True
 
 
 def check_API_config():
@@ -41,6 +251,7 @@ class ConversationMessage:
     role: str  # "user", "assistant", "system"
     content: str
     timestamp: float = None
+    digest: str = None  # 开启上下文压缩时用于替换原文的摘要
 
     def __post_init__(self):
         if self.timestamp is None:
@@ -57,6 +268,7 @@ class LLMWithMemory:
         global config_manager
         self.config_manager = config_manager
 
+        self.model_name = self.config_manager.model
         self.api_key = self.config_manager.get_model_config().get("API_KEY")
         self.base_url = self.config_manager.get_model_config().get("base_url")
         self.default_model = self.config_manager.get_model_config().get("default_model")
@@ -67,15 +279,38 @@ class LLMWithMemory:
             "LLM_API.max_context_tokens", 6000
         )
 
-        # 对话历史
-        self.conversation_history: List[ConversationMessage] = []
+        # 对话历史，按token预算维护
+        self.conversation_history = ContextWindow(
+            max_tokens=self.max_context_tokens,
+            max_messages=self.max_history_length,
+            estimator=get_token_estimator(
+                self.config_manager.get("context_window.tokenizer", "auto")
+            ),
+        )
         self.session = None
+        # 是否使用响应缓存，可按请求关闭
+        self.use_cache = True
+        # 最近一次回复对应的缓存键（命中或写入缓存时），回复事后无法使用时据此删除
+        self.last_cache_key = None
+        # 所属连接ID，速率限制按连接轮流放行
+        self.connection_id = None
+        # 需要排队等待配额时的回调，参数为{"queue_depth", "expected_wait"}
+        self.on_queue = None
+        # 上下文压缩统计，fork出的实例共用同一份以便按会话汇总
+        self.compaction_stats = {
+            "compacted_messages": 0,
+            "prompt_tokens_saved": 0,
+            "estimated_seconds_saved": 0.0,
+        }
 
-        # 设置OpenAI API密钥
-        self.client = AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
+        # 从注册表获取共享客户端，复用连接池
+        self.client = client_registry.acquire(
+            self.model_name, self.config_manager.get_model_config()
         )
+        # fork出的实例共享客户端，不负责释放
+        self._owns_client = True
+        # 对冲/故障转移时用到的其他模型的客户端，按需获取，与fork出的实例共用
+        self._endpoints = {}
         self.client_extra_headers = self.config_manager.get_model_config().get(
             "extra_headers", {}
         )
@@ -104,8 +339,51 @@ class LLMWithMemory:
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if hasattr(self.client, "close"):
-            await self.client.close()
+        if self._owns_client:
+            await client_registry.release(self.client)
+            for endpoint in self._endpoints.values():
+                await client_registry.release(endpoint["client"])
+            self._endpoints.clear()
+
+    def _endpoint(self, model: str = None) -> Dict:
+        """获取模型的客户端及请求参数，model为None时为当前模型"""
+        if model is None or model == self.model_name:
+            return {
+                "client": self.client,
+                "default_model": self.default_model,
+                "extra_headers": self.client_extra_headers,
+                "extra_body": self.client_extra_body,
+                "extra_query": self.client_extra_query,
+            }
+        endpoint = self._endpoints.get(model)
+        if endpoint is None:
+            model_config = self.config_manager.get_model_config(model)
+            endpoint = self._endpoints[model] = {
+                "client": client_registry.acquire(model, model_config),
+                "default_model": model_config.get("default_model"),
+                "extra_headers": model_config.get("extra_headers", {}),
+                "extra_body": model_config.get("extra_body", {}),
+                "extra_query": model_config.get("extra_query", {}),
+            }
+        return endpoint
+
+    def _fallback_models(self) -> List[str]:
+        """当前模型之后依次尝试的模型"""
+        models = self.config_manager.get("routing.fallback_models") or list(
+            self.config_manager.get("LLM_API.available_models", {}) or {}
+        )
+        return [model for model in models if model != self.model_name]
+
+    def fork(self, extra_messages: List[ConversationMessage] = None) -> "LLMWithMemory":
+        """
+        复制当前对话上下文，返回共享同一客户端的新实例
+        extra_messages会追加到副本的历史末尾（如尚未完成的上一轮对话）
+        """
+        forked = copy.copy(self)
+        forked.conversation_history = self.conversation_history.copy()
+        forked.conversation_history.extend(extra_messages or [])
+        forked._owns_client = False
+        return forked
 
     def add_system_message(self, content: str):
         """添加系统消息（用于设置角色和规则）"""
@@ -115,7 +393,7 @@ class LLMWithMemory:
 
     def clear_history(self):
         """清空对话历史"""
-        self.conversation_history = []
+        self.conversation_history.clear()
         self.logger.info("对话历史已清空")
 
     def get_history_summary(self) -> str:
@@ -131,34 +409,46 @@ class LLMWithMemory:
             )
         return summary
 
-    def _trim_history(self):
-        """修剪历史记录，保持在限制范围内"""
-        # 估算token数（粗略估算：1个中文字符约等于2个token）
-        total_tokens = sum(len(msg.content) * 2 for msg in self.conversation_history)
-
-        # 如果超出限制，从最早的消息开始删除（但保留系统消息）
-        while (
-            len(self.conversation_history) > self.max_history_length
-            or total_tokens > self.max_context_tokens
-        ) and len(self.conversation_history) > 1:
-
-            # 找到第一个非系统消息并删除
-            for i, msg in enumerate(self.conversation_history):
-                if msg.role != "system":
-                    removed_msg = self.conversation_history.pop(i)
-                    total_tokens -= len(removed_msg.content) * 2
-                    break
-            else:
-                # 如果只剩系统消息，删除最早的一条
-                if len(self.conversation_history) > 1:
-                    removed_msg = self.conversation_history.pop(0)
-                    total_tokens -= len(removed_msg.content) * 2
-                break
+    def _trim_history(self, reserve_tokens: int = 0):
+        """修剪历史记录，为即将发送的新消息预留reserve_tokens"""
+        evicted = self.conversation_history.fit(reserve_tokens)
+        if evicted:
+            self.logger.info(
+                f"已淘汰 {len(evicted)} 条最早的历史消息，"
+                f"当前上下文约 {self.conversation_history.total_tokens} tokens"
+            )
+
+    def _compact_history(self):
+        """开启上下文压缩时，将较早的对话替换为摘要并累计节省的token数"""
+        compaction = self.config_manager.get("context_window.compaction", {}) or {}
+        if not compaction.get("enabled", False):
+            return
+        compacted = self.conversation_history.compact(
+            compaction.get("threshold_tokens", 3000),
+            compaction.get("keep_recent", 2),
+        )
+        saved = self.conversation_history.compacted_savings
+        stats = self.compaction_stats
+        stats["compacted_messages"] += compacted
+        stats["prompt_tokens_saved"] += saved
+        stats["estimated_seconds_saved"] = round(
+            stats["estimated_seconds_saved"]
+            + saved / compaction.get("prefill_tokens_per_second", 1000),
+            3,
+        )
+        if compacted:
+            self.logger.info(
+                f"已压缩 {compacted} 条历史消息，本次请求少发送约 {saved} tokens"
+            )
 
     def _build_messages_for_api(self, new_user_message: str) -> List[Dict]:
         """构建发送给API的消息列表"""
-        # 先修剪历史
-        self._trim_history()
+        # 先压缩再修剪历史，预算包含新消息和回复开头的开销
+        self._compact_history()
+        self._trim_history(
+            self.conversation_history.message_tokens(new_user_message)
+            + REPLY_PRIMING_TOKENS
+        )
 
         # 构建消息列表
         messages = []
@@ -175,9 +465,23 @@ class LLMWithMemory:
         user_message: str,
         temperature: float = None,
         max_tokens: int = None,
-    ) -> str:
+        on_delta: Callable[[str], None] = None,
+        use_cache: bool = None,
+        user_digest: str = None,
+        reply_digest: Callable[[str], str] = None,
+        expect_json: bool = False,
+        step: str = "other",
+        return_finish_reason: bool = False,
+    ):
         """
         带记忆的对话功能
+        传入on_delta时以流式方式调用API，并将部分内容回调给调用方，
+        重试或改用其他模型的回复时先回调STREAM_RESET，调用方应丢弃此前收到的部分内容
+        use_cache为None时使用实例的use_cache设置
+        user_digest/reply_digest为上下文压缩时本轮提问和回复的摘要（及其生成函数）
+        expect_json为True时，对冲/故障转移只接受包含有效JSON的回复
+        step为生成步骤（device_list、device_detail、ai_recommend），用于指标
+        return_finish_reason为True时返回(回复, 结束原因)，"length"表示回复被截断，命中缓存时为None
         """
         try:
             # 设置默认参数
@@ -192,80 +496,443 @@ class LLMWithMemory:
             messages = self._build_messages_for_api(user_message)
 
             # 调用API
-            response = await self._call_api(messages, temperature, max_tokens)
+            response, finish_reason = await self._call_api_cached(
+                messages,
+                temperature,
+                max_tokens,
+                on_delta=on_delta,
+                use_cache=self.use_cache if use_cache is None else use_cache,
+                validate=is_valid_json if expect_json else None,
+                step=step,
+            )
 
             # 保存用户消息和助手回复到历史
+            compaction_enabled = self.config_manager.get(
+                "context_window.compaction.enabled", False
+            )
             self.conversation_history.append(
-                ConversationMessage(role="user", content=user_message)
+                ConversationMessage(
+                    role="user",
+                    content=user_message,
+                    digest=user_digest if compaction_enabled else None,
+                )
             )
             self.conversation_history.append(
-                ConversationMessage(role="assistant", content=response)
+                ConversationMessage(
+                    role="assistant",
+                    content=response,
+                    digest=(
+                        reply_digest(response)
+                        if compaction_enabled and reply_digest
+                        else None
+                    ),
+                )
             )
 
             self.logger.info(
                 f"对话完成，当前历史记录数: {len(self.conversation_history)}"
             )
+            if return_finish_reason:
+                return response, finish_reason
             return response
 
         except Exception as e:
             self.logger.error(f"对话失败: {e}")
             raise e
 
+    async def _call_api_cached(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        on_delta: Callable[[str], None] = None,
+        use_cache: bool = True,
+        validate: Callable[[str], bool] = None,
+        step: str = "other",
+    ) -> Tuple[str, Optional[str]]:
+        """
+        先查询响应缓存，未命中时调用API并写入缓存，返回(回复, 结束原因)
+        传入validate时，未通过校验的回复不写入缓存，缓存中未通过校验的回复视为未命中；
+        缓存键按当前模型计算，只缓存当前模型的回复，不缓存后备模型或对冲请求的回复
+        """
+        self.last_cache_key = None
+        cache = get_llm_cache()
+        if cache is None or not use_cache:
+            if cache is not None:
+                cache.record_bypass()
+            content, _, finish_reason = await self._call_api_routed(
+                messages, temperature, max_tokens, on_delta, validate, step
+            )
+            return content, finish_reason
+
+        key = make_cache_key(
+            self.default_model, self.base_url, messages, temperature, max_tokens
+        )
+        content = await cache.get(key)
+        if content is not None and (validate is None or validate(content)):
+            self.logger.info(f"命中响应缓存，响应内容长度: {len(content)} 字符")
+            self.last_cache_key = key
+            if on_delta:
+                on_delta(content)
+            return content, None
+
+        content, model, finish_reason = await self._call_api_routed(
+            messages, temperature, max_tokens, on_delta, validate, step
+        )
+        # 其他模型的回复、被截断或未通过校验的回复不写入缓存
+        if (
+            model == self.model_name
+            and finish_reason != "length"
+            and (validate is None or validate(content))
+        ):
+            await cache.put(key, content)
+            self.last_cache_key = key
+        return content, finish_reason
+
+    async def discard_cached_reply(self):
+        """删除最近一次回复的缓存项，回复事后被发现无法使用（如JSON提取失败）时调用"""
+        key, self.last_cache_key = self.last_cache_key, None
+        cache = get_llm_cache()
+        if key is not None and cache is not None:
+            await cache.remove(key)
+
     async def _call_api(
         self,
         messages: List[Dict],
         temperature: float,
         max_tokens: int,
         max_retries: int = None,
-    ) -> str:
-        """调用LLM API"""
-        max_retries = max_retries or self.config_manager.get("LLM_API.max_retries", 3)
-
-        for attempt in range(max_retries):
-            try:
-                response = await self.client.chat.completions.create(
-                    model=self.default_model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    extra_headers=self.client_extra_headers,
-                    extra_body=self.client_extra_body,
-                    extra_query=self.client_extra_query,
+        on_delta: Callable[[str], None] = None,
+        model: str = None,
+        step: str = "other",
+    ) -> Tuple[str, Optional[str]]:
+        """
+        调用LLM API，按重试策略重试，熔断器打开时直接失败，返回(回复, 结束原因)
+        model为None时使用当前模型
+        """
+        model = model or self.model_name
+        endpoint = self._endpoint(model)
+        policy = RetryPolicy(
+            max_retries=max_retries
+            or self.config_manager.get("LLM_API.max_retries", 3),
+            base_delay=self.config_manager.get("retry.base_delay", 1.0),
+            max_delay=self.config_manager.get("retry.max_delay", 30.0),
+            deadline=self.config_manager.get("retry.deadline"),
+        )
+        stream = on_delta is not None and self.config_manager.get(
+            "streaming.enabled", False
+        )
+        # 延迟从最后一次尝试获得配额后开始计算，不含排队和重试等待
+        started = [time.monotonic()]
+        call_started = started[0]
+        first_delta = []
+        # 本次尝试是否已转发部分内容
+        forwarded = [False]
+
+        def timed_on_delta(text):
+            if not first_delta:
+                first_delta.append(time.monotonic())
+                latency_tracker.record(model, first_delta[0] - started[0])
+            forwarded[0] = True
+            on_delta(text)
+
+        async def attempt():
+            if forwarded[0]:
+                # 上一次尝试已转发的部分内容作废
+                forwarded[0] = False
+                on_delta(STREAM_RESET)
+            await self._wait_for_quota(model, messages, max_tokens)
+            started[0] = time.monotonic()
+            if stream:
+                return await self._call_api_stream(
+                    messages,
+                    temperature,
+                    max_tokens,
+                    timed_on_delta,
+                    endpoint,
+                    on_usage=lambda usage: record_usage(model, step, usage),
                 )
+            response = await endpoint["client"].chat.completions.create(
+                model=endpoint["default_model"],
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra_headers=endpoint["extra_headers"],
+                extra_body=endpoint["extra_body"],
+                extra_query=endpoint["extra_query"],
+            )
+            record_usage(model, step, response.usage)
+            choice = response.choices[0]
+            return choice.message.content.strip(), choice.finish_reason
+
+        def on_retry(failures, e, delay):
+            rate_limited = isinstance(e, openai.RateLimitError)
+            llm_retries_total.inc(
+                model=model, reason="rate_limit" if rate_limited else "api_error"
+            )
+            kind = "频率限制" if rate_limited else "API错误"
+            self.logger.warning(
+                f"{kind} (尝试 {failures}/{policy.max_retries})，{delay:.1f} 秒后重试: {str(e)}"
+            )
 
-                content = response.choices[0].message.content.strip()
-                self.logger.info(f"API调用成功，响应内容长度: {len(content)} 字符")
-                return content
+        outcome = "error"
+        try:
+            content, finish_reason = await policy.run(
+                attempt,
+                breaker=get_circuit_breaker(model),
+                on_retry=on_retry,
+            )
+            outcome = "success"
+        except asyncio.CancelledError:
+            # 对冲请求中落后的请求被取消
+            outcome = "cancelled"
+            raise
+        except CircuitOpenError as e:
+            self.logger.error(str(e))
+            raise Exception(f"API调用失败: {str(e)}")
+        except openai.RateLimitError as e:
+            self.logger.error(f"频率限制: {str(e)}")
+            raise Exception(f"频率限制: {str(e)}")
+        except Exception as e:
+            self.logger.error(f"API调用失败: {str(e)}")
+            raise Exception(f"API调用失败: {str(e)}")
+        finally:
+            llm_request_seconds.observe(
+                time.monotonic() - call_started, model=model, step=step, outcome=outcome
+            )
 
-            except openai.RateLimitError as e:
-                self.logger.warning(
-                    f"频率限制 (尝试 {attempt + 1}/{max_retries}): {str(e)}"
-                )
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2**attempt)
-                    continue
-                else:
-                    raise Exception(f"频率限制: {str(e)}")
+        if not stream:
+            latency_tracker.record(model, time.monotonic() - started[0])
+        self.logger.info(f"API调用成功，响应内容长度: {len(content)} 字符")
+        return content, finish_reason
+
+    async def _wait_for_quota(self, model: str, messages: List[Dict], max_tokens: int):
+        """按模型的RPM/TPM限额排队，预计等待较久时通过on_queue通知调用方"""
+        if not self.config_manager.get("rate_limit.enabled", False):
+            return
+        limiter = get_rate_limiter(model)
+        # TPM按提示词token数加上max_tokens计算
+        tokens = (
+            sum(
+                self.conversation_history.message_tokens(msg["content"])
+                for msg in messages
+            )
+            + REPLY_PRIMING_TOKENS
+            + (max_tokens or 0)
+        )
+        expected_wait = limiter.expected_wait(tokens)
+        if self.on_queue and expected_wait >= self.config_manager.get(
+            "rate_limit.notify_after", 1
+        ):
+            self.on_queue(
+                {
+                    "queue_depth": limiter.waiting,
+                    "expected_wait": round(expected_wait, 1),
+                }
+            )
+        waited = await limiter.acquire(self.connection_id or "default", tokens)
+        llm_queue_wait_seconds.observe(waited or 0, model=model)
+        if waited:
+            self.logger.info(f"模型 {model} 排队等待配额 {waited:.1f} 秒")
 
-            except openai.APIError as e:
-                self.logger.error(
-                    f"API错误 (尝试 {attempt + 1}/{max_retries}): {str(e)}"
+    async def _call_api_routed(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        on_delta: Callable[[str], None] = None,
+        validate: Callable[[str], bool] = None,
+        step: str = "other",
+    ) -> Tuple[str, str, Optional[str]]:
+        """
+        按路由配置调用API，返回(回复, 给出回复的模型, 结束原因)
+        failover: 当前模型出错（或回复未通过validate）时依次改用后备模型
+        hedging: 当前模型超过其延迟分位数仍未响应时，向下一个模型发送相同请求，
+        先得到有效回复的胜出，其余请求取消。流式输出只转发最先开始输出的请求，
+        该请求失败时才改用其他请求的结果
+        """
+        routing = self.config_manager.get("routing", {}) or {}
+        hedging = routing.get("hedging", {}) or {}
+        hedge_enabled = hedging.get("enabled", False)
+        failover = routing.get("failover", False)
+        fallbacks = self._fallback_models() if failover or hedge_enabled else []
+        if not fallbacks:
+            content, finish_reason = await self._call_api(
+                messages, temperature, max_tokens, on_delta=on_delta, step=step
+            )
+            return content, self.model_name, finish_reason
+
+        pending = [self.model_name] + fallbacks
+        running: Dict[asyncio.Task, str] = {}
+        # 占用流式输出的模型
+        streaming_model = []
+        errors = []
+        # 等待占用流式输出的请求时暂存的有效回复，及第一个未通过校验的回复
+        backup = None
+        invalid = None
+        hedge_at = None
+        hedged = False
+
+        def on_model_delta(model, text):
+            if not streaming_model:
+                streaming_model.append(model)
+            if streaming_model[0] == model:
+                on_delta(text)
+
+        def launch():
+            model = pending.pop(0)
+            task = asyncio.create_task(
+                self._call_api(
+                    messages,
+                    temperature,
+                    max_tokens,
+                    on_delta=(
+                        functools.partial(on_model_delta, model) if on_delta else None
+                    ),
+                    model=model,
+                    step=step,
                 )
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(1)
-                    continue
-                else:
-                    raise Exception(f"API调用失败: {str(e)}")
+            )
+            running[task] = model
+
+        def finish(model, content, finish_reason):
+            if model != self.model_name:
+                routing_counters["hedge_wins" if hedged else "failovers"] += 1
+                self.logger.info(f"采用模型 {model} 的回复")
+            if on_delta and streaming_model and streaming_model[0] != model:
+                # 已转发的部分内容来自失败的请求，作废后补发完整结果
+                on_delta(STREAM_RESET)
+                on_delta(content)
+            return content, model, finish_reason
+
+        launch()
+        if hedge_enabled and pending:
+            delay = latency_tracker.percentile(
+                self.model_name, hedging.get("percentile", 95)
+            )
+            if latency_tracker.count(self.model_name) < hedging.get("min_samples", 5):
+                delay = hedging.get("initial_delay", 10)
+            hedge_at = time.monotonic() + max(hedging.get("min_delay", 1), delay)
 
-            except Exception as e:
-                self.logger.error(
-                    f"未知错误 (尝试 {attempt + 1}/{max_retries}): {str(e)}"
+        try:
+            while running:
+                timeout = None
+                if hedge_at is not None and pending:
+                    timeout = max(0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
                 )
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(1)
+                if not done:
+                    hedge_at = None
+                    if not streaming_model:
+                        # 当前模型在延迟分位数内仍未响应
+                        hedged = True
+                        routing_counters["hedged"] += 1
+                        self.logger.info(
+                            f"模型 {self.model_name} 响应较慢，发送对冲请求"
+                        )
+                        launch()
                     continue
-                else:
-                    raise Exception(f"API调用失败: {str(e)}")
+
+                for task in done:
+                    model = running.pop(task)
+                    try:
+                        content, finish_reason = task.result()
+                    except Exception as e:
+                        errors.append(f"{model}: {e}")
+                        continue
+                    if validate is not None and not validate(content):
+                        errors.append(f"{model}: 回复不是有效的JSON")
+                        invalid = invalid or (model, content, finish_reason)
+                        continue
+                    if streaming_model and streaming_model[0] in running.values():
+                        # 流式输出由仍在进行的请求占用，等待其完成
+                        backup = backup or (model, content, finish_reason)
+                        continue
+                    return finish(model, content, finish_reason)
+
+                if backup and not (
+                    streaming_model and streaming_model[0] in running.values()
+                ):
+                    return finish(*backup)
+                if not running and failover and pending:
+                    self.logger.warning(f"模型调用失败，尝试后备模型 {pending[0]}")
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        if backup:
+            return finish(*backup)
+        if invalid:
+            # 没有有效回复时返回最先得到的回复，由调用方解析并报错
+            return finish(*invalid)
+        raise Exception("API调用失败: " + "; ".join(errors))
+
+    async def _call_api_stream(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        on_delta: Callable[[str], None],
+        endpoint: Dict = None,
+        on_usage: Callable = None,
+    ) -> Tuple[str, Optional[str]]:
+        """
+        以流式方式调用LLM API，按配置节流转发部分内容，返回(完整内容, 结束原因)
+        服务端在流中返回usage时回调on_usage（streaming.include_usage开启时显式请求）
+        """
+        min_chunk_chars = self.config_manager.get("streaming.min_chunk_chars", 32)
+        min_interval = self.config_manager.get("streaming.min_interval", 0.2)
+
+        endpoint = endpoint or self._endpoint()
+        options = {}
+        if self.config_manager.get("streaming.include_usage", False):
+            options["stream_options"] = {"include_usage": True}
+        response = await endpoint["client"].chat.completions.create(
+            model=endpoint["default_model"],
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            extra_headers=endpoint["extra_headers"],
+            extra_body=endpoint["extra_body"],
+            extra_query=endpoint["extra_query"],
+            **options,
+        )
+
+        parts = []
+        pending = []
+        pending_chars = 0
+        last_flush = time.monotonic()
+        finish_reason = None
+        async for chunk in response:
+            if on_usage and getattr(chunk, "usage", None):
+                on_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            pending.append(delta)
+            pending_chars += len(delta)
+
+            now = time.monotonic()
+            if pending_chars >= min_chunk_chars or now - last_flush >= min_interval:
+                on_delta("".join(pending))
+                pending = []
+                pending_chars = 0
+                last_flush = now
+
+        if pending:
+            on_delta("".join(pending))
+
+        return "".join(parts).strip(), finish_reason
 
     def save_conversation(self, filepath: str):
         """保存对话历史到文件"""
@@ -290,7 +957,7 @@ class LLMWithMemory:
             with open(filepath, "r", encoding="utf-8") as f:
                 conversation_data = json.load(f)
 
-            self.conversation_history = []
+            self.conversation_history.clear()
             for msg_dict in conversation_data.get("messages", []):
                 message = ConversationMessage(**msg_dict)
                 self.conversation_history.append(message)
@@ -308,12 +975,16 @@ class LLMWithMemory:
 class AI_Assistant:
     """设备配置生成助手"""
 
-    def __init__(self, model: str = None):
+    def __init__(
+        self, model: str = None, use_cache: bool = True, connection_id: str = None
+    ):
         global config_manager
         self.config_manager = config_manager
         config_manager.set_LLM(model)
 
         self.client = LLMWithMemory()
+        self.client.use_cache = use_cache
+        self.client.connection_id = connection_id
 
         # 设置系统提示
         system_prompt = self.config_manager.get("prompts.system_prompt")
@@ -326,7 +997,15 @@ class AI_Assistant:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.client.__aexit__(exc_type, exc_val, exc_tb)
 
-    async def generate_device_list(self, prompt_1: str) -> str:
+    def fork(self, extra_messages: List[ConversationMessage] = None) -> "AI_Assistant":
+        """复制当前助手及其对话上下文，用于并发生成"""
+        forked = copy.copy(self)
+        forked.client = self.client.fork(extra_messages)
+        return forked
+
+    async def generate_device_list(
+        self, prompt_1: str, on_delta: Callable[[str], None] = None
+    ) -> str:
         """第一步：生成设备配置列表"""
         temperature = self.config_manager.get(
             "device_assistant.temperature.device_list"
@@ -334,12 +1013,20 @@ class AI_Assistant:
         max_tokens = self.config_manager.get("device_assistant.max_tokens.device_list")
 
         response = await self.client.chat_with_memory(
-            user_message=prompt_1, temperature=temperature, max_tokens=max_tokens
+            user_message=prompt_1,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            on_delta=on_delta,
+            expect_json=True,
+            step="device_list",
         )
         return response
 
     async def generate_device_detail(
-        self, device_name: str, prompt_2_template: str
+        self,
+        device_name: str,
+        prompt_2_template: str,
+        on_delta: Callable[[str], None] = None,
     ) -> str:
         """第二步：为单个设备生成详细配置"""
         temperature = self.config_manager.get(
@@ -364,10 +1051,57 @@ class AI_Assistant:
 """
 
         response = await self.client.chat_with_memory(
-            user_message=detail_prompt, temperature=temperature, max_tokens=max_tokens
+            user_message=detail_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            on_delta=on_delta,
+            user_digest=f'请为设备"{device_name}"生成详细配置。',
+            reply_digest=summarize_device_detail,
+            expect_json=True,
+            step="device_detail",
         )
         return response
 
+    async def generate_device_details_batch(
+        self,
+        device_names: List[str],
+        prompt_2_template: str,
+        max_tokens: int,
+        on_delta: Callable[[str], None] = None,
+    ) -> Tuple[str, Optional[str]]:
+        """第二步（批量模式）：一次请求为一组设备生成详细配置，返回(JSON数组, 结束原因)"""
+        temperature = self.config_manager.get(
+            "device_assistant.temperature.device_detail"
+        )
+        names = "、".join(f'设备"{name}"' for name in device_names)
+
+        detail_prompt = f"""
+现在请为以下一组设备分别生成详细配置：{names}。
+
+{prompt_2_template}
+
+重要：
+1. 请基于我们之前讨论的设备列表中关于这些设备的信息
+2. 按上面列出的顺序为每个设备生成完整的JSON配置，name字段填写对应的设备名称
+3. 将所有配置放在一个JSON数组中返回，数组元素个数与设备个数一致
+4. 不要包含这组设备以外的设备
+
+请直接返回JSON数组：
+"""
+
+        response, finish_reason = await self.client.chat_with_memory(
+            user_message=detail_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            on_delta=on_delta,
+            user_digest=f"请为以下一组设备分别生成详细配置：{names}。",
+            reply_digest=summarize_device_detail,
+            expect_json=True,
+            step="device_detail",
+            return_finish_reason=True,
+        )
+        return response, finish_reason
+
     def get_conversation_summary(self) -> str:
         """获取对话摘要"""
         return self.client.get_history_summary()
@@ -381,69 +1115,350 @@ class AI_Assistant:
         self.client.load_conversation(filepath)
 
 
-def extract_and_parse_json(content: str) -> Dict | List:
+def summarize_device_detail(content: str) -> str:
     """
-    从AI响应中提取并解析JSON内容
+    生成设备详细配置回复的摘要，只保留设备名和接口名，
+    省略ECC、算法等大段内容；批量回复逐个设备摘要；无法解析时返回None（不压缩）
     """
-    # 去除前后空白字符
-    content = content.strip()
-
-    # 方法1: 直接尝试解析（如果内容就是纯JSON）
     try:
-        data = json.loads(content)
-        print("✅ 直接解析成功")
-        return data
-    except json.JSONDecodeError:
-        print("❌ 直接解析失败，尝试提取JSON内容...")
-
-    # 方法2: 提取```json代码块中的内容
-    json_match = re.search(r"```json\s*\n(.*?)\n```", content, re.DOTALL)
-    if json_match:
-        json_content = json_match.group(1).strip()
-        try:
-            data = json.loads(json_content)
-            print("✅ 从代码块中提取JSON成功")
-            return data
-        except json.JSONDecodeError:
-            print("❌ 代码块中的JSON格式有误")
-
-    # 方法3: 查找数组或对象的JSON内容
-    # 寻找以 [ 或 { 开始的内容
-    start_idx = -1
-    for i, char in enumerate(content):
-        if char in ["{", "["]:
-            start_idx = i
-            break
-
-    if start_idx == -1:
-        raise ValueError("未找到有效的JSON内容")
-
-    # 找到对应的结束位置
-    bracket_count = 0
-    start_bracket = content[start_idx]
-    end_bracket = "}" if start_bracket == "{" else "]"
-    end_idx = -1
-
-    for i in range(start_idx, len(content)):
-        char = content[i]
-        if char == start_bracket:
-            bracket_count += 1
-        elif char == end_bracket:
-            bracket_count -= 1
-            if bracket_count == 0:
-                end_idx = i
+        data = parse_json_text(content)
+    except ValueError:
+        return None
+    configs = data if isinstance(data, list) else [data]
+    if not configs or not all(isinstance(config, dict) for config in configs):
+        return None
+    interfaces = []
+    for config in configs:
+        interface = {"name": config.get("name")}
+        for key in ["signal_input", "signal_output", "var_input", "var_output"]:
+            interface[key] = [
+                item.get("name")
+                for item in config.get(key, [])
+                if isinstance(item, dict)
+            ]
+        interfaces.append(interface)
+    summary = interfaces if isinstance(data, list) else interfaces[0]
+    return "已生成该设备的配置，接口摘要：" + json.dumps(summary, ensure_ascii=False)
+
+
+class DeviceDetailPool:
+    """
+    设备详细配置生成池
+    并发模式下每个设备使用设备列表阶段对话上下文的独立副本，结果按加入顺序保存在futures中
+    传入sizer时开启批量模式，工作协程一次取出多个设备合并为一个请求，
+    批量回复中缺失的设备（截断或格式错误）回退为单设备请求
+    """
+
+    def __init__(
+        self,
+        assistant: AI_Assistant,
+        detail_template: str,
+        concurrency=1,
+        on_delta: Callable[[str, str], None] = None,
+        sizer: AdaptiveBatchSizer = None,
+    ):
+        self.assistant = assistant
+        self.detail_template = detail_template
+        self.concurrency = max(1, int(concurrency or 1))
+        # 流式回调，参数为(设备名, 部分内容)
+        self.on_delta = on_delta
+        self.sizer = sizer
+        self.logger = logging.getLogger(__name__)
+        self.devices: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        # reset时取消的工作协程，aclose时等待其结束
+        self._cancelled: List[asyncio.Task] = []
+        if self.concurrency > 1 and assistant.config_manager.get(
+            "context_window.compaction.enabled", False
+        ):
+            # 各设备的上下文副本中不会累积详细配置对话
+            self.logger.warning("设备详细配置并发生成，上下文压缩不起作用")
+
+    @property
+    def finished(self) -> int:
+        """已完成（成功或失败）的设备数"""
+        return sum(1 for future in self.futures if future.done())
+
+    def add(self, device: str, base: AI_Assistant = None) -> asyncio.Future:
+        """
+        加入一个待生成的设备
+        base为该设备使用的上下文副本，默认在开始生成时从assistant复制
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.devices.append(device)
+        self.futures.append(future)
+        self._queue.put_nowait((device, base, future))
+        return future
+
+    def start(self):
+        """启动工作协程"""
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def reset(self):
+        """
+        作废已加入的全部设备（如提前开始的设备来自被放弃的设备列表尝试），
+        取消进行中的生成，并以空队列重新启动工作协程
+        """
+        for worker in self._workers:
+            worker.cancel()
+        for future in self.futures:
+            future.cancel()
+        self._cancelled.extend(self._workers)
+        self._workers = []
+        self.devices = []
+        self.futures = []
+        self._queue = asyncio.Queue()
+        self.start()
+
+    def close(self):
+        """不再加入新设备，工作协程处理完队列后退出"""
+        for _ in range(self.concurrency):
+            self._queue.put_nowait(None)
+
+    async def aclose(self):
+        """取消未完成的工作并回收资源"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, *self._cancelled, return_exceptions=True)
+        for future in self.futures:
+            if not future.done():
+                future.cancel()
+            elif not future.cancelled():
+                # 标记异常已被读取，避免事件循环告警
+                future.exception()
+
+    def _assistant_for(self, base: AI_Assistant = None) -> AI_Assistant:
+        # 顺序模式沿用原助手（共享历史），并发模式使用独立的上下文副本
+        if base is not None:
+            return base
+        if self.concurrency > 1:
+            return self.assistant.fork()
+        return self.assistant
+
+    def _take_batch(self, first) -> List:
+        """以first开头，从队列中再取出已就绪的设备组成一批"""
+        batch = [first]
+        size = self.sizer.next_size(self._queue.qsize() + 1, self.concurrency)
+        while len(batch) < size and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is None:
+                # 结束标记放回队列，此后队列中只剩结束标记
+                self._queue.put_nowait(None)
                 break
+            batch.append(item)
+        return batch
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item] if self.sizer is None else self._take_batch(item)
+            if len(batch) > 1:
+                batch = await self._generate_batch(batch)
+            for device, base, future in batch:
+                await self._generate_single(device, base, future)
+
+    async def _generate_batch(self, batch: List) -> List:
+        """
+        批量生成一组设备的配置，数组元素一闭合就设置对应设备的结果
+        返回未得到结果、需要回退为单设备请求的设备
+        """
+        devices = [device for device, _, _ in batch]
+        matched = [False] * len(batch)
+        # 提前开始的设备按顺序加入，最后一个设备的上下文包含前面所有设备
+        assistant = self._assistant_for(batch[-1][1])
+        parser = StreamingJSONParser()
+
+        def resolve(items: List, first: int):
+            for position, item in enumerate(items, first):
+                if not isinstance(item, dict):
+                    continue
+                idx = next(
+                    (
+                        i
+                        for i, device in enumerate(devices)
+                        if not matched[i] and device == item.get("name")
+                    ),
+                    None,
+                )
+                if idx is None and position < len(batch) and not matched[position]:
+                    # 设备名与列表不一致时按位置对应
+                    idx = position
+                if idx is None:
+                    continue
+                matched[idx] = True
+                future = batch[idx][2]
+                if not future.done():
+                    future.set_result(item)
+
+        def feed(stream_parser: StreamingJSONParser, text: str):
+            try:
+                items = stream_parser.feed(text)
+            except ValueError as e:
+                # 格式错误时只保留已解析的元素，完整回复到达后再统一解析并报告
+                self.logger.debug(f"批量回复流式解析失败: {e}")
+                return
+            resolve(items, len(stream_parser.item_ends) - len(items))
+
+        def on_delta(text):
+            nonlocal parser
+            if text is STREAM_RESET:
+                # 重新尝试时从头解析；已得到结果的设备配置本身完整有效，保留
+                parser = StreamingJSONParser()
+                if self.on_delta:
+                    for device, done in zip(devices, matched):
+                        if not done:
+                            self.on_delta(device, STREAM_RESET)
+                return
+            if self.on_delta:
+                current = next(
+                    (d for d, done in zip(devices, matched) if not done), devices[-1]
+                )
+                self.on_delta(current, text)
+            feed(parser, text)
+
+        size = len(batch)
+        try:
+            response, finish_reason = await assistant.generate_device_details_batch(
+                devices,
+                self.detail_template,
+                self.sizer.max_tokens_for(size),
+                on_delta=on_delta,
+            )
+        except Exception as e:
+            self.logger.warning(f"批量生成设备配置失败，回退为单设备请求: {e}")
+            self.sizer.record(size, sum(matched), True, 0)
+            return [item for item, done in zip(batch, matched) if not done]
+
+        # 解析完整回复（未以流式返回，或流式解析因格式错误中断时补上其余设备）
+        try:
+            data = parse_json_text(response)
+        except ValueError as e:
+            self.logger.warning(f"批量回复JSON解析失败，仅保留流式解析出的设备: {e}")
+        else:
+            resolve(data if isinstance(data, list) else [data], 0)
+        completed = sum(matched)
+        truncated = finish_reason == "length" or completed < size
+        self.sizer.record(
+            size,
+            completed,
+            truncated,
+            assistant.client.conversation_history.estimator(response),
+        )
+        leftovers = [item for item, done in zip(batch, matched) if not done]
+        if leftovers:
+            await assistant.client.discard_cached_reply()
+            print(
+                f"send:批量回复缺少 {len(leftovers)}/{size} 个设备，回退为单设备请求:",
+                [device for device, _, _ in leftovers],
+            )
+        return leftovers
+
+    async def _generate_single(self, device: str, base, future: asyncio.Future):
+        if future.done():
+            return
+        assistant = self._assistant_for(base)
+        try:
+            detail_response = await assistant.generate_device_detail(
+                device,
+                self.detail_template,
+                on_delta=(
+                    functools.partial(self.on_delta, device) if self.on_delta else None
+                ),
+            )
+            device_config = extract_and_parse_json(detail_response)
+        except Exception as e:
+            await assistant.client.discard_cached_reply()
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(device_config)
 
-    if end_idx == -1:
-        raise ValueError("JSON格式不完整")
 
-    json_content = content[start_idx : end_idx + 1]
-    data = json.loads(json_content)
+def extract_and_parse_json(content: str) -> Dict | List:
+    """
+    从AI响应中提取并解析JSON内容
+    一次扫描跳过JSON前后的说明文字和代码块标记
+    """
+    try:
+        data = parse_json_text(content)
+    except Exception:
+        llm_json_parse_total.inc(result="failure")
+        raise
+    llm_json_parse_total.inc(result="success")
     print("✅ 提取JSON内容成功")
     return data
 
 
-async def LLM_generate_block_categories(config_manager, user_input, model):
+def queue_event(info: Dict, progress: int) -> Dict:
+    """构造排队等待配额的状态事件，进度保持不变"""
+    return {
+        "event": "status",
+        "data": json.dumps(
+            {
+                "message": f"LLM请求排队中，前方 {info['queue_depth']} 个请求，预计等待 {info['expected_wait']} 秒...",
+                "progress": progress,
+                **info,
+            },
+            ensure_ascii=False,
+        ),
+    }
+
+
+def delta_event(step: str, content: str, device: str = None) -> Dict:
+    """
+    构造流式部分内容事件
+    content为STREAM_RESET时构造重置事件（reset为true），客户端应丢弃该步骤（及设备）此前收到的部分内容
+    """
+    if content is STREAM_RESET:
+        payload = {"step": step, "reset": True}
+    else:
+        payload = {"step": step, "content": content}
+    if device is not None:
+        payload["device"] = device
+    return {"event": "delta", "data": json.dumps(payload, ensure_ascii=False)}
+
+
+async def cancel_task(task: asyncio.Task):
+    """取消尚未完成的任务并等待其结束"""
+    if task is None or task.done():
+        return
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def forward_events_until(waitable, events: asyncio.Queue):
+    """
+    等待任务或future完成，期间转发事件队列中的事件
+    调用方在迭代结束后通过waitable.result()取得结果
+    """
+    getter = None
+    try:
+        while True:
+            while not events.empty():
+                yield events.get_nowait()
+            if waitable.done():
+                return
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({waitable, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+            getter = None
+    finally:
+        if getter is not None:
+            getter.cancel()
+
+
+async def LLM_generate_block_categories(
+    config_manager, user_input, model, use_cache=True, connection_id=None, **kwargs
+):
     user_input = json.loads(user_input)
 
     prompt_parts = [
@@ -465,11 +1480,85 @@ async def LLM_generate_block_categories(config_manager, user_input, model):
     # 你的提示词
     PROMPT_1 = device_list_template.format(prompt=user_prompt)
 
-    async with AI_Assistant(model) as assistant:
+    async with AI_Assistant(
+        model, use_cache=use_cache, connection_id=connection_id
+    ) as assistant:
         final_result = []
+        # 流式部分内容事件队列
+        events = asyncio.Queue()
+        # 排队等待配额时发送状态事件，进度保持为当前阶段的进度
+        current_progress = [0]
+        assistant.client.on_queue = lambda info: events.put_nowait(
+            queue_event(info, current_progress[0])
+        )
+
+        # 批量模式：一次请求生成多个设备的详细配置
+        batching = config_manager.get("device_assistant.batching", {}) or {}
+        sizer = None
+        if batching.get("enabled", False):
+            sizer = AdaptiveBatchSizer(
+                batching.get("max_batch_size", 4),
+                config_manager.get("device_assistant.max_tokens.device_detail", 3000),
+                batching.get("token_budget", 12000),
+            )
+        pool = DeviceDetailPool(
+            assistant,
+            device_detail_template,
+            config_manager.get("device_assistant.concurrency.device_detail", 1),
+            on_delta=lambda device, text: events.put_nowait(
+                delta_event("device_detail", text, device)
+            ),
+            sizer=sizer,
+        )
+        # 并发模式下，设备列表中的设备一闭合就提前开始生成其详细配置
+        early_start = pool.concurrency > 1 and config_manager.get(
+            "device_assistant.concurrency.early_start", False
+        )
+        list_parser = StreamingJSONParser()
+        list_parts = []
+
+        def on_list_delta(text):
+            nonlocal list_parser
+            events.put_nowait(delta_event("device_list", text))
+            if not early_start:
+                return
+            if text is STREAM_RESET:
+                # 设备列表重新生成，据此前内容提前开始的设备全部作废
+                list_parser = StreamingJSONParser()
+                list_parts.clear()
+                pool.reset()
+                return
+            list_parts.append(text)
+            try:
+                items = list_parser.feed(text)
+            except ValueError:
+                # 格式错误留给完整解析时报告
+                return
+            if not items:
+                return
+            streamed = "".join(list_parts)
+            first = len(list_parser.item_ends) - len(items)
+            for item, end in zip(items, list_parser.item_ends[first:]):
+                if isinstance(item, dict) and "device" in item:
+                    # 上下文副本包含设备列表的提问和截至该设备的回复，
+                    # 与分块方式无关，保证请求内容（及缓存键）可复现
+                    base = assistant.fork(
+                        [
+                            ConversationMessage(role="user", content=PROMPT_1),
+                            ConversationMessage(
+                                role="assistant", content=streamed[:end].strip()
+                            ),
+                        ]
+                    )
+                    pool.add(item["device"], base)
+
+        pool.start()
+        list_task = None
         try:
             # 第一步：生成设备列表
             progress_config = config_manager.get("progress.device_list")
+            current_progress[0] = progress_config["start"]
+            queue_info = queue_status(assistant.client.model_name)
             yield {
                 "event": "status",
                 "data": json.dumps(
@@ -477,12 +1566,19 @@ async def LLM_generate_block_categories(config_manager, user_input, model):
                         "message": "开始生成设备配置列表...",
                         "progress": progress_config["start"],
                         "next_progress": progress_config["end"],
-                        "estimate_time": progress_config["estimate_time"],
+                        "estimate_time": progress_config["estimate_time"]
+                        + queue_info.get("expected_wait", 0),
+                        **queue_info,
                     },
                     ensure_ascii=False,
                 ),
             }
-            device_list_response = await assistant.generate_device_list(PROMPT_1)
+            list_task = asyncio.create_task(
+                assistant.generate_device_list(PROMPT_1, on_delta=on_list_delta)
+            )
+            async for event in forward_events_until(list_task, events):
+                yield event
+            device_list_response = list_task.result()
 
             # 将结果包装为JSON格式的事件
             print("send:设备列表响应内容:", device_list_response)
@@ -524,6 +1620,7 @@ async def LLM_generate_block_categories(config_manager, user_input, model):
                     ),
                 }
             except Exception as e:
+                await assistant.client.discard_cached_reply()
                 print(f"send:解析设备列表失败: {e}")
                 yield {
                     "event": "error",
@@ -535,15 +1632,24 @@ async def LLM_generate_block_categories(config_manager, user_input, model):
             # 第二步：为每个设备生成详细配置
             detail_progress = config_manager.get("progress.device_detail")
             total_devices = len(devices)
+            detail_span = detail_progress["end"] - detail_progress["start"]
+
+            # 提前开始的设备已在池中，其余设备基于完整的设备列表上下文生成
+            for device in devices[len(pool.devices) :]:
+                pool.add(device)
+            pool.close()
+
+            # 按设备顺序发送事件，进度按已完成的设备数计算
             for idx, device in enumerate(devices):
+                finished = pool.finished
                 progress = detail_progress["start"] + int(
-                    (idx / total_devices)
-                    * (detail_progress["end"] - detail_progress["start"])
+                    (finished / total_devices) * detail_span
                 )
                 next_progress = detail_progress["start"] + int(
-                    ((idx + 1) / total_devices)
-                    * (detail_progress["end"] - detail_progress["start"])
+                    (min(finished + 1, total_devices) / total_devices) * detail_span
                 )
+                current_progress[0] = progress
+                queue_info = queue_status(assistant.client.model_name)
 
                 yield {
                     "event": "status",
@@ -552,27 +1658,30 @@ async def LLM_generate_block_categories(config_manager, user_input, model):
                             "message": f"({idx+1}/{total_devices})  正在生成 {device} 的配置...",
                             "progress": progress,
                             "next_progress": next_progress,
-                            "estimate_time": detail_progress["estimate_time"],
+                            "estimate_time": detail_progress["estimate_time"]
+                            + queue_info.get("expected_wait", 0),
+                            **queue_info,
                         },
                         ensure_ascii=False,
                     ),
                 }
 
-                detail_response = await assistant.generate_device_detail(
-                    device, device_detail_template
-                )
-                device_config = extract_and_parse_json(detail_response)
+                async for event in forward_events_until(pool.futures[idx], events):
+                    yield event
+                device_config = pool.futures[idx].result()
                 device_config["id"] = idx
 
                 final_result.append(device_config)
+                done_progress = detail_progress["start"] + int(
+                    (pool.finished / total_devices) * detail_span
+                )
                 print(f"send:设备 {device} 的配置生成完成✅:", device_config)
                 yield {
                     "event": "status",
                     "data": json.dumps(
                         {
                             "message": f"({idx+1}/{total_devices})  {device} 配置生成完成 ✅",
-                            # "progress": progress,
-                            "progress": next_progress,
+                            "progress": done_progress,
                             "replace": True,
                         },
                         ensure_ascii=False,
@@ -595,28 +1704,50 @@ async def LLM_generate_block_categories(config_manager, user_input, model):
 
             # 最后一个事件，发送完整结果
             print("send:最终结果:", final_result)
+            complete_data = {"result": final_result}
+            if config_manager.get("context_window.compaction.enabled", False):
+                compaction_stats = assistant.client.compaction_stats
+                print("send:上下文压缩统计:", compaction_stats)
+                complete_data["compaction"] = compaction_stats
+            if sizer is not None:
+                print("send:批量生成统计:", sizer.stats())
+                complete_data["batching"] = sizer.stats()
             yield {
                 "event": "complete",
-                "data": json.dumps({"result": final_result}, ensure_ascii=False),
+                "data": json.dumps(complete_data, ensure_ascii=False),
             }
 
         except Exception as e:
             print(f"send:生成过程中发生错误: {e}")
             error_msg = f"生成过程中发生错误: {str(e)}"
             raise Exception(error_msg)
+        finally:
+            # 客户端断开时生成器被关闭，取消仍在进行的请求
+            await cancel_task(list_task)
+            await pool.aclose()
 
 
-async def LLM_generate_AI_recommend(config_manager, user_input, model):
+async def LLM_generate_AI_recommend(
+    config_manager, user_input, model, use_cache=True, connection_id=None, **kwargs
+):
     # 获取AI推荐的提示词模板
     ai_recommend_template = config_manager.get("prompts.ai_recommend_template")
 
     # 构建完整的提示词
     PROMPT_AI_RECOMMEND = ai_recommend_template.format(prompt=user_input)
 
-    async with AI_Assistant(model) as assistant:
+    async with AI_Assistant(
+        model, use_cache=use_cache, connection_id=connection_id
+    ) as assistant:
+        events = asyncio.Queue()
+        recommend_task = None
         try:
             # 开始生成AI推荐
             progress_config = config_manager.get("progress.start_ai_recommend")
+            assistant.client.on_queue = lambda info: events.put_nowait(
+                queue_event(info, progress_config["start"])
+            )
+            queue_info = queue_status(assistant.client.model_name)
 
             yield {
                 "event": "status",
@@ -625,22 +1756,34 @@ async def LLM_generate_AI_recommend(config_manager, user_input, model):
                         "message": "开始生成AI智能推荐...",
                         "progress": progress_config["start"],
                         "next_progress": progress_config["end"],
-                        "estimate_time": progress_config["estimate_time"],
+                        "estimate_time": progress_config["estimate_time"]
+                        + queue_info.get("expected_wait", 0),
+                        **queue_info,
                     },
                     ensure_ascii=False,
                 ),
             }
 
             # 生成AI推荐
-            ai_recommend_response = await assistant.client.chat_with_memory(
-                user_message=PROMPT_AI_RECOMMEND,
-                temperature=config_manager.get(
-                    "device_assistant.temperature.ai_recommend", 0.8
-                ),
-                max_tokens=config_manager.get(
-                    "device_assistant.max_tokens.ai_recommend", 3000
-                ),
+            recommend_task = asyncio.create_task(
+                assistant.client.chat_with_memory(
+                    user_message=PROMPT_AI_RECOMMEND,
+                    temperature=config_manager.get(
+                        "device_assistant.temperature.ai_recommend", 0.8
+                    ),
+                    max_tokens=config_manager.get(
+                        "device_assistant.max_tokens.ai_recommend", 3000
+                    ),
+                    on_delta=lambda text: events.put_nowait(
+                        delta_event("ai_recommend", text)
+                    ),
+                    expect_json=True,
+                    step="ai_recommend",
+                )
             )
+            async for event in forward_events_until(recommend_task, events):
+                yield event
+            ai_recommend_response = recommend_task.result()
 
             print("send:AI推荐响应内容:", ai_recommend_response)
 
@@ -661,6 +1804,7 @@ async def LLM_generate_AI_recommend(config_manager, user_input, model):
                 # 尝试提取JSON格式的推荐（如果AI返回的是结构化数据）
                 recommendation_data = extract_and_parse_json(ai_recommend_response)
             except:
+                await assistant.client.discard_cached_reply()
                 # 如果不是JSON格式，则作为文本推荐处理
                 yield {
                     "event": "error",
@@ -683,6 +1827,9 @@ async def LLM_generate_AI_recommend(config_manager, user_input, model):
             print(f"send:AI推荐生成过程中发生错误: {e}")
             error_msg = f"AI推荐生成过程中发生错误: {str(e)}"
             raise Exception(error_msg)
+        finally:
+            # 客户端断开时生成器被关闭，取消仍在进行的请求
+            await cancel_task(recommend_task)
 
 
 async def send_single_message(_, data, *args, **kwargs):
@@ -692,10 +1839,10 @@ async def send_single_message(_, data, *args, **kwargs):
     }
 
 
-async def process_user_input(data, function_name, model):
+async def process_user_input(data, function_name, model, **options):
     global config_manager
     try:
-        async for event in eval(function_name)(config_manager, data, model):
+        async for event in eval(function_name)(config_manager, data, model, **options):
             yield event
     except TypeError as e:
         print(f"send:处理函数 {function_name} 时发生错误: {e}")
@@ -708,25 +1855,56 @@ async def process_user_input(data, function_name, model):
         }
 
 
-# 为FastAPI提供的格式化生成器函数p
-async def sse_generator(data, function_name, model=None):
+async def event_stream(data, function_name, model=None, **options):
     """
-    将处理的结果转换为SSE格式的生成器
+    产生处理过程中的事件（{"event", "data"}），最后总是一个close事件
+    options会透传给处理函数（如use_cache、connection_id）
     """
     try:
-        async for event in process_user_input(data, function_name, model):
+        async for event in process_user_input(data, function_name, model, **options):
             if isinstance(event, dict):
-                event_name = event.get("event", "message")
-                event_data = event.get("data", "")
-                yield f"event: {event_name}\ndata: {event_data}\n\n"
+                yield {
+                    "event": event.get("event", "message"),
+                    "data": event.get("data", ""),
+                }
             else:
                 # 如果event是字符串，将其作为message事件发送
-                yield f"event: message\ndata: {json.dumps({'message': event}, ensure_ascii=False)}\n\n"
+                yield {
+                    "event": "message",
+                    "data": json.dumps({"message": event}, ensure_ascii=False),
+                }
 
         # 发送结束信号，让客户端主动断开连接
-        yield f"event: close\ndata: {json.dumps({'message': 'SSE连接结束'}, ensure_ascii=False)}\n\n"
+        yield {
+            "event": "close",
+            "data": json.dumps({"message": "SSE连接结束"}, ensure_ascii=False),
+        }
 
     except Exception as e:
         # 发生错误时也发送结束信号
-        yield f"event: error\ndata: {json.dumps({'message': f'SSE连接错误: {str(e)}'}, ensure_ascii=False)}\n\n"
-        yield f"event: close\ndata: {json.dumps({'message': 'SSE连接终止'}, ensure_ascii=False)}\n\n"
+        yield {
+            "event": "error",
+            "data": json.dumps(
+                {"message": f"SSE连接错误: {str(e)}"}, ensure_ascii=False
+            ),
+        }
+        yield {
+            "event": "close",
+            "data": json.dumps({"message": "SSE连接终止"}, ensure_ascii=False),
+        }
+
+
+def format_sse(event: Dict, event_id=None) -> str:
+    """将事件格式化为SSE文本，event_id用于客户端断线重连时的Last-Event-ID"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event['event']}\ndata: {event['data']}\n\n"
+
+
+# 为FastAPI提供的格式化生成器函数
+async def sse_generator(data, function_name, model=None, **options):
+    """
+    将处理的结果转换为SSE格式的生成器
+    options会透传给处理函数（如use_cache）
+    """
+    async for event in event_stream(data, function_name, model, **options):
+        yield format_sse(event)
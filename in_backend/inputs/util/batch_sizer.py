@@ -0,0 +1,82 @@
+import math
+from typing import Dict
+
+
+class AdaptiveBatchSizer:
+    """
+    设备详细配置的自适应批量大小
+    上限由单次请求的token预算和单个设备输出token的估计值决定；
+    批量回复被截断时批量减半，未截断时逐步增大，
+    单个设备的输出token估计值按实际回复长度滑动更新
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        device_tokens: int,
+        token_budget: int,
+        headroom: float = 1.5,
+        smoothing: float = 0.3,
+    ):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.token_budget = max(1, int(token_budget))
+        # 单个设备输出token估计值，初始为单设备请求的max_tokens
+        self.device_tokens = max(1, int(device_tokens))
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.limit = self.max_batch_size
+
+        self.batches = 0
+        self.truncated = 0
+        self.devices = 0
+        self.fallbacks = 0
+
+    def capacity(self) -> int:
+        """当前允许的最大批量"""
+        by_tokens = self.token_budget // self.device_tokens
+        return max(1, min(self.max_batch_size, self.limit, by_tokens))
+
+    def next_size(self, pending: int, workers: int = 1) -> int:
+        """
+        决定下一批的设备数
+        pending为待生成的设备数，批量不超过平均分给各工作协程的份额，避免并发闲置
+        """
+        share = math.ceil(max(1, pending) / max(1, workers))
+        return max(1, min(self.capacity(), share))
+
+    def max_tokens_for(self, size: int) -> int:
+        """批量请求的max_tokens"""
+        return min(self.token_budget, self.device_tokens * size)
+
+    def record(self, size: int, completed: int, truncated: bool, reply_tokens: int):
+        """记录一次批量请求的结果"""
+        self.batches += 1
+        self.devices += completed
+        self.fallbacks += size - completed
+        if truncated:
+            self.truncated += 1
+            self.limit = max(1, size // 2)
+        else:
+            self.limit = min(self.max_batch_size, self.limit + 1)
+        if completed:
+            observed = reply_tokens / completed * self.headroom
+            self.device_tokens = max(
+                1,
+                int(
+                    (1 - self.smoothing) * self.device_tokens
+                    + self.smoothing * observed
+                ),
+            )
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "truncated": self.truncated,
+            "truncation_rate": (
+                round(self.truncated / self.batches, 4) if self.batches else 0.0
+            ),
+            "devices": self.devices,
+            "fallbacks": self.fallbacks,
+            "batch_limit": self.capacity(),
+            "device_tokens": self.device_tokens,
+        }
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class _ClientEntry:
+    """注册表中的一个客户端及其引用计数"""
+
+    client: AsyncOpenAI
+    fingerprint: tuple
+    refs: int = 0
+    retired: bool = False
+
+
+class ClientRegistry:
+    """
+    进程内共享的AsyncOpenAI客户端注册表
+    按available_models中的模型名复用客户端及其连接池；
+    配置变化时旧客户端被标记为退役，在最后一个使用者释放后关闭
+    """
+
+    def __init__(self, pool_config: Dict = None):
+        self.pool_config = dict(pool_config or {})
+        self._entries: Dict[str, _ClientEntry] = {}
+        self._retired: List[_ClientEntry] = []
+
+    def _fingerprint(self, model_config: Dict) -> tuple:
+        return (
+            model_config.get("base_url"),
+            model_config.get("API_KEY"),
+            tuple(sorted(self.pool_config.items())),
+        )
+
+    def _build_client(self, model_config: Dict) -> AsyncOpenAI:
+        pool = self.pool_config
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=pool.get("max_connections", 20),
+                max_keepalive_connections=pool.get("max_keepalive_connections", 10),
+                keepalive_expiry=pool.get("keepalive_expiry", 60),
+            ),
+            timeout=httpx.Timeout(
+                pool.get("read_timeout", 120),
+                connect=pool.get("connect_timeout", 10),
+            ),
+        )
+        return AsyncOpenAI(
+            api_key=model_config.get("API_KEY"),
+            base_url=model_config.get("base_url"),
+            http_client=http_client,
+            # 重试由调用方的RetryPolicy统一处理
+            max_retries=0,
+        )
+
+    def acquire(self, model: str, model_config: Dict) -> AsyncOpenAI:
+        """获取模型对应的共享客户端，使用完毕后需调用release"""
+        fingerprint = self._fingerprint(model_config)
+        entry = self._entries.get(model)
+        if entry is None or entry.fingerprint != fingerprint:
+            if entry is not None:
+                self._retire(model)
+            entry = _ClientEntry(self._build_client(model_config), fingerprint)
+            self._entries[model] = entry
+            logger.info(f"已创建共享LLM客户端 - 模型: {model}")
+        entry.refs += 1
+        return entry.client
+
+    async def release(self, client: AsyncOpenAI):
+        """释放客户端引用，退役客户端在无人使用时关闭"""
+        for entry in list(self._entries.values()) + self._retired:
+            if entry.client is client:
+                entry.refs = max(0, entry.refs - 1)
+                if entry.retired and entry.refs == 0:
+                    await self._close(entry)
+                return
+
+    async def reconcile(self, available_models: Dict):
+        """
+        按最新配置同步注册表
+        已删除或配置（含连接池参数）变化的模型客户端退役，空闲的退役客户端立即关闭
+        """
+        for model in list(self._entries):
+            model_config = available_models.get(model)
+            if (
+                model_config is None
+                or self._fingerprint(model_config) != self._entries[model].fingerprint
+            ):
+                self._retire(model)
+        for entry in list(self._retired):
+            if entry.refs == 0:
+                await self._close(entry)
+
+    async def warm_up(self, available_models: Dict, timeout: float = 5):
+        """预先建立各模型的连接，失败只记录日志"""
+
+        async def _warm(model: str, model_config: Dict):
+            client = self.acquire(model, model_config)
+            try:
+                await asyncio.wait_for(client.models.list(), timeout)
+                logger.info(f"LLM连接预热完成 - 模型: {model}")
+            except Exception as e:
+                # 不支持models接口时连接也已建立，只需记录
+                logger.info(f"LLM连接预热未完成 - 模型: {model}: {e}")
+            finally:
+                await self.release(client)
+
+        await asyncio.gather(
+            *(_warm(model, conf) for model, conf in available_models.items())
+        )
+
+    async def aclose(self):
+        """关闭所有客户端"""
+        for model in list(self._entries):
+            self._retire(model)
+        for entry in list(self._retired):
+            await self._close(entry)
+
+    def stats(self) -> Dict:
+        """返回各模型客户端的引用情况"""
+        return {
+            "clients": {model: entry.refs for model, entry in self._entries.items()},
+            "retired": len(self._retired),
+        }
+
+    def _retire(self, model: str):
+        entry = self._entries.pop(model)
+        entry.retired = True
+        self._retired.append(entry)
+        logger.info(f"LLM客户端已退役 - 模型: {model}")
+
+    async def _close(self, entry: _ClientEntry):
+        if entry in self._retired:
+            self._retired.remove(entry)
+        await entry.client.close()
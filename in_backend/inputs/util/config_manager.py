@@ -34,15 +34,16 @@ class ConfigManager:
             raise ValueError("在配置中找不到LLM配置。")
         return llm_config
 
-    def get_model_config(self):
-        """获取指定模型的配置"""
+    def get_model_config(self, model=None):
+        """获取指定模型的配置，默认为当前使用的模型"""
+        model = model or self.model
         llm_config = self.get_LLM_config().get("available_models", {})
-        if not self.model or self.model not in self.get_LLM_list():
-            raise ValueError(f"模型 '{self.model}' 在配置中不可用。")
+        if not model or model not in self.get_LLM_list():
+            raise ValueError(f"模型 '{model}' 在配置中不可用。")
 
-        model_config = llm_config.get(self.model, {})
+        model_config = llm_config.get(model, {})
         if not model_config:
-            raise ValueError(f"找不到模型 '{self.model}' 的配置。")
+            raise ValueError(f"找不到模型 '{model}' 的配置。")
 
         return model_config
 
@@ -0,0 +1,168 @@
+import copy
+import functools
+import math
+import re
+from collections import deque
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+# 每条消息在对话格式中的固定开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 回复开头的固定开销
+REPLY_PRIMING_TOKENS = 3
+
+# 中日韩字符及全角标点，大多数分词器中约1个字符1个token
+_CJK = re.compile(
+    r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]"
+)
+
+
+def local_token_estimate(text: str) -> int:
+    """
+    本地估算token数，无需额外依赖
+    中日韩字符按1个token计，其余字符按约3.5个字符1个token计
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 3.5)
+
+
+@functools.lru_cache(maxsize=None)
+def _tiktoken_estimator() -> Tuple[Optional[Callable], Optional[Exception]]:
+    """
+    加载tiktoken编码，返回(估算函数, 错误)
+    失败的结果同样缓存，每个进程只尝试一次，不在每次创建上下文时重复导入和加载编码文件
+    """
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 未安装tiktoken或无法加载编码文件
+        return None, e
+    return lambda text: len(encoding.encode(text, disallowed_special=())), None
+
+
+def get_token_estimator(name: str = "auto") -> Callable[[str], int]:
+    """
+    获取token估算函数
+    auto: 安装了tiktoken时使用tiktoken，否则使用本地估算
+    tiktoken: 强制使用tiktoken
+    local: 使用本地估算
+    """
+    if name == "local":
+        return local_token_estimate
+    estimator, error = _tiktoken_estimator()
+    if estimator is not None:
+        return estimator
+    if name == "tiktoken":
+        raise error
+    return local_token_estimate
+
+
+class ContextWindow:
+    """
+    对话上下文窗口
+    维护每条消息的token数及其总和；超出预算时从最早的非系统消息开始淘汰，
+    系统消息始终保留并位于最前。
+    带有digest的消息可被压缩为摘要，compacted_savings为当前窗口中因压缩少发送的token数
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        max_messages: int,
+        estimator: Callable[[str], int] = local_token_estimate,
+    ):
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.estimator = estimator
+        # 每项为[消息, token数, 压缩节省的token数]
+        self._system: List[list] = []
+        self._messages: Deque[list] = deque()
+        self.total_tokens = 0
+        self.compacted_savings = 0
+
+    def __len__(self) -> int:
+        return len(self._system) + len(self._messages)
+
+    def __iter__(self) -> Iterator:
+        for msg, _, _ in self._system:
+            yield msg
+        for msg, _, _ in self._messages:
+            yield msg
+
+    def message_tokens(self, content: str) -> int:
+        """估算单条消息的token数（含格式开销）"""
+        return self.estimator(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, msg):
+        """添加消息"""
+        tokens = self.message_tokens(msg.content)
+        if msg.role == "system":
+            self._system.append([msg, tokens, 0])
+        else:
+            self._messages.append([msg, tokens, 0])
+        self.total_tokens += tokens
+
+    def extend(self, messages):
+        for msg in messages:
+            self.append(msg)
+
+    def clear(self):
+        self._system.clear()
+        self._messages.clear()
+        self.total_tokens = 0
+        self.compacted_savings = 0
+
+    def copy(self) -> "ContextWindow":
+        """复制窗口，消息对象浅复制，token数直接沿用"""
+        window = ContextWindow(self.max_tokens, self.max_messages, self.estimator)
+        window._system = [[copy.copy(msg), t, saved] for msg, t, saved in self._system]
+        window._messages = deque(
+            [copy.copy(msg), t, saved] for msg, t, saved in self._messages
+        )
+        window.total_tokens = self.total_tokens
+        window.compacted_savings = self.compacted_savings
+        return window
+
+    def fit(self, reserve_tokens: int = 0) -> List:
+        """
+        淘汰最早的非系统消息，直到消息数不超过max_messages，
+        且窗口总token数加上reserve_tokens不超过max_tokens，返回被淘汰的消息
+        reserve_tokens为即将发送的新消息所需的token数
+        """
+        evicted = []
+        while self._messages and (
+            len(self) > self.max_messages
+            or self.total_tokens + reserve_tokens > self.max_tokens
+        ):
+            msg, tokens, saved = self._messages.popleft()
+            self.total_tokens -= tokens
+            self.compacted_savings -= saved
+            evicted.append(msg)
+        return evicted
+
+    def compact(self, threshold_tokens: int, keep_recent: int = 2) -> int:
+        """
+        总token数超过threshold_tokens时，从最早的消息开始将带digest的消息替换为摘要，
+        最近的keep_recent条消息保持原文，返回本次压缩的消息数
+        """
+        compacted = 0
+        candidates = len(self._messages) - keep_recent
+        for i, entry in enumerate(self._messages):
+            if i >= candidates or self.total_tokens <= threshold_tokens:
+                break
+            msg, tokens, _ = entry
+            if not getattr(msg, "digest", None) or msg.content == msg.digest:
+                continue
+            new_tokens = self.message_tokens(msg.digest)
+            if new_tokens >= tokens:
+                continue
+            msg.content = msg.digest
+            entry[1] = new_tokens
+            entry[2] += tokens - new_tokens
+            self.total_tokens -= tokens - new_tokens
+            self.compacted_savings += tokens - new_tokens
+            compacted += 1
+        return compacted
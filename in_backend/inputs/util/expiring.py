@@ -0,0 +1,144 @@
+import heapq
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class ExpiringRegistry:
+    """
+    带截止时间的有界注册表
+    截止时间保存在最小堆中，到期条目按截止时间顺序移除（每个O(log n)），
+    条目数或总字节数超过上限时按LRU淘汰；deadline为None的条目不会过期也不会被淘汰
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0):
+        # 0表示不限制
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> [value, deadline, size]，按最近使用排序
+        self._entries: "OrderedDict[Hashable, List]" = OrderedDict()
+        # (deadline, 版本号, key)，条目被替换或删除后旧的堆元素在弹出时跳过
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._versions: Dict[Hashable, int] = {}
+        self._counter = 0
+        self.bytes = 0
+
+        self.counters = {"expired": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def set(self, key, value, deadline: Optional[float] = None, size: int = 0):
+        """添加或替换条目，返回因超出上限被淘汰的key列表"""
+        self._remove(key)
+        self._entries[key] = [value, deadline, size]
+        self.bytes += size
+        self._push(key, deadline)
+        return self._evict(keep=key)
+
+    def get(self, key, default=None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set_deadline(self, key, deadline: Optional[float], size: int = None):
+        """更新条目的截止时间（及大小），返回被淘汰的key列表"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return []
+        entry[1] = deadline
+        if size is not None:
+            self.bytes += size - entry[2]
+            entry[2] = size
+        self._entries.move_to_end(key)
+        self._push(key, deadline)
+        return self._evict(keep=key)
+
+    def values(self) -> List:
+        return [entry[0] for entry in self._entries.values()]
+
+    def pop(self, key, default=None) -> Any:
+        entry = self._remove(key)
+        return default if entry is None else entry[0]
+
+    def expire(self, now: float) -> List:
+        """移除截止时间不晚于now的条目，返回被移除的key列表"""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, version, key = heapq.heappop(self._heap)
+            if self._versions.get(key) != version:
+                continue
+            self._remove(key)
+            expired.append(key)
+        self.counters["expired"] += len(expired)
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """最早的截止时间，没有会过期的条目时返回None"""
+        while self._heap:
+            deadline, version, key = self._heap[0]
+            if self._versions.get(key) == version:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def _push(self, key, deadline: Optional[float]):
+        self._counter += 1
+        if deadline is None:
+            self._versions.pop(key, None)
+            return
+        self._versions[key] = self._counter
+        heapq.heappush(self._heap, (deadline, self._counter, key))
+        # 失效的堆元素过多时重建，避免堆无限增长
+        if len(self._heap) > 2 * len(self._versions) + 64:
+            self._heap = [
+                item for item in self._heap if self._versions.get(item[2]) == item[1]
+            ]
+            heapq.heapify(self._heap)
+
+    def _remove(self, key) -> Optional[List]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+            self._versions.pop(key, None)
+        return entry
+
+    def _over_limit(self, entries: int, total: int) -> bool:
+        return bool(
+            (self.max_entries and entries > self.max_entries)
+            or (self.max_bytes and total > self.max_bytes)
+        )
+
+    def _evict(self, keep=None) -> List:
+        entries, total = len(self._entries), self.bytes
+        if not self._over_limit(entries, total):
+            return []
+        # 从最久未使用的条目开始，不淘汰刚写入的条目和不会过期的条目
+        evicted = []
+        for key, entry in self._entries.items():
+            if not self._over_limit(entries, total):
+                break
+            if key == keep or entry[1] is None:
+                continue
+            evicted.append(key)
+            entries -= 1
+            total -= entry[2]
+        for key in evicted:
+            self._remove(key)
+        self.counters["evicted"] += len(evicted)
+        return evicted
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "pending_deadlines": len(self._versions),
+            "next_deadline": self.next_deadline(),
+            **self.counters,
+        }
@@ -0,0 +1,344 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .expiring import ExpiringRegistry
+
+
+@dataclass
+class JobRecord:
+    """
+    任务记录
+    data为提交的内容（项目配置或用户需求），events为任务结束时保存的非delta事件，
+    格式为[[seq, event, data], ...]，用于重启后重新获取结果
+    """
+
+    job_id: str
+    connection_type: str
+    model: str
+    data: str
+    use_cache: bool = True
+    status: str = "running"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    result: Optional[str] = None
+    events: Optional[List] = None
+
+
+class JobStore(ABC):
+    """任务存储接口"""
+
+    # 写入是否涉及磁盘IO，为True时调用方应在线程池中写入，避免阻塞事件循环
+    blocking = False
+
+    @abstractmethod
+    def put(self, record: JobRecord):
+        """保存新任务"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        """按ID获取任务，不存在时返回None"""
+
+    @abstractmethod
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        finished_at: float,
+        result: Optional[str] = None,
+        events: Optional[List] = None,
+    ):
+        """记录任务结束状态和结果"""
+
+    @abstractmethod
+    def mark_interrupted(self) -> int:
+        """将上次运行中未结束的任务标记为失败，返回数量"""
+
+    @abstractmethod
+    def delete_expired(self, now: float) -> int:
+        """删除到期（创建时间加保留时间不晚于now）的已结束任务，返回删除数量"""
+
+    @abstractmethod
+    def next_expiry(self) -> Optional[float]:
+        """已结束任务中最早的到期时间，用于计算下一次清理的时间"""
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """返回任务数量和容量等统计信息"""
+
+    def close(self):
+        pass
+
+
+def record_size(record: JobRecord) -> int:
+    """任务记录占用的大致字节数"""
+    size = len(record.data) + len(record.result or "")
+    for event in record.events or ():
+        size += len(event[2])
+    return size
+
+
+class MemoryJobStore(JobStore):
+    """
+    进程内任务存储，重启后丢失
+    已结束的任务按到期时间（创建时间加保留时间）进入最小堆，到期时按顺序移除；
+    超过条目数或总字节数上限时淘汰最久未访问的已结束任务，运行中的任务不会被淘汰
+    """
+
+    def __init__(self, retention: float, max_entries: int = 0, max_bytes: int = 0):
+        self.retention = retention
+        self._records = ExpiringRegistry(max_entries, max_bytes)
+
+    def put(self, record: JobRecord):
+        deadline = (
+            None if record.status == "running" else record.created_at + self.retention
+        )
+        self._records.set(
+            record.job_id, record, deadline=deadline, size=record_size(record)
+        )
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        return self._records.get(job_id)
+
+    def finish(self, job_id, status, finished_at, result=None, events=None):
+        record = self._records.get(job_id)
+        if record is None:
+            return
+        record.status = status
+        record.finished_at = finished_at
+        record.result = result
+        record.events = events
+        self._records.set_deadline(
+            job_id, record.created_at + self.retention, size=record_size(record)
+        )
+
+    def mark_interrupted(self) -> int:
+        # 进程内存储不会保留上次运行的任务
+        return 0
+
+    def delete_expired(self, now: float) -> int:
+        return len(self._records.expire(now))
+
+    def next_expiry(self) -> Optional[float]:
+        return self._records.next_deadline()
+
+    def stats(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for record in self._records.values():
+            counts[record.status] = counts.get(record.status, 0) + 1
+        return {
+            "backend": "memory",
+            "jobs": len(self._records),
+            "by_status": counts,
+            **self._records.stats(),
+        }
+
+
+class SQLiteJobStore(JobStore):
+    """
+    基于SQLite的任务存储（WAL模式）
+    created_at和status建有索引，过期任务按created_at范围删除；
+    超过条目数或总字节数上限时按创建时间从早到晚删除已结束的任务，运行中的任务不会被删除
+    """
+
+    blocking = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            connection_type TEXT NOT NULL,
+            model TEXT,
+            data TEXT NOT NULL,
+            use_cache INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            finished_at REAL,
+            result TEXT,
+            events TEXT,
+            size INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+    """
+
+    COLUMNS = (
+        "job_id, connection_type, model, data, use_cache, status, "
+        "created_at, finished_at, result, events"
+    )
+
+    def __init__(
+        self, path, retention: float, max_entries: int = 0, max_bytes: int = 0
+    ):
+        self.path = Path(path)
+        self.retention = retention
+        # 0表示不限制
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.counters = {"expired": 0, "evicted": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL模式下NORMAL即可保证数据库一致，只可能丢失最后几次提交
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "size" not in columns:
+            # 旧版本创建的数据库没有size列
+            self._conn.execute(
+                "ALTER TABLE jobs ADD COLUMN size INTEGER NOT NULL DEFAULT 0"
+            )
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def put(self, record: JobRecord):
+        self._execute(
+            f"INSERT OR REPLACE INTO jobs ({self.COLUMNS}, size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.job_id,
+                record.connection_type,
+                record.model,
+                record.data,
+                int(record.use_cache),
+                record.status,
+                record.created_at,
+                record.finished_at,
+                record.result,
+                None if record.events is None else json.dumps(record.events),
+                record_size(record),
+            ),
+        )
+        self._evict()
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        row = self._execute(
+            f"SELECT {self.COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        events = row[9]
+        return JobRecord(
+            job_id=row[0],
+            connection_type=row[1],
+            model=row[2],
+            data=row[3],
+            use_cache=bool(row[4]),
+            status=row[5],
+            created_at=row[6],
+            finished_at=row[7],
+            result=row[8],
+            events=None if events is None else json.loads(events),
+        )
+
+    def finish(self, job_id, status, finished_at, result=None, events=None):
+        # 大小与record_size一致：提交内容、结果和各事件数据的长度
+        size = len(result or "") + sum(len(event[2]) for event in events or ())
+        self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, events = ?, "
+            "size = length(data) + ? WHERE job_id = ?",
+            (
+                status,
+                finished_at,
+                result,
+                None if events is None else json.dumps(events),
+                size,
+                job_id,
+            ),
+        )
+        self._evict()
+
+    def _evict(self):
+        """超过上限时按创建时间从早到晚删除已结束的任务"""
+        if not self.max_entries and not self.max_bytes:
+            return
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM jobs"
+            ).fetchone()
+            over_entries = max(0, entries - self.max_entries) if self.max_entries else 0
+            over_bytes = max(0, total - self.max_bytes) if self.max_bytes else 0
+            if not over_entries and not over_bytes:
+                return
+            evicted = []
+            rows = self._conn.execute(
+                "SELECT job_id, size FROM jobs WHERE status != 'running' "
+                "ORDER BY created_at"
+            )
+            for job_id, size in rows:
+                if len(evicted) >= over_entries and over_bytes <= 0:
+                    break
+                evicted.append((job_id,))
+                over_bytes -= size
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", evicted)
+            self.counters["evicted"] += len(evicted)
+
+    def mark_interrupted(self) -> int:
+        cursor = self._execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ? "
+            "WHERE status = 'running'",
+            (time.time(),),
+        )
+        return cursor.rowcount
+
+    def delete_expired(self, now: float) -> int:
+        cursor = self._execute(
+            "DELETE FROM jobs WHERE created_at <= ? AND status != 'running'",
+            (now - self.retention,),
+        )
+        self.counters["expired"] += cursor.rowcount
+        return cursor.rowcount
+
+    def next_expiry(self) -> Optional[float]:
+        row = self._execute(
+            "SELECT MIN(created_at) FROM jobs WHERE status != 'running'"
+        ).fetchone()
+        return None if row[0] is None else row[0] + self.retention
+
+    def stats(self) -> Dict:
+        rows = self._execute(
+            "SELECT status, COUNT(*), COALESCE(SUM(size), 0) FROM jobs GROUP BY status"
+        ).fetchall()
+        counts = {status: count for status, count, _ in rows}
+        return {
+            "backend": "sqlite",
+            "path": str(self.path),
+            "jobs": sum(counts.values()),
+            "by_status": counts,
+            "bytes": sum(size for _, _, size in rows),
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "next_expiry": self.next_expiry(),
+            **self.counters,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_job_store(
+    backend: str = "sqlite",
+    path=None,
+    retention: float = 24 * 3600,
+    max_entries: int = 0,
+    max_bytes: int = 0,
+) -> JobStore:
+    """
+    按名称创建任务存储，sqlite需要数据库文件路径
+    retention为已结束任务的保留时间（秒，按创建时间计算），max_entries和max_bytes为容量上限
+    """
+    if backend == "memory":
+        return MemoryJobStore(retention, max_entries, max_bytes)
+    if backend == "sqlite":
+        return SQLiteJobStore(path, retention, max_entries, max_bytes)
+    raise ValueError(f"不支持的任务存储类型: {backend}")
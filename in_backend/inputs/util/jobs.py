@@ -0,0 +1,173 @@
+import asyncio
+import bisect
+import json
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+@dataclass
+class JobEvent:
+    """任务产生的一条SSE事件，seq为单调递增的事件ID"""
+
+    seq: int
+    event: str
+    data: str
+
+
+class GenerationJob:
+    """
+    后台生成任务
+    提交时即开始运行，事件带序号保存在有界日志中，
+    SSE连接（含断线重连）从Last-Event-ID之后继续读取，不会重新调用LLM。
+    日志超出上限时优先丢弃最早的delta事件，status/complete等事件尽量保留
+    """
+
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(
+        self,
+        job_id: str,
+        source: Optional[AsyncIterator[Dict]],
+        max_events: int = 2000,
+        on_finish: Callable[["GenerationJob"], Awaitable[None]] = None,
+    ):
+        self.job_id = job_id
+        self.max_events = max(1, max_events)
+        self.status = self.RUNNING
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.dropped = 0
+
+        self._source = source
+        # 任务结束（含取消）后等待的协程函数，用于持久化结果
+        self.on_finish = on_finish
+        self._events: List[JobEvent] = []
+        self._next_seq = 1
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_events(
+        cls, job_id: str, status: str, events: List, finished_at: float = None
+    ) -> "GenerationJob":
+        """由已保存的事件（[[seq, event, data], ...]）重建已结束的任务，用于重新读取结果"""
+        job = cls(job_id, None)
+        job.status = status
+        job.finished_at = finished_at
+        job._events = [JobEvent(*event) for event in events]
+        job._next_seq = job._events[-1].seq + 1 if job._events else 1
+        return job
+
+    @property
+    def done(self) -> bool:
+        return self.status != self.RUNNING
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    def start(self):
+        """在后台开始运行"""
+        self._task = asyncio.create_task(self._run())
+
+    async def cancel(self):
+        """取消仍在运行的任务"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        # 收到complete事件才算成功完成
+        status = self.FAILED
+        try:
+            async for event in self._source:
+                self._append(event.get("event", "message"), event.get("data", ""))
+                if event.get("event") == "complete":
+                    status = self.COMPLETED
+        except asyncio.CancelledError:
+            status = self.CANCELLED
+            raise
+        except Exception as e:
+            status = self.FAILED
+            self._append("error", json.dumps({"message": str(e)}, ensure_ascii=False))
+        finally:
+            self.status = status
+            self.finished_at = time.time()
+            self._notify()
+            if self.on_finish is not None:
+                await self.on_finish(self)
+
+    def _append(self, event: str, data: str):
+        self._events.append(JobEvent(self._next_seq, event, data))
+        self._next_seq += 1
+        if len(self._events) > self.max_events:
+            self._compact()
+        self._notify()
+
+    def _compact(self):
+        # 一次丢弃较早的一半delta事件，摊还开销为O(1)
+        deltas = sum(1 for e in self._events if e.event == "delta")
+        drop = max(1, deltas // 2) if deltas else 0
+        kept = []
+        for event in self._events:
+            if drop and event.event == "delta":
+                drop -= 1
+                self.dropped += 1
+                continue
+            kept.append(event)
+        overflow = len(kept) - self.max_events
+        if overflow > 0:
+            # 没有可丢弃的delta事件时丢弃最早的事件
+            self.dropped += overflow
+            kept = kept[overflow:]
+        self._events = kept
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def events_after(self, last_seq: int = 0) -> AsyncIterator[JobEvent]:
+        """依次产生序号大于last_seq的事件，任务结束且事件发送完毕后返回"""
+        cursor = last_seq
+        while True:
+            changed = self._changed
+            start = bisect.bisect_right(self._events, cursor, key=lambda e: e.seq)
+            pending = self._events[start:]
+            for event in pending:
+                yield event
+            if pending:
+                cursor = pending[-1].seq
+                continue
+            if self.done:
+                return
+            await changed.wait()
+
+    def result(self) -> Optional[str]:
+        """complete事件的数据，未完成时为None"""
+        for event in reversed(self._events):
+            if event.event == "complete":
+                return event.data
+        return None
+
+    def saved_events(self) -> List:
+        """需要持久化的事件（不含delta），格式为[[seq, event, data], ...]"""
+        return [
+            [event.seq, event.event, event.data]
+            for event in self._events
+            if event.event != "delta"
+        ]
+
+    def summary(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "events": len(self._events),
+            "last_event_id": self.last_seq,
+            "dropped_events": self.dropped,
+        }
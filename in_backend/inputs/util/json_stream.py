@@ -0,0 +1,228 @@
+import json
+import re
+from typing import Any, List
+
+# 根值之外：寻找第一个对象或数组的起点
+_ROOT_START = re.compile(r"[\[{]")
+_SKIP_WS = re.compile(r"\s*")
+# 字符串之外：完整的字符串整体跳过，否则只关心会改变结构的字符
+_STRUCTURAL = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}",]', re.DOTALL)
+# 字符串之内：只关心结束引号和转义符
+_STRING_SPECIAL = re.compile(r'["\\]')
+# 数组中第一个值可以开始的字符，及需要完整读到才能确定的字面量
+_VALUE_START = set('"{[]0123456789')
+_LITERALS = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+
+
+def _first_value_starts(text: str, start: int):
+    """
+    text[start]处的括号后的第一个值能否开始解码（与json.JSONDecoder的判断一致），
+    不能时该括号视为说明文字中的括号；文本不足以判断时返回None
+    """
+    pos = _SKIP_WS.match(text, start + 1).end()
+    if pos >= len(text):
+        return None
+    char = text[pos]
+    if text[start] == "{":
+        return char in '"}'
+    if char in _VALUE_START:
+        return True
+    if char == "-" and pos + 1 < len(text) and text[pos + 1].isdigit():
+        return True
+    for literal in _LITERALS:
+        head = text[pos : pos + len(literal)]
+        if head == literal:
+            return True
+        if len(head) < len(literal) and literal.startswith(head):
+            return None
+    return False
+
+
+class StreamingJSONParser:
+    """
+    增量JSON解析器
+    逐块接收LLM输出，跳过JSON之前的说明文字或代码块标记，
+    根值为数组时，每个顶层元素一闭合就立即解析并返回
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._root = None  # "[" 或 "{"
+        self._root_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._elem_start = 0
+        self._elem_emitted = False
+        self._items: List[Any] = []
+        self._done = False
+        self._end = 0
+        # 已丢弃的前缀长度，用于换算元素在输入流中的绝对位置
+        self._offset = 0
+        # 各顶层数组元素在输入流中的结束位置（不含）
+        self.item_ends: List[int] = []
+
+    @property
+    def done(self) -> bool:
+        """根值是否已经闭合"""
+        return self._done
+
+    def feed(self, chunk: str) -> List[Any]:
+        """输入一段文本，返回本次新闭合的顶层数组元素"""
+        if self._done or not chunk:
+            return []
+        self._text += chunk
+        completed = []
+
+        if self._root is None and not self._find_root():
+            return completed
+
+        text = self._text
+        pos = self._pos
+        while not self._done:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = len(text)
+                    break
+                if match.group() == "\\":
+                    if match.end() >= len(text):
+                        # 转义符位于块末尾，等待下一块
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            char = match.group()
+            pos = match.end()
+
+            if len(char) > 1:
+                # 已闭合的完整字符串
+                continue
+            if char == '"':
+                # 字符串在当前块内尚未闭合
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._root == "[" and self._depth == 1:
+                    # 对象或数组类型的元素闭合
+                    completed.append(self._parse_element(pos))
+                    self._elem_emitted = True
+                elif self._depth == 0:
+                    if self._root == "[":
+                        # 末尾元素可能是未被逗号结束的标量
+                        self._flush_scalar(pos - 1, completed)
+                    self._done = True
+                    self._end = pos
+            elif char == "," and self._root == "[" and self._depth == 1:
+                self._flush_scalar(pos - 1, completed)
+                self._elem_start = pos
+                self._elem_emitted = False
+
+        self._pos = pos
+        if self._root == "[" and not self._done:
+            # 已解析的元素不再需要保留原文
+            self._trim(self._elem_start)
+        return completed
+
+    def close(self) -> Any:
+        """结束输入并返回完整的根值"""
+        if self._root is None:
+            raise ValueError("未找到有效的JSON内容")
+        if not self._done:
+            raise ValueError("JSON格式不完整")
+        if self._root == "[":
+            return list(self._items)
+        return json.loads(self._text[self._root_start : self._end])
+
+    def _find_root(self) -> bool:
+        """寻找根值起点，跳过说明文字中的括号（其后的第一个值无法解码），与parse_json_text一致"""
+        while True:
+            match = _ROOT_START.search(self._text, self._pos)
+            if match is None:
+                self._offset += len(self._text)
+                self._text = ""
+                self._pos = 0
+                return False
+            starts = _first_value_starts(self._text, match.start())
+            if starts is None:
+                # 等待后续输入再判断，只保留从该括号开始的文本
+                self._offset += match.start()
+                self._text = self._text[match.start() :]
+                self._pos = 0
+                return False
+            if starts:
+                break
+            self._pos = match.end()
+        self._root = match.group()
+        self._depth = 1
+        self._offset += match.start()
+        self._text = self._text[match.start() :]
+        self._root_start = 0
+        self._elem_start = 1
+        self._pos = 1
+        return True
+
+    def _parse_element(self, end: int) -> Any:
+        item = json.loads(self._text[self._elem_start : end])
+        self._items.append(item)
+        self.item_ends.append(self._offset + end)
+        return item
+
+    def _flush_scalar(self, end: int, completed: List[Any]):
+        if self._elem_emitted:
+            return
+        raw = self._text[self._elem_start : end]
+        if raw.strip():
+            completed.append(self._parse_element(end))
+
+    def _trim(self, keep_from: int):
+        if keep_from <= 0:
+            return
+        self._text = self._text[keep_from:]
+        self._offset += keep_from
+        self._pos -= keep_from
+        self._elem_start -= keep_from
+
+
+_decoder = json.JSONDecoder()
+
+
+def parse_json_text(content: str) -> Any:
+    """
+    从完整文本中提取并解析JSON
+    从第一个对象或数组起点开始一次解码，忽略前后的说明文字和代码块标记；
+    括号后的第一个值就无法解码时（如说明文字中的"[注]"）视为说明文字，继续尝试下一个起点；
+    已开始的JSON在更后面解码失败（截断或格式错误）时直接报错，不退回到其中的片段
+    """
+    pos = 0
+    error = None
+    while True:
+        match = _ROOT_START.search(content, pos)
+        if match is None:
+            break
+        try:
+            value, _ = _decoder.raw_decode(content, match.start())
+            return value
+        except json.JSONDecodeError as e:
+            first_token = _SKIP_WS.match(content, match.end()).end()
+            if e.pos > first_token:
+                error = e
+                break
+            if error is None:
+                error = e
+            pos = match.end()
+    if error is None:
+        raise ValueError("未找到有效的JSON内容")
+    if error.pos >= len(content):
+        raise ValueError("JSON格式不完整")
+    raise error
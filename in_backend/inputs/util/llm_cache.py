@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def normalize_messages(messages: List[Dict]) -> List[Dict]:
+    """规范化消息列表：统一换行并去除行尾空白，避免缩进差异导致缓存未命中"""
+    normalized = []
+    for msg in messages:
+        content = msg.get("content") or ""
+        content = content.replace("\r\n", "\n")
+        content = "\n".join(line.rstrip() for line in content.strip().split("\n"))
+        normalized.append({"role": msg.get("role"), "content": content})
+    return normalized
+
+
+def make_cache_key(
+    model: str,
+    base_url: str,
+    messages: List[Dict],
+    temperature: float,
+    max_tokens: int,
+) -> str:
+    """根据请求内容生成缓存键"""
+    payload = {
+        "model": model,
+        "base_url": (base_url or "").rstrip("/"),
+        "messages": normalize_messages(messages),
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LLM响应缓存
+    内存层为容量受限的LRU，磁盘层按键存放JSON文件，按过期时间和总大小淘汰
+    磁盘读写在线程中执行，不阻塞事件循环
+    """
+
+    def __init__(
+        self,
+        memory_entries: int = 256,
+        disk_dir: Optional[str] = None,
+        ttl: float = 7 * 24 * 3600,
+        max_disk_bytes: int = 128 * 1024 * 1024,
+    ):
+        self.memory_entries = memory_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+
+        # 键 -> (写入时间, 内容)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # 磁盘索引：键 -> (写入时间, 文件大小)，首次访问磁盘时建立
+        self._disk_index: Optional[Dict[str, tuple]] = None
+        self._disk_bytes = 0
+        # 保护磁盘索引，磁盘操作在线程池中并发执行
+        self._disk_lock = threading.Lock()
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    async def get(self, key: str) -> Optional[str]:
+        """查询缓存，未命中或已过期时返回None"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, content = entry
+            if now - created_at <= self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return content
+            del self._memory[key]
+
+        entry = None
+        if self.disk_dir is not None:
+            entry = await asyncio.to_thread(self._disk_get, key, now)
+        if entry is not None:
+            created_at, content = entry
+            self._memory_put(key, created_at, content)
+            self.counters["disk_hits"] += 1
+            return content
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, content: str):
+        """写入缓存"""
+        created_at = time.time()
+        self._memory_put(key, created_at, content)
+        self.counters["writes"] += 1
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._disk_put, key, created_at, content)
+
+    async def remove(self, key: str):
+        """删除缓存项（如回复事后被发现无法使用）"""
+        self._memory.pop(key, None)
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._disk_remove_locked, key)
+
+    def record_bypass(self):
+        """记录一次跳过缓存的请求"""
+        self.counters["bypassed"] += 1
+
+    async def stats(self) -> Dict:
+        """返回命中统计和容量信息"""
+        lookups = (
+            self.counters["memory_hits"]
+            + self.counters["disk_hits"]
+            + self.counters["misses"]
+        )
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        index = {}
+        if self.disk_dir is not None:
+            index = await asyncio.to_thread(self._load_disk_index_locked)
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_capacity": self.memory_entries,
+            "disk_entries": len(index),
+            "disk_bytes": self._disk_bytes,
+            "disk_capacity_bytes": self.max_disk_bytes,
+        }
+
+    def _memory_put(self, key: str, created_at: float, content: str):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (created_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _path_for(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _load_disk_index_locked(self) -> Dict[str, tuple]:
+        with self._disk_lock:
+            return self._load_disk_index()
+
+    def _load_disk_index(self) -> Dict[str, tuple]:
+        if self._disk_index is not None:
+            return self._disk_index
+        self._disk_index = {}
+        self._disk_bytes = 0
+        if self.disk_dir is None or not self.disk_dir.exists():
+            return self._disk_index
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            self._disk_index[path.stem] = (stat.st_mtime, stat.st_size)
+            self._disk_bytes += stat.st_size
+        return self._disk_index
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._disk_lock:
+            if key not in self._load_disk_index():
+                return None
+            path = self._path_for(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                self._disk_remove(key)
+                return None
+            if now - data.get("created_at", 0) > self.ttl:
+                self._disk_remove(key)
+                return None
+            return data["created_at"], data["content"]
+
+    def _disk_put(self, key: str, created_at: float, content: str):
+        raw = json.dumps(
+            {"created_at": created_at, "content": content}, ensure_ascii=False
+        ).encode("utf-8")
+        with self._disk_lock:
+            self._disk_write(key, created_at, raw)
+
+    def _disk_write(self, key: str, created_at: float, raw: bytes):
+        index = self._load_disk_index()
+        path = self._path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再替换，避免并发读到半个文件
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        if key in index:
+            self._disk_bytes -= index[key][1]
+        index[key] = (created_at, len(raw))
+        self._disk_bytes += len(raw)
+        self._evict_disk(created_at)
+
+    def _disk_remove_locked(self, key: str):
+        with self._disk_lock:
+            self._disk_remove(key)
+
+    def _disk_remove(self, key: str):
+        index = self._load_disk_index()
+        entry = index.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+        try:
+            self._path_for(key).unlink()
+        except OSError:
+            pass
+
+    def _evict_disk(self, now: float):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        index = self._load_disk_index()
+        # 先淘汰过期项，再按写入时间从旧到新淘汰
+        for key, (created_at, _) in sorted(index.items(), key=lambda kv: kv[1][0]):
+            if self._disk_bytes <= self.max_disk_bytes and now - created_at <= self.ttl:
+                break
+            self._disk_remove(key)
+            self.counters["evictions"] += 1
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class TokenBucket:
+    """
+    令牌桶，per_minute为每分钟补充的数量，也是桶的容量
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def set_rate(self, per_minute: float):
+        self._refill()
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """获得amount个令牌还需等待的秒数，amount可超过容量（用于估算排队时间）"""
+        self._refill()
+        if amount <= self.tokens:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+
+class ModelRateLimiter:
+    """
+    单个模型的请求数（RPM）和token数（TPM）限制
+    等待中的请求按连接ID分组，各连接轮流获得配额，避免一个会话的大量请求阻塞其他会话；
+    同一连接内按先后顺序放行
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self._requests: Optional[TokenBucket] = None
+        self._tokens: Optional[TokenBucket] = None
+        self.configure(rpm, tpm)
+        # 连接ID -> 等待中的(token数, future)
+        self._queues: Dict[str, Deque] = {}
+        # 轮转顺序
+        self._order: Deque[str] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.counters = {"granted": 0, "queued": 0, "total_wait": 0.0}
+
+    def configure(self, rpm: float = 0, tpm: float = 0):
+        """更新限额，0或空表示不限制"""
+        self.rpm = rpm or 0
+        self.tpm = tpm or 0
+        self._requests = self._update_bucket(self._requests, self.rpm)
+        self._tokens = self._update_bucket(self._tokens, self.tpm)
+
+    @staticmethod
+    def _update_bucket(bucket: Optional[TokenBucket], per_minute: float):
+        if not per_minute:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute)
+        if bucket.capacity != per_minute:
+            bucket.set_rate(per_minute)
+        return bucket
+
+    @property
+    def waiting(self) -> int:
+        """等待中的请求数"""
+        return sum(
+            1
+            for queue in self._queues.values()
+            for _, future in queue
+            if not future.done()
+        )
+
+    def _clamp(self, tokens: int) -> int:
+        # 超过容量的请求按容量计，避免永远无法放行
+        if self._tokens is not None:
+            return min(tokens, int(self._tokens.capacity))
+        return tokens
+
+    def _wait_time(self, requests: int, tokens: int) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(requests))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return wait
+
+    def _consume(self, tokens: int):
+        if self._requests is not None:
+            self._requests.consume(1)
+        if self._tokens is not None:
+            self._tokens.consume(tokens)
+
+    def expected_wait(self, tokens: int = 0) -> float:
+        """估算新请求排在所有等待请求之后需要等待的秒数"""
+        queued = [
+            amount
+            for queue in self._queues.values()
+            for amount, future in queue
+            if not future.done()
+        ]
+        return self._wait_time(len(queued) + 1, sum(queued) + self._clamp(tokens))
+
+    async def acquire(self, connection_id: str, tokens: int) -> float:
+        """获取一次请求的配额，返回等待的秒数"""
+        tokens = self._clamp(tokens)
+        if not self._order and self._wait_time(1, tokens) == 0:
+            self._consume(tokens)
+            self.counters["granted"] += 1
+            return 0.0
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(connection_id)
+        if queue is None:
+            queue = self._queues[connection_id] = deque()
+            self._order.append(connection_id)
+        queue.append((tokens, future))
+        self.counters["queued"] += 1
+        if self._timer is None:
+            self._pump()
+        # 取消的请求留在队列中，由_pump跳过
+        await future
+        waited = time.monotonic() - started
+        self.counters["total_wait"] += waited
+        return waited
+
+    def reschedule(self):
+        """限额变化后重新计算放行时间"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pump()
+
+    def _pump(self):
+        self._timer = None
+        while self._order:
+            connection_id = self._order[0]
+            queue = self._queues[connection_id]
+            while queue and queue[0][1].done():
+                queue.popleft()
+            if not queue:
+                self._order.popleft()
+                del self._queues[connection_id]
+                continue
+
+            tokens, future = queue[0]
+            wait = self._wait_time(1, tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            self._consume(tokens)
+            queue.popleft()
+            future.set_result(None)
+            self.counters["granted"] += 1
+            # 放行后该连接排到队尾
+            self._order.popleft()
+            if queue:
+                self._order.append(connection_id)
+            else:
+                del self._queues[connection_id]
+
+    def stats(self) -> Dict:
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "waiting": self.waiting,
+            "connections": len(self._queues),
+            "expected_wait": round(self.expected_wait(), 2),
+            "granted": self.counters["granted"],
+            "queued": self.counters["queued"],
+            "total_wait": round(self.counters["total_wait"], 2),
+        }
@@ -0,0 +1,210 @@
+import asyncio
+import email.utils
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import openai
+
+# 可重试的HTTP状态码：请求超时、冲突、频率限制及服务端错误
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间直接拒绝请求"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(
+            f"模型 '{name}' 暂时不可用（熔断中），约 {retry_in:.0f} 秒后重试"
+        )
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断错误是否值得重试：连接错误、超时、429及5xx"""
+    if isinstance(error, openai.APIConnectionError):
+        # 包括APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """
+    从错误响应头中读取服务端建议的等待秒数
+    支持retry-after-ms（毫秒）和retry-after（秒数或HTTP日期）
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """
+    单个模型的熔断器
+    连续失败达到阈值后打开，打开期间直接拒绝；
+    经过recovery_timeout后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout=30):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+        self.counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """请求前检查，熔断中时抛出CircuitOpenError"""
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                # 已有探测请求在进行中
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self._probing = True
+
+    def record_success(self):
+        self.counters["successes"] += 1
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self._probing = False
+
+    def record_neutral(self):
+        """请求未得出可用性结论（如被取消），只释放半开探测名额"""
+        self._probing = False
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        self.consecutive_failures += 1
+        if (
+            self.state == self.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state != self.OPEN:
+                self.counters["opened"] += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def snapshot(self) -> Dict:
+        """返回熔断器状态，用于状态接口"""
+        retry_in = 0.0
+        if self.state == self.OPEN:
+            retry_in = max(
+                0.0, self.recovery_timeout - (time.monotonic() - self.opened_at)
+            )
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": round(retry_in, 1),
+            **self.counters,
+        }
+
+
+class RetryPolicy:
+    """
+    重试策略
+    退避时间为full jitter（0到base_delay * 2^attempt之间随机，且不超过max_delay），
+    服务端给出Retry-After时以其为准；总耗时不超过deadline，剩余时间不够等待时直接放弃
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        deadline: Optional[float] = None,
+    ):
+        # max_retries为总尝试次数，与LLM_API.max_retries的原有含义一致
+        self.max_retries = max(1, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次（从0开始）失败后的退避时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def delay_for(self, attempt: int, error: Exception) -> float:
+        retry_after = parse_retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff(attempt)
+
+    async def run(
+        self,
+        func: Callable[[], Awaitable],
+        breaker: CircuitBreaker = None,
+        on_retry: Callable[[int, Exception, float], None] = None,
+    ):
+        """
+        执行func，可重试的错误按策略等待后重试
+        on_retry参数为(已失败次数, 错误, 等待秒数)
+        """
+        started = time.monotonic()
+        for attempt in range(self.max_retries):
+            if breaker is not None:
+                breaker.before_call()
+            try:
+                result = await func()
+            except BaseException as e:
+                retryable = is_retryable(e)
+                if breaker is not None:
+                    if retryable:
+                        breaker.record_failure()
+                    elif isinstance(e, openai.APIStatusError):
+                        # 4xx说明服务可达，不计入熔断
+                        breaker.record_success()
+                    else:
+                        breaker.record_neutral()
+                if not retryable or attempt >= self.max_retries - 1:
+                    raise
+                delay = self.delay_for(attempt, e)
+                if self.deadline is not None:
+                    remaining = self.deadline - (time.monotonic() - started)
+                    if delay >= remaining:
+                        raise
+                if on_retry:
+                    on_retry(attempt + 1, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -0,0 +1,43 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class LatencyTracker:
+    """
+    各模型最近若干次请求的延迟记录
+    流式请求记录首个token的延迟，非流式请求记录完整响应的延迟
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def percentile(self, model: str, percent: float) -> Optional[float]:
+        """返回延迟的百分位数（最近邻法），没有记录时返回None"""
+        samples = self._samples.get(model)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        rank = math.ceil(percent / 100 * len(ordered))
+        return ordered[min(len(ordered), max(1, rank)) - 1]
+
+    def stats(self) -> Dict:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": round(self.percentile(model, 50), 3),
+                "p95": round(self.percentile(model, 95), 3),
+            }
+            for model, samples in self._samples.items()
+            if samples
+        }
@@ -1,9 +1,17 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from inputs import input_router
 from outputs import output_router
+from outputs.outputs import stop_convert_tasks
 from status import status_router
-from inputs.inputs import set_config_path, start_cleanup_task, set_user_config
+from inputs.inputs import (
+    set_config_path,
+    start_cleanup_task,
+    set_user_config,
+    stop_running_jobs,
+)
+from inputs.util.LLM_interface import LLM_warm_up_clients, LLM_close_clients
 import sys
 from pathlib import Path
 import uvicorn
@@ -36,12 +44,18 @@ def config_filepath():
 async def lifespan(app: FastAPI):
     # 启动时执行
     await start_cleanup_task()
+    # 后台预热LLM连接，不阻塞启动
+    warm_up_task = asyncio.create_task(LLM_warm_up_clients())
     yield
     # 关闭时执行
-    # 可以添加清理资源的代码
+    warm_up_task.cancel()
+    await stop_running_jobs()
+    await stop_convert_tasks()
+    await LLM_close_clients()
 
 
-def main():
+def create_app() -> FastAPI:
+    """读取当前目录（或打包后的config目录）中的config.yaml并创建应用"""
     set_config_path(config_filepath())
     set_user_config()
 
@@ -59,7 +73,11 @@ def main():
     app.include_router(input_router)
     app.include_router(output_router)
     app.include_router(status_router)
+    return app
+
 
+def main():
+    app = create_app()
     uvicorn.run(app, host="127.0.0.1", port=17991, log_level="info")
 
 
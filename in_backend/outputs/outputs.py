@@ -1,9 +1,60 @@
-from fastapi import APIRouter
+import asyncio
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from .util import process_fbt, process_sys
+from inputs.util.jobs import GenerationJob
+from inputs.util.LLM_interface import config_manager, format_sse
+from inputs.util.metrics import convert_stage_seconds, metrics, sse_active_streams
+from .util import (
+    ConvertCancelled,
+    FBBUploader,
+    Workspace,
+    build_archive,
+    convert_workspace,
+    render_workspace,
+)
 
 output_router = APIRouter(prefix="/outputs", tags=["输出相关接口"])
 
+# 同时进行的转换数
+CONVERT_WORKERS = 2
+# 每次转换中并行生成和写入.fbt文件的线程数
+FBT_WRITE_WORKERS = 4
+
+# 转换在线程池中执行，不阻塞事件循环（SSE等其他请求）
+convert_executor = ThreadPoolExecutor(
+    max_workers=CONVERT_WORKERS, thread_name_prefix="convert"
+)
+# 进行中的转换：任务ID -> 取消标志
+convert_tasks: Dict[str, threading.Event] = {}
+# FBB上传客户端：(base_url, 并发数, 超时) -> 上传器，复用连接池
+fbb_uploaders: Dict[Tuple, FBBUploader] = {}
+# FBB上传任务：上传ID -> 任务，事件可断线重连后继续读取
+upload_jobs: Dict[str, GenerationJob] = {}
+# 保留的已结束上传任务数
+UPLOAD_JOBS_KEPT = 20
+metrics.gauge(
+    "convert_tasks_active", "进行中的转换数", callback=lambda: len(convert_tasks)
+)
+metrics.gauge(
+    "fbb_uploads_running",
+    "进行中的FBB上传数",
+    callback=lambda: sum(1 for job in upload_jobs.values() if not job.done),
+)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
 
 class WorkspaceConf(BaseModel):
     """
@@ -11,23 +62,300 @@ class WorkspaceConf(BaseModel):
     """
 
     conf: str
-    output_path: str
+    # 打包模式下不需要输出目录
+    output_path: Optional[str] = None
+    # 可选的任务ID，用于取消转换
+    task_id: Optional[str] = None
+    # 忽略输出目录中的清单，全部重新生成
+    force: bool = False
+    # 打包模式：不写入输出目录，直接返回包含全部文件和清单的zip包
+    archive: bool = False
 
 
-@output_router.post("/convert")
-async def get_categories(workspace_conf: WorkspaceConf):
+def observe_timings(mode: str, timings: Dict):
+    """将转换各阶段耗时（毫秒）记录到指标"""
+    for stage, ms in timings.items():
+        convert_stage_seconds.observe(ms / 1000, mode=mode, stage=stage)
+
+
+async def run_convert(
+    conf,
+    output_path: Optional[str],
+    task_id: Optional[str],
+    force: bool,
+    archive: bool = False,
+):
     """
-    保存工作区配置
+    在线程池中转换工作区配置，conf为JSON文本或字节，在工作线程中解析一次
+    打包模式返回zip文件响应，否则返回写入结果
     """
+    task_id = task_id or str(uuid.uuid4())
+    if not archive and not output_path:
+        return {
+            "success": False,
+            "message": "处理工作区配置时出错: 缺少输出目录output_path",
+            "task_id": task_id,
+        }
+    cancel_event = threading.Event()
+    convert_tasks[task_id] = cancel_event
+    loop = asyncio.get_running_loop()
     try:
-        process_fbt(workspace_conf.conf, workspace_conf.output_path)
-        process_sys(workspace_conf.conf, workspace_conf.output_path)
+        if archive:
+            content, result = await loop.run_in_executor(
+                convert_executor, build_archive, conf, cancel_event, FBT_WRITE_WORKERS
+            )
+            observe_timings("archive", result["timings"])
+            return Response(
+                content=content,
+                media_type="application/zip",
+                headers={
+                    "Content-Disposition": 'attachment; filename="workspace.zip"',
+                    "X-Task-Id": task_id,
+                    "X-Convert-Timings": json.dumps(result["timings"]),
+                },
+            )
+        result = await loop.run_in_executor(
+            convert_executor,
+            convert_workspace,
+            conf,
+            output_path,
+            cancel_event,
+            FBT_WRITE_WORKERS,
+            force,
+        )
+    except asyncio.CancelledError:
+        # 请求被取消时通知工作线程停止
+        cancel_event.set()
+        raise
+    except ConvertCancelled:
+        return {
+            "success": False,
+            "message": "转换已取消",
+            "task_id": task_id,
+        }
     except Exception as e:
         return {
             "success": False,
             "message": f"处理工作区配置时出错: {str(e)}",
+            "task_id": task_id,
         }
+    finally:
+        convert_tasks.pop(task_id, None)
+    observe_timings("directory", result["timings"])
     return {
         "success": True,
         "message": "工作区配置处理成功",
+        "task_id": task_id,
+        **result,
     }
+
+
+@output_router.post("/convert")
+async def get_categories(workspace_conf: WorkspaceConf):
+    """
+    保存工作区配置
+    """
+    return await run_convert(
+        workspace_conf.conf,
+        workspace_conf.output_path,
+        workspace_conf.task_id,
+        workspace_conf.force,
+        workspace_conf.archive,
+    )
+
+
+@output_router.post("/convert_workspace")
+async def convert_workspace_body(
+    request: Request,
+    output_path: Optional[str] = None,
+    task_id: Optional[str] = None,
+    force: bool = False,
+    archive: bool = False,
+):
+    """
+    保存工作区配置 - 请求体直接为工作区JSON，不再嵌套在字符串中
+    请求体可以分块传输，但会先完整缓存在内存中，再在工作线程中用json一次解析
+    （标准库没有增量解析器，不是边接收边解析），峰值内存约为请求体加解析结果
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+    return await run_convert(body, output_path, task_id, force, archive)
+
+
+@output_router.post("/cancel/{task_id}")
+async def cancel_convert(task_id: str):
+    """
+    取消进行中的转换，已写入的文件保持完整，未开始的文件不再生成
+    """
+    cancel_event = convert_tasks.get(task_id)
+    if cancel_event is None:
+        raise HTTPException(status_code=404, detail="转换任务不存在或已结束")
+    cancel_event.set()
+    return {"success": True, "message": "已请求取消转换", "task_id": task_id}
+
+
+class FBBUploadConf(BaseModel):
+    """
+    FBB上传配置：上传output_path目录中的.fbt/.sys文件，
+    或由conf（工作区配置）在内存中生成后直接上传
+    """
+
+    output_path: Optional[str] = None
+    conf: Optional[str] = None
+    # 默认使用配置中的fbb.base_url
+    base_url: Optional[str] = None
+
+
+def get_fbb_uploader(base_url: Optional[str] = None) -> FBBUploader:
+    """获取FBB上传器，相同地址和连接参数的上传共用一个连接池"""
+    base_url = base_url or config_manager.get("fbb.base_url", "http://localhost:61499")
+    concurrency = config_manager.get("fbb.concurrency", 4)
+    timeout = config_manager.get("fbb.timeout", 30)
+    key = (base_url.rstrip("/"), concurrency, timeout)
+    uploader = fbb_uploaders.get(key)
+    if uploader is None:
+        uploader = fbb_uploaders[key] = FBBUploader(base_url, concurrency, timeout)
+    # 重试参数每次按配置更新
+    uploader.max_retries = max(0, int(config_manager.get("fbb.max_retries", 3)))
+    uploader.base_delay = config_manager.get("fbb.base_delay", 0.5)
+    uploader.max_delay = config_manager.get("fbb.max_delay", 5.0)
+    return uploader
+
+
+def read_output_files(output_path: str) -> List[Tuple[str, bytes]]:
+    """读取输出目录中的.fbt和.sys文件"""
+    files = []
+    for filename in sorted(os.listdir(output_path)):
+        if filename.endswith(".fbt") or filename.endswith(".sys"):
+            with open(os.path.join(output_path, filename), "rb") as f:
+                files.append((filename, f.read()))
+    return files
+
+
+def render_upload_files(conf: str) -> List[Tuple[str, bytes]]:
+    """由工作区配置在内存中生成.fbt和.sys文件"""
+    return [
+        (item["file"], item["content"])
+        for item in render_workspace(Workspace.parse(conf))
+    ]
+
+
+def upload_event(event: str, data: Dict) -> Dict:
+    return {"event": event, "data": json.dumps(data, ensure_ascii=False)}
+
+
+async def upload_events(upload_conf: FBBUploadConf, uploader: FBBUploader):
+    """上传到FBB并产生进度事件，最后总是一个close事件"""
+    try:
+        if not await uploader.ping():
+            raise RuntimeError(f"无法连接FBB IDE: {uploader.base_url}")
+        yield upload_event("status", {"message": "正在准备文件..."})
+        loop = asyncio.get_running_loop()
+        if upload_conf.conf is not None:
+            files = await loop.run_in_executor(
+                convert_executor, render_upload_files, upload_conf.conf
+            )
+        else:
+            files = await loop.run_in_executor(
+                convert_executor, read_output_files, upload_conf.output_path
+            )
+        total = len(files)
+        yield upload_event(
+            "status", {"message": f"开始上传 {total} 个文件", "total": total}
+        )
+
+        done, failed = 0, []
+        async for result in uploader.upload(files):
+            done += 1
+            if not result["success"]:
+                failed.append(result["file"])
+            yield upload_event("progress", {**result, "done": done, "total": total})
+
+        yield upload_event(
+            "complete",
+            {
+                "success_count": total - len(failed),
+                "total": total,
+                "failed": failed,
+            },
+        )
+        yield upload_event("close", {"message": "SSE连接结束"})
+    except Exception as e:
+        yield upload_event("error", {"message": f"上传到FBB失败: {str(e)}"})
+        yield upload_event("close", {"message": "SSE连接终止"})
+
+
+async def finish_upload_job(job: GenerationJob):
+    """只保留最近的若干个已结束的上传任务"""
+    finished = [j for j in upload_jobs.values() if j.done]
+    for old in finished[: max(0, len(finished) - UPLOAD_JOBS_KEPT)]:
+        upload_jobs.pop(old.job_id, None)
+
+
+@output_router.post("/upload_fbb")
+async def upload_fbb(upload_conf: FBBUploadConf):
+    """
+    将生成的代码上传到FBB IDE - 返回上传ID，通过SSE连接获取每个文件的上传进度
+    """
+    if upload_conf.conf is None and not upload_conf.output_path:
+        return {"success": False, "message": "需要提供output_path或conf"}
+    upload_id = str(uuid.uuid4())
+    uploader = get_fbb_uploader(upload_conf.base_url)
+    job = GenerationJob(
+        upload_id, upload_events(upload_conf, uploader), on_finish=finish_upload_job
+    )
+    upload_jobs[upload_id] = job
+    job.start()
+    return {
+        "success": True,
+        "message": "开始上传，可以通过SSE连接监控进度",
+        "upload_id": upload_id,
+    }
+
+
+@output_router.get("/upload_fbb/{upload_id}/sse")
+async def upload_fbb_sse(upload_id: str, last_event_id: str = Header(None)):
+    """
+    通过上传ID建立SSE连接，接收每个文件的上传结果，断线重连时从Last-Event-ID之后继续
+    """
+    job = upload_jobs.get(upload_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="上传ID无效或已过期")
+    try:
+        resume_from = int(last_event_id or 0)
+    except ValueError:
+        resume_from = 0
+
+    async def stream():
+        sse_active_streams.inc(endpoint="upload_fbb")
+        try:
+            async for event in job.events_after(resume_from):
+                yield format_sse({"event": event.event, "data": event.data}, event.seq)
+        finally:
+            sse_active_streams.dec(endpoint="upload_fbb")
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@output_router.get("/fbb_status")
+async def fbb_status(base_url: Optional[str] = None):
+    """
+    检查FBB IDE是否在运行
+    """
+    uploader = get_fbb_uploader(base_url)
+    return {"running": await uploader.ping(), "base_url": uploader.base_url}
+
+
+async def stop_convert_tasks():
+    """取消进行中的转换和上传，关闭线程池和FBB连接"""
+    for cancel_event in list(convert_tasks.values()):
+        cancel_event.set()
+    for job in list(upload_jobs.values()):
+        await job.cancel()
+    convert_executor.shutdown(wait=False, cancel_futures=True)
+    for uploader in list(fbb_uploaders.values()):
+        await uploader.close()
+    fbb_uploaders.clear()
@@ -1,2 +1,6 @@
-from .transfer_fbt import process_fbt
-from .transfer_sys import process_sys
\ No newline at end of file
+from .transfer_fbt import ConvertCancelled, process_fbt
+from .transfer_sys import process_sys
+from .convert import convert_workspace
+from .workspace import Workspace
+from .archive import build_archive, render_workspace
+from .fbb_upload import FBBUploader
@@ -0,0 +1,93 @@
+import hashlib
+import io
+import json
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Tuple
+
+from .manifest import GENERATOR_VERSION
+from .transfer_fbt import ConvertCancelled, convert_to_fbt
+from .transfer_sys import SYS_FILE, write_sys
+from .workspace import Workspace
+
+ARCHIVE_MANIFEST = "manifest.json"
+
+
+def render_workspace(
+    workspace: Workspace, cancel_event: threading.Event = None, max_workers: int = 4
+) -> Iterator[Dict]:
+    """
+    在内存中依次生成各.fbt文件和mysys.sys（.fbt在线程池中并行生成）
+    产生{"file", "type", "name", "content"}，content为UTF-8字节
+    """
+
+    def render(block):
+        if cancel_event is not None and cancel_event.is_set():
+            raise ConvertCancelled()
+        return convert_to_fbt(block)
+
+    # 同名设备只保留最后一个，与写入目录时一致
+    blocks = list({b["name"]: b for b in workspace.block_categories}.values())
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(blocks))), thread_name_prefix="fbt"
+    ) as pool:
+        for block, xml_output in zip(blocks, pool.map(render, blocks)):
+            yield {
+                "file": block["name"] + ".fbt",
+                "type": "FBType",
+                "name": block["name"],
+                "content": xml_output.encode("utf-8"),
+            }
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConvertCancelled()
+    sys_buffer = io.StringIO()
+    write_sys(workspace, sys_buffer)
+    yield {
+        "file": SYS_FILE,
+        "type": "System",
+        "name": "demo",
+        "content": sys_buffer.getvalue().encode("utf-8"),
+    }
+
+
+def build_archive(
+    conf,
+    cancel_event: threading.Event = None,
+    max_workers: int = 4,
+) -> Tuple[bytes, Dict]:
+    """
+    在内存中生成包含全部.fbt文件、mysys.sys和清单的zip包，不写磁盘
+    返回(zip内容, 结果信息)，结果信息包括清单和各阶段耗时（毫秒）
+    """
+    timings = {}
+    started = stage = time.perf_counter()
+
+    def lap(name):
+        nonlocal stage
+        now = time.perf_counter()
+        timings[name] = round((now - stage) * 1000, 2)
+        stage = now
+
+    workspace = Workspace.parse(conf)
+    lap("parse")
+
+    buffer = io.BytesIO()
+    files = []
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for item in render_workspace(workspace, cancel_event, max_workers):
+            content = item.pop("content")
+            zf.writestr(item["file"], content)
+            item["sha256"] = hashlib.sha256(content).hexdigest()
+            files.append(item)
+        lap("render")
+
+        manifest = {"version": GENERATOR_VERSION, "files": files}
+        zf.writestr(
+            ARCHIVE_MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2)
+        )
+    lap("zip")
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    return buffer.getvalue(), {"manifest": manifest, "timings": timings}
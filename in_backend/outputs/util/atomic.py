@@ -0,0 +1,46 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# 进程的umask，os.umask只能在设置时读取，在导入时读取一次（此时尚未有其他线程写文件）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _file_mode(path: str) -> int:
+    """新文件的权限：替换已有文件时沿用其权限，否则与open()新建文件一致（0o666去掉umask）"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+@contextmanager
+def atomic_open(path, encoding="utf-8"):
+    """
+    以写入模式打开文件，内容先写入同目录下的临时文件，成功后重命名为目标文件
+    出错时删除临时文件，目标文件保持原样，不会留下写了一半的文件
+    mkstemp创建的临时文件权限为0600，重命名前改为与直接写入时相同的权限
+    """
+    path = os.fspath(path)
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{name}.", suffix=".tmp", dir=directory or "."
+    )
+    try:
+        with open(fd, "w", encoding=encoding) as f:
+            yield f
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path, text: str, encoding="utf-8"):
+    """原子地写入整个文件"""
+    with atomic_open(path, encoding=encoding) as f:
+        f.write(text)
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from typing import Dict
+
+from .manifest import Manifest
+from .transfer_fbt import ConvertCancelled, process_fbt
+from .transfer_sys import SYS_FILE, process_sys
+from .workspace import Workspace
+
+
+def convert_workspace(
+    conf,
+    output_path: str,
+    cancel_event: threading.Event = None,
+    max_workers: int = 4,
+    force: bool = False,
+) -> Dict:
+    """
+    将工作区配置转换为.fbt和.sys文件（同步执行，应在线程池中调用）
+    conf可以是JSON文本（str/bytes）、字典或Workspace，只解析一次，由各阶段共用
+    按输出目录中的清单只生成输入有变化的文件，force为True时全部重新生成
+    返回写入和未变的文件名，以及各阶段耗时（毫秒）
+    """
+    timings = {}
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise ConvertCancelled()
+
+    started = stage = time.perf_counter()
+
+    def lap(name):
+        nonlocal stage
+        now = time.perf_counter()
+        timings[name] = round((now - stage) * 1000, 2)
+        stage = now
+
+    workspace = Workspace.parse(conf)
+    manifest = Manifest(output_path)
+    if force:
+        manifest.entries = {}
+    lap("parse")
+    check_cancelled()
+    written = process_fbt(
+        workspace,
+        output_path,
+        max_workers=max_workers,
+        cancel_event=cancel_event,
+        manifest=manifest,
+    )
+    lap("fbt")
+    check_cancelled()
+    sys_path = process_sys(workspace, output_path, manifest=manifest)
+    if sys_path is not None:
+        written.append(sys_path)
+    lap("sys")
+
+    filenames = {block["name"] + ".fbt" for block in workspace.block_categories}
+    filenames.add(SYS_FILE)
+    manifest.retain(filenames)
+    manifest.save()
+    lap("manifest")
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+
+    written = sorted(os.path.basename(path) for path in written)
+    return {
+        "written": written,
+        "unchanged": sorted(filenames.difference(written)),
+        "timings": timings,
+    }
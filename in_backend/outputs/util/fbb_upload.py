@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Dict, List, Tuple
+
+import httpx
+
+# 可重试的HTTP状态码：请求超时、频率限制及服务端错误
+RETRYABLE_STATUS = {408, 429}
+
+
+class FBBUploader:
+    """
+    向FBB IDE的/import接口上传生成的文件
+    使用连接池复用连接，并发数受限；连接错误、超时、5xx以及返回code不为1时按full jitter退避重试
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int = 4,
+        timeout: float = 30,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 5.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5)),
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+        )
+
+    async def ping(self) -> bool:
+        """检查FBB是否在运行"""
+        try:
+            response = await self.client.head("/", timeout=1)
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def upload_file(self, filename: str, content: bytes) -> Dict:
+        """上传单个文件，返回{"file", "success", "code", "attempts", "elapsed", "error"}"""
+        started = time.perf_counter()
+        code, error = None, None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff(attempt - 1))
+            try:
+                response = await self.client.post(
+                    "/import",
+                    files={filename: (filename, content, "application/octet-stream")},
+                )
+            except httpx.TransportError as e:
+                code, error = None, f"{type(e).__name__}: {e}"
+                continue
+            if response.status_code >= 500 or response.status_code in RETRYABLE_STATUS:
+                code, error = None, f"HTTP {response.status_code}"
+                continue
+            if response.status_code != 200:
+                # 其他4xx重试也不会成功
+                code, error = None, f"HTTP {response.status_code}"
+                break
+            try:
+                code = response.json().get("code")
+            except (ValueError, AttributeError):
+                code = None
+            if code == 1:
+                error = None
+                break
+            error = f"FBB返回code: {code}"
+        return {
+            "file": filename,
+            "success": code == 1,
+            "code": code,
+            "attempts": attempt + 1,
+            "elapsed": round(time.perf_counter() - started, 3),
+            "error": error,
+        }
+
+    async def upload(self, files: List[Tuple[str, bytes]]) -> AsyncIterator[Dict]:
+        """
+        并发上传文件，按完成顺序产生每个文件的结果
+        .sys文件依赖其中的FB类型，在所有.fbt文件完成后再上传
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(filename, content):
+            async with semaphore:
+                return await self.upload_file(filename, content)
+
+        types = [item for item in files if not item[0].endswith(".sys")]
+        systems = [item for item in files if item[0].endswith(".sys")]
+        for group in (types, systems):
+            tasks = [asyncio.create_task(bounded(*item)) for item in group]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+from typing import Dict
+
+from .atomic import atomic_write
+
+MANIFEST_FILE = ".manifest.json"
+# 生成格式变化时增加版本号，使已有清单全部失效
+GENERATOR_VERSION = 1
+
+
+def content_hash(obj) -> str:
+    """对象的规范化内容哈希（按键排序的JSON）"""
+    canonical = json.dumps(
+        obj, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """
+    输出目录中各生成文件的清单：输入内容哈希及写入后的文件大小和修改时间
+    输入未变且文件未被删除或修改时跳过生成
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.entries: Dict[str, Dict] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == GENERATOR_VERSION:
+                self.entries = data.get("files", {})
+        except (OSError, ValueError, AttributeError):
+            # 清单不存在或损坏时全部重新生成
+            self.entries = {}
+
+    def _file_path(self, filename: str) -> str:
+        return os.path.join(os.path.dirname(self.path), filename)
+
+    def is_current(self, filename: str, input_hash: str) -> bool:
+        """文件是否已由相同的输入生成且之后未被改动"""
+        entry = self.entries.get(filename)
+        if entry is None or entry.get("hash") != input_hash:
+            return False
+        try:
+            stat = os.stat(self._file_path(filename))
+        except OSError:
+            return False
+        return stat.st_size == entry.get("size") and stat.st_mtime_ns == entry.get(
+            "mtime_ns"
+        )
+
+    def record(self, filename: str, input_hash: str):
+        """记录刚写入的文件"""
+        stat = os.stat(self._file_path(filename))
+        self.entries[filename] = {
+            "hash": input_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def retain(self, filenames):
+        """只保留本次工作区中仍存在的文件的记录"""
+        self.entries = {
+            name: entry for name, entry in self.entries.items() if name in filenames
+        }
+
+    def save(self):
+        atomic_write(
+            self.path,
+            json.dumps(
+                {"version": GENERATOR_VERSION, "files": self.entries},
+                ensure_ascii=False,
+                indent=2,
+            ),
+        )
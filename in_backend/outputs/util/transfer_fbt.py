@@ -1,16 +1,24 @@
-import json
 import os
+import threading
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from concurrent.futures import ThreadPoolExecutor
+
+from .atomic import atomic_open
+from .manifest import Manifest, content_hash
+from .workspace import Workspace
+from .xml_writer import to_pretty_xml, write_pretty_xml
+
+
+class ConvertCancelled(Exception):
+    """转换被取消"""
 
 
 def prettify(elem):
-    rough = ET.tostring(elem, "utf-8")
-    reparsed = minidom.parseString(rough)
-    return reparsed.toprettyxml(indent="  ", encoding="UTF-8").decode("utf-8")
+    return to_pretty_xml(elem, indent="  ")
 
 
-def convert_to_fbt(json_data):
+def build_fbt(json_data):
+    """由设备配置构建FBType元素树"""
     fb_name = json_data.get("name", "MyBasicFB")
     fb_comment = json_data.get("description", "A basic function block example")
 
@@ -112,18 +120,75 @@ def convert_to_fbt(json_data):
         )
         ET.SubElement(alg_elem, "ST").text = alg["Code"]
 
-    return prettify(root)
+    return root
 
 
-# === 主处理函数 ===
-def process_fbt(data, output_folder):
-    data = json.loads(data)
-    for i in data["blockCategories"]:
-        xml_output = convert_to_fbt(i)
-        fbt_filename = i["name"] + ".fbt"
-        fbt_path = os.path.join(output_folder, fbt_filename)
+def convert_to_fbt(json_data):
+    return prettify(build_fbt(json_data))
+
+
+def write_fbt(block, output_folder, cancel_event: threading.Event = None):
+    """生成单个设备的.fbt文件，直接序列化写入（原子写入）"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConvertCancelled()
+    root = build_fbt(block)
+    fbt_path = os.path.join(output_folder, block["name"] + ".fbt")
+    try:
+        with atomic_open(fbt_path) as f:
+            write_pretty_xml(root, f, indent="  ")
+    except Exception as e:
+        raise RuntimeError(f"Error writing FBT file {fbt_path}: {e}") from e
+    return fbt_path
+
+
+def write_fbts(blocks, output_folder, max_workers: int, cancel_event=None):
+    """在线程池中并行生成和写入多个.fbt文件，返回文件路径列表"""
+    if max_workers <= 1 or len(blocks) <= 1:
+        return [write_fbt(block, output_folder, cancel_event) for block in blocks]
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(blocks)), thread_name_prefix="fbt"
+    ) as pool:
+        futures = [
+            pool.submit(write_fbt, block, output_folder, cancel_event)
+            for block in blocks
+        ]
         try:
-            with open(fbt_path, "w", encoding="utf-8") as f:
-                f.write(xml_output)
-        except Exception as e:
-            raise RuntimeError(f"Error writing FBT file {fbt_path}: {e}") from e
+            return [future.result() for future in futures]
+        except BaseException:
+            # 出错或取消时不再开始剩余的文件
+            for future in futures:
+                future.cancel()
+            raise
+
+
+# === 主处理函数 ===
+def process_fbt(
+    data,
+    output_folder,
+    max_workers: int = 4,
+    cancel_event: threading.Event = None,
+    manifest: Manifest = None,
+):
+    """
+    为每个设备生成.fbt文件，各文件在线程池中并行生成和写入
+    data可以是JSON文本、字典或已解析的Workspace；cancel_event被设置后不再开始新的文件；
+    传入manifest时跳过输入未变的文件。返回写入的文件路径列表
+    """
+    workspace = Workspace.parse(data)
+    # 同名设备只写最后一个，与依次写入时的结果一致
+    blocks = {block["name"]: block for block in workspace.block_categories}
+    if manifest is None:
+        return write_fbts(
+            list(blocks.values()), output_folder, max_workers, cancel_event
+        )
+
+    hashes = {name: content_hash(block) for name, block in blocks.items()}
+    changed = [
+        name for name in blocks if not manifest.is_current(name + ".fbt", hashes[name])
+    ]
+    paths = write_fbts(
+        [blocks[name] for name in changed], output_folder, max_workers, cancel_event
+    )
+    for name in changed:
+        manifest.record(name + ".fbt", hashes[name])
+    return paths
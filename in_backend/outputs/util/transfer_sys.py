@@ -1,135 +1,205 @@
-import json
 from pathlib import Path
 
+from .atomic import atomic_open
+from .manifest import Manifest, content_hash
+from .workspace import Workspace
 
-def process_sys(data, output_path):
-    data = json.loads(data)
-    id_total = []
-    for i in data["connections"]:
-        if i["start"]["blockId"] not in id_total:
-            id_total.append(i["start"]["blockId"])
-        if i["end"]["blockId"] not in id_total:
-            id_total.append(i["end"]["blockId"])
-
-    id_name = {}
-    id_signal_input = {}
-    id_signal_output = {}
-    id_var_input = {}
-    id_var_output = {}
-    for i in data["blocks"]:
-        if i["id"] not in id_name:
-            id_name[i["id"]] = i["categoryConf"]["name"]
-        if i["id"] not in id_signal_input:
-            id_signal_input[i["id"]] = i["categoryConf"]["signal_input"]
-        if i["id"] not in id_signal_output:
-            id_signal_output[i["id"]] = i["categoryConf"]["signal_output"]
-        if i["id"] not in id_var_input:
-            id_var_input[i["id"]] = i["categoryConf"]["var_input"]
-        if i["id"] not in id_var_output:
-            id_var_output[i["id"]] = i["categoryConf"]["var_output"]
+SYS_FILE = "mysys.sys"
 
-    my_id_name = {}
+# 连线起点类型 -> (起点接口, 终点接口)
+CONNECTION_PORTS = {
+    "signal_output": ("signal_output", "signal_input"),
+    "var_output": ("var_output", "var_input"),
+}
+
+
+class ChunkedWriter:
+    """收集小段文本，累计到chunk_size个字符后一次写入文件"""
+
+    def __init__(self, f, chunk_size: int = 64 * 1024):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text: str):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self._f.write("".join(self._parts))
+            self._parts = []
+            self._size = 0
+
+
+def sys_inputs(workspace: Workspace):
+    """
+    生成.sys文件用到的输入，只包含write_sys实际读取的内容：
+    各设备的ID和类型（类型名及各接口名，相同的类型只记录一次），以及连线的端点
+    """
+    # (类型名, 各接口名) -> 序号
+    categories = {}
+    # 类型名 -> [(类型配置, 序号)]，与已见过的配置相同时不再逐个读取接口名
+    seen = {}
+    blocks = []
+    for block in workspace.blocks:
+        conf = block["categoryConf"]
+        known = seen.setdefault(conf["name"], [])
+        for other, index in known:
+            if other is conf or other == conf:
+                break
+        else:
+            category = (conf["name"],) + tuple(
+                tuple(port["name"] for port in conf[kind])
+                for kind in ("signal_input", "signal_output", "var_input", "var_output")
+            )
+            index = categories.setdefault(category, len(categories))
+            known.append((conf, index))
+        blocks.append((block["id"], index))
+    connections = [
+        (
+            i["start"]["type"],
+            i["start"]["blockId"],
+            i["start"]["index"],
+            i["end"]["blockId"],
+            i["end"]["index"],
+        )
+        for i in workspace.connections
+    ]
+    return {
+        "categories": list(categories),
+        "blocks": blocks,
+        "connections": connections,
+    }
+
+
+def write_sys(workspace: Workspace, f):
+    """将系统文件内容写入文本文件对象，连线全部解析成功后才开始写入"""
+    # 连线中出现的设备ID，按首次出现的顺序（dict作为有序集合）
+    id_total = {}
+    for i in workspace.connections:
+        id_total.setdefault(i["start"]["blockId"], None)
+        id_total.setdefault(i["end"]["blockId"], None)
+    id_total = list(id_total)
+
+    # 设备ID -> 设备配置，同一ID以第一次出现的为准
+    id_conf = {}
+    for i in workspace.blocks:
+        id_conf.setdefault(i["id"], i["categoryConf"])
+
+    # 同名设备按出现顺序编号
     name_count = {}
-    for i in id_name:
-        if id_name[i] not in name_count:
-            name_count[id_name[i]] = 1
+    for conf in id_conf.values():
+        name_count.setdefault(conf["name"], 1)
+    my_id_name = {}
     for i in id_total:
-        my_id_name[i] = id_name[i] + str(name_count[id_name[i]])
-        name_count[id_name[i]] += 1
+        name = id_conf[i]["name"]
+        my_id_name[i] = name + str(name_count[name])
+        name_count[name] += 1
+
+    # 一次遍历解析所有连线：(起点类型, 起点, 终点)
+    connections = []
+    for i in workspace.connections:
+        ports = CONNECTION_PORTS.get(i["start"]["type"])
+        if ports is None:
+            continue
+        start, end = i["start"], i["end"]
+        a = my_id_name[start["blockId"]]
+        b = id_conf[start["blockId"]][ports[0]][start["index"]]["name"]
+        c = my_id_name[end["blockId"]]
+        d = id_conf[end["blockId"]][ports[1]][end["index"]]["name"]
+        connections.append((start["type"], f"{a}.{b}", f"{c}.{d}"))
 
     # 写入
-    output_path = Path(output_path) / "mysys.sys"
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.truncate(0)
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write(
-            '<System ID="693fd363-ca58-481d-bfb5-881390ec4fc0" Name="demo" Namespace="demo" Version="" IDEVersion="v1.2.1" Comment="System including ThreeEventRouter">\n'
-        )
-        f.write('  <Identification Standard="61499-2"/>\n')
-        f.write("\n")
-        # <Mapping From="app.conveyor1" To="Device1.RES3"/>
-        for i in id_total:
-            f.write(f' <Mapping From="app.{my_id_name[i]}" To="Device1.RES3"/>\n')
-        f.write("\n")
-
-        f.write(
-            ' <Application Name="app" Comment="" Key="889a77a0-1c16-4b25-9bf5-da977b4a4a68">\n'
+    w = ChunkedWriter(f)
+    w.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    w.write(
+        '<System ID="693fd363-ca58-481d-bfb5-881390ec4fc0" Name="demo" Namespace="demo" Version="" IDEVersion="v1.2.1" Comment="System including ThreeEventRouter">\n'
+    )
+    w.write('  <Identification Standard="61499-2"/>\n')
+    w.write("\n")
+    # <Mapping From="app.conveyor1" To="Device1.RES3"/>
+    for i in id_total:
+        w.write(f' <Mapping From="app.{my_id_name[i]}" To="Device1.RES3"/>\n')
+    w.write("\n")
+
+    w.write(
+        ' <Application Name="app" Comment="" Key="889a77a0-1c16-4b25-9bf5-da977b4a4a68">\n'
+    )
+    w.write("    <SubAppNetwork>\n")
+
+    for n, i in enumerate(id_total):
+        # <FB Key="-1" Name="conveyor1" Namespace="demo" Type="straightConveyor" x="50"  y="0"   />
+        w.write(
+            f'      <FB Key="{-n-1}" Name="{my_id_name[i]}" Namespace="demo" Type="{id_conf[i]["name"]}" x="{150*n}" y="0" />\n'
         )
-        f.write("    <SubAppNetwork>\n")
 
-        for i in range(len(id_total)):
-            # <FB Key="-1" Name="conveyor1" Namespace="demo" Type="straightConveyor" x="50"  y="0"   />
-            f.write(
-                f'      <FB Key="{-i-1}" Name="{my_id_name[id_total[i]]}" Namespace="demo" Type="{id_name[id_total[i]]}" x="{150*i}" y="0" />\n'
+    w.write("      <EventConnections>\n")
+    for kind, source, destination in connections:
+        # <Connection Source="conveyor1.Running" Destination="三线.Start1" Priority="1"/>
+        if kind == "signal_output":
+            w.write(
+                f'        <Connection Source="{source}" Destination="{destination}" Priority="1"/>\n'
+            )
+    w.write("      </EventConnections>\n")
+    w.write("      <DataConnections>\n")
+    for kind, source, destination in connections:
+        if kind == "var_output":
+            w.write(
+                f'        <Connection Source="{source}" Destination="{destination}" Priority="1"/>\n'
             )
+    w.write("      </DataConnections>\n")
 
-        f.write("      <EventConnections>\n")
-
-        for i in data["connections"]:
-            # <Connection Source="conveyor1.Running" Destination="三线.Start1" Priority="1"/>
-            if i["start"]["type"] == "signal_output":
-                a = my_id_name[i["start"]["blockId"]]
-                b = id_signal_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
-                c = my_id_name[i["end"]["blockId"]]
-                d = id_signal_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
-                f.write(
-                    f'        <Connection Source="{a}.{b}" Destination="{c}.{d}" Priority="1"/>\n'
-                )
-        f.write("      </EventConnections>\n")
-        f.write("      <DataConnections>\n")
-        for i in data["connections"]:
-            if i["start"]["type"] == "var_output":
-                a = my_id_name[i["start"]["blockId"]]
-                b = id_var_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
-                c = my_id_name[i["end"]["blockId"]]
-                d = id_var_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
-                f.write(
-                    f'        <Connection Source="{a}.{b}" Destination="{c}.{d}" Priority="1"/>\n'
-                )
-        f.write("      </DataConnections>\n")
-
-        f.write("      <AdapterConnections/>\n")
-        f.write("    </SubAppNetwork>\n")
-        f.write("  </Application>\n")
-        f.write(
-            '  <Device Key="7f297351-45e1-4fec-91c1-a76c4054bb9e" Name="Device1" Type="FBSRT_X64_LINUX" Src="devices/ipc_linux.png" Location="12 38.5" CPUCores="1" Group="StartDeviceGroup">\n'
+    w.write("      <AdapterConnections/>\n")
+    w.write("    </SubAppNetwork>\n")
+    w.write("  </Application>\n")
+    w.write(
+        '  <Device Key="7f297351-45e1-4fec-91c1-a76c4054bb9e" Name="Device1" Type="FBSRT_X64_LINUX" Src="devices/ipc_linux.png" Location="12 38.5" CPUCores="1" Group="StartDeviceGroup">\n'
+    )
+    w.write('    <Parameter Name="Address"  Value="127.0.0.1"/>\n')
+    w.write('    <Parameter Name="MGTPort"  Value="8081"/>\n')
+    w.write(
+        '    <Resource Key="3460ec59-57ad-4690-a2d5-d15b4ec4fc4d" Name="RES3" Type="EMB_RES" Port="1">\n'
+    )
+    for n, i in enumerate(id_total):
+        w.write(
+            f'      <FB Key="{-n-1}" Name="app.{my_id_name[i]}" Namespace="demo" Type="{id_conf[i]["name"]}" x="{50*n}" y="0" />\n'
         )
-        f.write('    <Parameter Name="Address"  Value="127.0.0.1"/>\n')
-        f.write('    <Parameter Name="MGTPort"  Value="8081"/>\n')
-        f.write(
-            '    <Resource Key="3460ec59-57ad-4690-a2d5-d15b4ec4fc4d" Name="RES3" Type="EMB_RES" Port="1">\n'
-        )
-        for i in range(len(id_total)):
-            # <FB Key="-1" Name="conveyor1" Namespace="demo" Type="straightConveyor" x="50"  y="0"   />
-            f.write(
-                f'      <FB Key="{-i-1}" Name="app.{my_id_name[id_total[i]]}" Namespace="demo" Type="{id_name[id_total[i]]}" x="{50*i}" y="0" />\n'
-            )
 
-        for i in data["connections"]:
-            # <Connection Source="conveyor1.Running" Destination="三线.Start1" Priority="1"/>
-            if i["start"]["type"] == "signal_output":
-                a = my_id_name[i["start"]["blockId"]]
-                b = id_signal_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
-                c = my_id_name[i["end"]["blockId"]]
-                d = id_signal_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
-                f.write(
-                    f'      <Connection Source="app.{a}.{b}" Destination="app.{c}.{d}" Priority="1"/>\n'
-                )
-            elif i["start"]["type"] == "var_output":
-                a = my_id_name[i["start"]["blockId"]]
-                b = id_var_output[i["start"]["blockId"]][i["start"]["index"]]["name"]
-                c = my_id_name[i["end"]["blockId"]]
-                d = id_var_input[i["end"]["blockId"]][i["end"]["index"]]["name"]
-                f.write(
-                    f'      <Connection Source="app.{a}.{b}" Destination="app.{c}.{d}" Priority="1"/>\n'
-                )
-
-        f.write("      <DataTable/>\n")
-        f.write("    </Resource>\n")
-        f.write("  </Device>\n")
-
-        f.write("  <DataTable/>\n")
-        f.write(
-            '  <DeployGroup Key="StartDeviceGroup" IsGroup="true" Category="deviceGroup" Size="2100 700"/>\n'
+    for kind, source, destination in connections:
+        w.write(
+            f'      <Connection Source="app.{source}" Destination="app.{destination}" Priority="1"/>\n'
         )
-        f.write("</System>\n")
+
+    w.write("      <DataTable/>\n")
+    w.write("    </Resource>\n")
+    w.write("  </Device>\n")
+
+    w.write("  <DataTable/>\n")
+    w.write(
+        '  <DeployGroup Key="StartDeviceGroup" IsGroup="true" Category="deviceGroup" Size="2100 700"/>\n'
+    )
+    w.write("</System>\n")
+    w.flush()
+
+
+def process_sys(data, output_path, manifest: Manifest = None):
+    """
+    生成系统文件，返回写入的文件路径
+    data可以是JSON文本、字典或已解析的Workspace；传入manifest且输入未变时跳过，返回None
+    """
+    workspace = Workspace.parse(data)
+    if manifest is not None:
+        input_hash = content_hash(sys_inputs(workspace))
+        if manifest.is_current(SYS_FILE, input_hash):
+            return None
+    output_path = Path(output_path) / SYS_FILE
+    with atomic_open(output_path) as f:
+        write_sys(workspace, f)
+
+    if manifest is not None:
+        manifest.record(SYS_FILE, input_hash)
+    return output_path
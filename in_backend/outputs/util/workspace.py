@@ -0,0 +1,42 @@
+import json
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass
+class Workspace:
+    """
+    解析后的工作区配置，转换的各阶段共用同一份，不重复解析
+    各元素保持前端提交的字典结构
+    """
+
+    block_categories: List[Dict]
+    blocks: List[Dict]
+    connections: List[Dict]
+
+    FIELDS = {
+        "block_categories": "blockCategories",
+        "blocks": "blocks",
+        "connections": "connections",
+    }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Workspace":
+        if not isinstance(data, dict):
+            raise ValueError("工作区配置必须是JSON对象")
+        values = {}
+        for attr, key in cls.FIELDS.items():
+            value = data.get(key)
+            if not isinstance(value, list):
+                raise ValueError(f"工作区配置缺少字段或类型错误: {key}")
+            values[attr] = value
+        return cls(**values)
+
+    @classmethod
+    def parse(cls, data) -> "Workspace":
+        """由JSON文本（str/bytes/bytearray）、字典或Workspace得到Workspace"""
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, (str, bytes, bytearray)):
+            data = json.loads(data)
+        return cls.from_dict(data)
@@ -0,0 +1,77 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+
+# XML 1.0不允许的字符，原先的minidom解析遇到这些字符会报错
+_INVALID_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+def _escape(text: str) -> str:
+    # 与minidom的转义规则一致（文本和属性相同）
+    if _INVALID_CHARS.search(text):
+        raise ValueError(f"XML中包含非法字符: {text!r}")
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _escape_text(text: str) -> str:
+    # 文本中的换行经过XML解析后统一为\n（属性中的换行由ElementTree转成字符引用，保持原样）
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return _escape(text)
+
+
+def _write_element(write, elem: ET.Element, indent: str, addindent: str, newl: str):
+    write(indent + "<" + elem.tag)
+    for name, value in elem.attrib.items():
+        write(f' {name}="{_escape(value)}"')
+
+    # 子节点顺序与解析后的DOM一致：text、子元素及其tail
+    nodes = []
+    if elem.text:
+        nodes.append(elem.text)
+    for child in elem:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+
+    if not nodes:
+        write("/>" + newl)
+        return
+    write(">")
+    if len(nodes) == 1 and isinstance(nodes[0], str):
+        write(_escape_text(nodes[0]))
+    else:
+        write(newl)
+        child_indent = indent + addindent
+        for node in nodes:
+            if isinstance(node, str):
+                write(_escape_text(child_indent + node + newl))
+            else:
+                _write_element(write, node, child_indent, addindent, newl)
+        write(indent)
+    write(f"</{elem.tag}>{newl}")
+
+
+def write_pretty_xml(elem: ET.Element, f, indent: str = "  ", newl: str = "\n"):
+    """
+    将ElementTree元素一次性写入文件对象，带XML声明和缩进
+    输出与ET.tostring -> minidom.parseString -> toprettyxml(encoding="UTF-8")完全一致，
+    但不生成中间的字节串和DOM
+    """
+    f.write('<?xml version="1.0" encoding="UTF-8"?>' + newl)
+    _write_element(f.write, elem, "", indent, newl)
+
+
+def to_pretty_xml(elem: ET.Element, indent: str = "  ", newl: str = "\n") -> str:
+    """返回格式化后的XML字符串"""
+    buffer = io.StringIO()
+    write_pretty_xml(elem, buffer, indent, newl)
+    return buffer.getvalue()
@@ -1,4 +1,13 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from inputs.inputs import get_job_stats
+from inputs.util.LLM_interface import (
+    LLM_get_breaker_stats,
+    LLM_get_cache_stats,
+    LLM_get_rate_limit_stats,
+    LLM_get_routing_stats,
+)
+from inputs.util.metrics import metrics
 
 status_router = APIRouter(prefix="/status", tags=["API状态相关接口"])
 
@@ -8,4 +17,59 @@ async def check():
     """
     检查API状态
     """
-    return {"status": "ok", "message": "API is running smoothly."}
+    return {
+        "status": "ok",
+        "message": "API is running smoothly.",
+        "llm_breakers": LLM_get_breaker_stats(),
+    }
+
+
+@status_router.get("/llm_cache")
+async def llm_cache_stats():
+    """
+    获取LLM响应缓存的命中统计
+    """
+    return {"status": "ok", "llm_cache": await LLM_get_cache_stats()}
+
+
+@status_router.get("/llm_breakers")
+async def llm_breaker_stats():
+    """
+    获取各模型熔断器的状态
+    """
+    return {"status": "ok", "llm_breakers": LLM_get_breaker_stats()}
+
+
+@status_router.get("/llm_routing")
+async def llm_routing_stats():
+    """
+    获取多模型路由的延迟分布和对冲/故障转移计数
+    """
+    return {"status": "ok", "llm_routing": LLM_get_routing_stats()}
+
+
+@status_router.get("/llm_rate_limits")
+async def llm_rate_limit_stats():
+    """
+    获取各模型的速率限制和排队情况
+    """
+    return {"status": "ok", "llm_rate_limits": LLM_get_rate_limit_stats()}
+
+
+@status_router.get("/jobs")
+async def job_stats():
+    """
+    获取后台生成任务及任务存储的统计
+    """
+    return {"status": "ok", "jobs": get_job_stats()}
+
+
+@status_router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    以Prometheus文本格式导出指标：LLM请求耗时、重试、token用量、JSON解析结果、
+    SSE连接数、任务数和转换各阶段耗时
+    """
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )